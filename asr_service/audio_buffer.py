@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import logging
+import tempfile
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_BYTES = np.dtype(np.float32).itemsize
+
+
+class AudioBuffer:
+    """Growable float32 PCM arena addressed by absolute sample index.
+
+    Appends are amortized O(1): the backing array doubles when full and
+    already-discarded samples are dropped at the same time. Views returned by
+    ``view`` are zero-copy and stay valid after later appends or discards,
+    because samples are only ever written past the current end and growth
+    moves data into a fresh array rather than compacting in place.
+
+    With ``max_memory_samples`` set, the oldest retained audio beyond that
+    budget is spilled to a temp file and read back through ``np.memmap``.
+    """
+
+    def __init__(
+        self,
+        initial_capacity: int = 16000 * 30,
+        max_memory_samples: int | None = None,
+        spill_dir: str | None = None,
+    ):
+        self._initial_capacity = max(1, initial_capacity)
+        self._data = np.empty(self._initial_capacity, dtype=np.float32)
+        self._base = 0  # absolute sample index of _data[0]
+        self._lo = 0  # first in-memory sample, relative to _data
+        self._hi = 0  # one past the last written sample, relative to _data
+
+        self.max_memory_samples = max_memory_samples
+        self._spill_dir = spill_dir or None
+        self._spill = None  # temp file holding samples [_spill_base, memory start)
+        self._spill_base = 0  # absolute sample index of the first sample in the file
+        self._start = 0  # absolute index of the oldest retained sample
+
+    @property
+    def start_sample(self) -> int:
+        """Absolute index of the oldest retained sample."""
+        return self._start
+
+    @property
+    def memory_start(self) -> int:
+        """Absolute index of the oldest sample held in RAM."""
+        return self._base + self._lo
+
+    @property
+    def end_sample(self) -> int:
+        """Absolute index one past the newest sample."""
+        return self._base + self._hi
+
+    @property
+    def spilled_samples(self) -> int:
+        """Retained samples that live on disk rather than in RAM."""
+        return self.memory_start - self._start
+
+    def __len__(self) -> int:
+        return self.end_sample - self._start
+
+    def _reserve(self, n: int) -> np.ndarray:
+        """Make room for ``n`` samples and return the writable slice."""
+        if self._hi + n > len(self._data):
+            live = self._hi - self._lo
+            capacity = max(self._initial_capacity, 2 * (live + n))
+            data = np.empty(capacity, dtype=np.float32)
+            data[:live] = self._data[self._lo:self._hi]
+            self._data = data
+            self._base += self._lo
+            self._lo, self._hi = 0, live
+        out = self._data[self._hi:self._hi + n]
+        self._hi += n
+        return out
+
+    def append(self, audio: np.ndarray) -> None:
+        self._reserve(len(audio))[:] = audio
+        self._enforce_budget()
+
+    def append_pcm16(self, pcm_bytes: bytes) -> None:
+        """Append 16-bit little-endian PCM, converting straight into the arena."""
+        samples = np.frombuffer(pcm_bytes, dtype=np.int16)
+        np.multiply(samples, 1.0 / 32768.0, out=self._reserve(len(samples)), casting="unsafe")
+        self._enforce_budget()
+
+    def view(self, start: int, end: int | None = None) -> np.ndarray:
+        """Zero-copy view of in-memory samples [start, end) in absolute indices."""
+        end = self.end_sample if end is None else end
+        if start < self.memory_start or end > self.end_sample or start > end:
+            raise IndexError(
+                f"Samples [{start}, {end}) outside in-memory buffer "
+                f"[{self.memory_start}, {self.end_sample})"
+            )
+        return self._data[start - self._base:end - self._base]
+
+    def read(self, start: int, end: int | None = None) -> np.ndarray:
+        """Samples [start, end) from RAM or the spill file.
+
+        Zero-copy when the range is in memory; a read-only memmap when it is
+        entirely spilled; a stitched copy when it straddles the two.
+        """
+        end = self.end_sample if end is None else end
+        if start < self._start or end > self.end_sample or start > end:
+            raise IndexError(
+                f"Samples [{start}, {end}) outside buffer [{self._start}, {self.end_sample})"
+            )
+        if start >= self.memory_start:
+            return self.view(start, end)
+        spilled_end = min(end, self.memory_start)
+        self._spill.flush()
+        mapped = np.memmap(
+            self._spill.name,
+            dtype=np.float32,
+            mode="r",
+            offset=(start - self._spill_base) * SAMPLE_BYTES,
+            shape=(spilled_end - start,),
+        )
+        if end <= self.memory_start:
+            return mapped
+        return np.concatenate([mapped, self.view(self.memory_start, end)])
+
+    def discard_before(self, sample: int) -> None:
+        """Release samples before absolute index ``sample``."""
+        sample = max(self._start, min(sample, self.end_sample))
+        self._start = sample
+        self._lo = max(self._lo, sample - self._base)
+        if self._spill is not None and sample >= self.memory_start:
+            # Nothing on disk is needed any more. Closing unlinks the file;
+            # memmaps still held by in-flight decodes keep it readable.
+            self.close()
+
+    def _enforce_budget(self) -> None:
+        if self.max_memory_samples is None:
+            return
+        in_memory = self._hi - self._lo
+        if in_memory <= self.max_memory_samples:
+            return
+        # Spill down to three quarters of the budget so this runs rarely
+        n = in_memory - self.max_memory_samples * 3 // 4
+        if self._spill is None:
+            self._spill = tempfile.NamedTemporaryFile(
+                prefix="asr-spill-", suffix=".f32", dir=self._spill_dir
+            )
+            self._spill_base = self.memory_start
+            logger.info("Spilling session audio to %s", self._spill.name)
+        self._spill.seek(0, 2)
+        self._spill.write(self._data[self._lo:self._lo + n].tobytes())
+        self._lo += n
+
+    def close(self) -> None:
+        """Drop the spill file, if any."""
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
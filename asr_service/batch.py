@@ -0,0 +1,354 @@
+"""Offline transcription of whole files, outside the real-time stream path.
+
+Also runnable as a CLI for backfills without a running server:
+
+    python -m asr_service.batch samples/ --output-dir transcripts/
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import io
+import logging
+import sys
+import time
+from functools import partial
+from pathlib import Path
+from typing import AsyncIterator
+
+import numpy as np
+from faster_whisper import decode_audio
+
+from common.config import ASRSettings
+from common.schemas import (
+    BatchFile,
+    BatchRequest,
+    BatchSummaryMessage,
+    ErrorMessage,
+    SegmentStatus,
+    TranscriptCompleteMessage,
+    TranscriptSegment,
+)
+from asr_service.audio_buffer import AudioBuffer
+from asr_service.diarizer import SlidingWindowDiarizer, TurnIndex, diarize_window
+from asr_service.executor import InferenceExecutor
+from asr_service.speaker_store import SessionSpeakers, SpeakerStore
+from asr_service.transcriber import SAMPLE_RATE, BatchScheduler
+from asr_service.vad import VadChunker
+
+logger = logging.getLogger(__name__)
+
+AUDIO_EXTENSIONS = {".wav", ".flac", ".mp3", ".m4a", ".ogg", ".opus", ".webm"}
+
+
+def _check_root(path: Path, root: str) -> Path:
+    path = path.resolve()
+    if root and not path.is_relative_to(Path(root).resolve()):
+        raise ValueError(f"{path} is outside the batch root")
+    return path
+
+
+def _check_stream_id(stream_id: str) -> str:
+    """``stream_id`` names the output file, so it must not be able to leave ``output_dir``."""
+    if not stream_id or "/" in stream_id or "\\" in stream_id or ".." in stream_id:
+        raise ValueError(f"Invalid stream_id: {stream_id!r}")
+    return stream_id
+
+
+def _stream_id(item: BatchFile) -> str:
+    return item.stream_id or Path(item.path).stem
+
+
+def _audio_files(directory: Path) -> list[BatchFile]:
+    return [
+        BatchFile(path=str(p))
+        for p in sorted(directory.iterdir())
+        if p.is_file() and p.suffix.lower() in AUDIO_EXTENSIONS
+    ]
+
+
+def collect_files(request: BatchRequest, root: str = "") -> list[BatchFile]:
+    """Expand a request's files, directory and manifest into one list.
+
+    With ``root`` set, every path (output_dir included) must resolve inside
+    it. Stream ids, which name the output files, may not contain path
+    separators or "..". Raises ValueError.
+    """
+    files = list(request.files)
+    if request.directory:
+        directory = _check_root(Path(request.directory), root)
+        if not directory.is_dir():
+            raise ValueError(f"Not a directory: {request.directory}")
+        files += _audio_files(directory)
+    if request.manifest:
+        manifest = _check_root(Path(request.manifest), root)
+        for line in manifest.read_text().splitlines():
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            item = BatchFile.model_validate_json(line) if line.startswith("{") else BatchFile(path=line)
+            # Relative entries are relative to the manifest
+            item.path = str(manifest.parent / item.path)
+            files.append(item)
+    for item in files:
+        item.path = str(_check_root(Path(item.path), root))
+        _check_stream_id(_stream_id(item))
+    if request.output_dir:
+        _check_root(Path(request.output_dir), root)
+    if not files:
+        raise ValueError("No audio files to transcribe")
+    return files
+
+
+def split_at_pauses(audio: np.ndarray, settings: ASRSettings) -> list[tuple[int, int]]:
+    """(start, end) sample spans of speech, cut at pauses like the streaming chunker."""
+    buffer = AudioBuffer(initial_capacity=len(audio))
+    buffer.append(audio)
+    vad = VadChunker(
+        sample_rate=SAMPLE_RATE,
+        min_chunk_s=settings.vad_min_chunk_s,
+        max_chunk_s=settings.vad_max_chunk_s,
+        min_silence_ms=settings.vad_min_silence_ms,
+        threshold_db=settings.vad_threshold_db,
+    )
+    vad.feed(buffer)
+
+    spans = []
+    pos = 0
+    while True:
+        pos = vad.skip_silence(pos)
+        cut = vad.next_cut(pos)
+        if cut is None:
+            break
+        spans.append((pos, cut))
+        pos = cut
+        vad.consume(pos)
+    if vad.has_speech(pos):
+        end = vad.speech_end(pos)
+        # Keep the sub-frame tail if speech runs right up to it
+        spans.append((pos, len(audio) if end == vad.classified_until else end))
+    return spans
+
+
+class BatchTranscriber:
+    """Transcribes whole files by fanning VAD chunks out over the inference workers.
+
+    Chunks go through the shared ``BatchScheduler``, so they batch with each
+    other and with live streams. At most ``workers x batch size`` chunks are
+    in flight across all files, which keeps every worker busy without
+    flooding the queue live sessions also wait on. Each file is diarized in
+    one pass, concurrently with its decodes, and that pass takes a chunk
+    slot too. At most ``batch_max_files`` files are decoded into memory and
+    transcribed at once.
+    """
+
+    def __init__(
+        self,
+        executor: InferenceExecutor,
+        scheduler: BatchScheduler,
+        settings: ASRSettings,
+        speaker_store: SpeakerStore | None = None,
+    ):
+        self.executor = executor
+        self.scheduler = scheduler
+        self.settings = settings
+        self.speaker_store = speaker_store
+        self._slots = asyncio.Semaphore(executor.workers * max(1, scheduler.max_batch_size))
+        self._files = asyncio.Semaphore(max(1, settings.batch_max_files))
+
+    async def _decode(self, audio: np.ndarray, offset: float, language: str | None, tier: str | None):
+        async with self._slots:
+            return await self.scheduler.submit(audio, offset, language, tier)
+
+    async def _diarize(self, audio: np.ndarray, min_speakers: int | None, max_speakers: int | None):
+        async with self._slots:
+            return await self.executor.run(
+                partial(
+                    diarize_window,
+                    sample_rate=SAMPLE_RATE,
+                    hf_token=self.settings.hf_token,
+                    clustering_threshold=self.settings.diarize_clustering_threshold,
+                    min_speakers=min_speakers,
+                    max_speakers=max_speakers,
+                ),
+                audio,
+                0.0,
+            )
+
+    async def transcribe(
+        self,
+        audio: np.ndarray,
+        stream_id: str,
+        language: str | None = None,
+        model_tier: str | None = None,
+        diarize: bool = True,
+        min_speakers: int | None = None,
+        max_speakers: int | None = None,
+    ) -> TranscriptCompleteMessage:
+        # Whole-file numpy work; kept off the loop that serves live streams
+        spans = await asyncio.to_thread(split_at_pauses, audio, self.settings)
+        decodes = asyncio.gather(
+            *(self._decode(audio[s:e], s / SAMPLE_RATE, language, model_tier) for s, e in spans)
+        )
+        if diarize:
+            diarization = self._diarize(audio, min_speakers, max_speakers)
+            results, (turns, embeddings) = await asyncio.gather(decodes, diarization)
+        else:
+            results, turns, embeddings = await decodes, [], {}
+
+        chunks = [seg for result in results for seg in result]
+        speakers: list = [None] * len(chunks)
+        speaker_map: dict[str, str] = {}
+        if diarize:
+            speakers = TurnIndex(turns).assign(
+                [seg.start_time for seg in chunks],
+                [seg.end_time for seg in chunks],
+                SlidingWindowDiarizer.MIN_OVERLAP_SECONDS,
+            )
+            if self.speaker_store is not None and embeddings:
+                speaker_map = await SessionSpeakers(self.speaker_store).finish(
+                    embeddings,
+                    {label: 1 for label in embeddings},
+                    enroll_new=self.settings.batch_speaker_auto_enroll,
+                )
+
+        segments = [
+            TranscriptSegment(
+                status=SegmentStatus.final,
+                segment_id=i,
+                start_time=seg.start_time,
+                end_time=seg.end_time,
+                text=seg.text,
+                speaker=speaker,
+                confidence=seg.confidence,
+            )
+            for i, (seg, speaker) in enumerate(zip(chunks, speakers))
+        ]
+        return TranscriptCompleteMessage(stream_id=stream_id, segments=segments, speaker_map=speaker_map)
+
+    async def transcribe_bytes(self, data: bytes, stream_id: str, **kwargs) -> TranscriptCompleteMessage:
+        """Transcribe an encoded audio file held in memory (any format ffmpeg/PyAV reads)."""
+        async with self._files:
+            audio = await asyncio.to_thread(decode_audio, io.BytesIO(data), sampling_rate=SAMPLE_RATE)
+            return await self.transcribe(audio, stream_id, **kwargs)
+
+    async def _transcribe_item(self, item: BatchFile, request: BatchRequest) -> tuple[str, float]:
+        stream_id = _check_stream_id(_stream_id(item))
+        # Whole-file float32 audio is large; only a few files hold it at once
+        async with self._files:
+            audio = await asyncio.to_thread(decode_audio, item.path, sampling_rate=SAMPLE_RATE)
+            started = time.monotonic()
+            message = await self.transcribe(
+                audio,
+                stream_id,
+                language=item.language or request.language,
+                model_tier=request.model_tier,
+                diarize=request.diarize,
+                min_speakers=item.min_speakers,
+                max_speakers=item.max_speakers,
+            )
+            audio_s = len(audio) / SAMPLE_RATE
+        line = message.model_dump_json()
+        if request.output_dir:
+            out = _check_root(Path(request.output_dir) / f"{stream_id}.json", self.settings.batch_root)
+            out.parent.mkdir(parents=True, exist_ok=True)
+            out.write_text(line)
+        logger.info(
+            "Batch file %s: %.1fs audio in %.1fs, %d segments",
+            stream_id, audio_s, time.monotonic() - started, len(message.segments),
+        )
+        return line, audio_s
+
+    async def run(self, files: list[BatchFile], request: BatchRequest) -> AsyncIterator[str]:
+        """Transcribe ``files`` and yield one NDJSON line per file, then a summary.
+
+        Files run concurrently (at most ``batch_max_files`` at once) and are
+        yielded as they finish. A file that fails yields an error line.
+        """
+        started = time.monotonic()
+        audio_s = 0.0
+        failed = 0
+
+        async def guarded(item: BatchFile) -> tuple[str, float]:
+            try:
+                return await self._transcribe_item(item, request)
+            except Exception as exc:
+                logger.exception("Batch file failed: %s", item.path)
+                return ErrorMessage(stream_id=_stream_id(item), detail=str(exc)).model_dump_json(), -1.0
+
+        tasks = [asyncio.create_task(guarded(item)) for item in files]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                line, seconds = await next_done
+                if seconds < 0:
+                    failed += 1
+                else:
+                    audio_s += seconds
+                yield line + "\n"
+        finally:
+            # Closed early (the client went away): stop the files still running
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        wall_s = time.monotonic() - started
+        summary = BatchSummaryMessage(
+            files=len(files),
+            failed=failed,
+            audio_s=round(audio_s, 2),
+            wall_s=round(wall_s, 2),
+            audio_hours_per_wall_hour=round(audio_s / wall_s, 2) if wall_s > 0 else 0.0,
+        )
+        logger.info("Batch done: %s", summary.model_dump())
+        yield summary.model_dump_json() + "\n"
+
+
+def main(argv: list[str] | None = None) -> None:
+    from asr_service.executor import get_executor
+    from asr_service.model_registry import get_registry
+    from asr_service.speaker_store import get_speaker_store
+
+    parser = argparse.ArgumentParser(description="Transcribe audio files offline.")
+    parser.add_argument("paths", nargs="*", help="audio files or directories")
+    parser.add_argument("--manifest", help="file with one path or BatchFile JSON per line")
+    parser.add_argument("--output-dir", help="write <stream_id>.json per file here")
+    parser.add_argument("--language")
+    parser.add_argument("--model-tier")
+    parser.add_argument("--no-diarize", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    settings = ASRSettings()
+    files: list[BatchFile] = []
+    for path in map(Path, args.paths):
+        files += _audio_files(path) if path.is_dir() else [BatchFile(path=str(path))]
+    request = BatchRequest(
+        files=files,
+        manifest=args.manifest,
+        language=args.language,
+        model_tier=args.model_tier,
+        diarize=not args.no_diarize,
+        output_dir=args.output_dir,
+    )
+
+    async def run() -> None:
+        executor = get_executor(settings)
+        scheduler = BatchScheduler(
+            executor,
+            max_batch_size=settings.batch_max_size,
+            max_wait_ms=settings.batch_max_wait_ms,
+            registry=get_registry(settings),
+        )
+        batch = BatchTranscriber(executor, scheduler, settings, get_speaker_store(settings))
+        try:
+            async for line in batch.run(collect_files(request), request):
+                sys.stdout.write(line)
+        finally:
+            executor.shutdown()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
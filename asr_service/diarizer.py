@@ -1,10 +1,15 @@
 from __future__ import annotations
 
+import inspect
 import logging
-from typing import Optional
+import time
+from typing import Iterable, Optional, Sequence
 
 import numpy as np
 
+from asr_service.audio_buffer import AudioBuffer
+from asr_service.metrics import DIARIZATION_SECONDS
+
 logger = logging.getLogger(__name__)
 
 _pipeline = None
@@ -43,10 +48,199 @@ def get_pipeline(hf_token: str = "", clustering_threshold: float | None = None):
     return _pipeline
 
 
+# (start, end, speaker) with times in seconds from the start of the stream
+Turn = tuple[float, float, str]
+
+
+def diarize_window(
+    audio: np.ndarray,
+    offset: float,
+    sample_rate: int = 16000,
+    hf_token: str = "",
+    clustering_threshold: float | None = None,
+    min_speakers: int | None = None,
+    max_speakers: int | None = None,
+) -> tuple[list[Turn], dict[str, np.ndarray]]:
+    """Diarize one span of audio.
+
+    Returns turns in absolute time and one speaker embedding per local label.
+    Labels are only meaningful within this call. Kept as a plain function so
+    it can run on the inference executor, including a process pool.
+    """
+    pipeline = get_pipeline(hf_token, clustering_threshold)
+    if pipeline is None or len(audio) < sample_rate:
+        return [], {}
+
+    try:
+        import torch
+
+        waveform = torch.from_numpy(np.ascontiguousarray(audio)).unsqueeze(0)
+        audio_input = {"waveform": waveform, "sample_rate": sample_rate}
+
+        # Build kwargs for speaker count hints
+        kwargs: dict = {}
+        if min_speakers is not None:
+            kwargs["min_speakers"] = min_speakers
+        if max_speakers is not None:
+            kwargs["max_speakers"] = max_speakers
+        if "return_embeddings" in inspect.signature(pipeline.apply).parameters:
+            kwargs["return_embeddings"] = True
+
+        started = time.perf_counter()
+        output = pipeline(audio_input, **kwargs)
+        DIARIZATION_SECONDS.observe(time.perf_counter() - started)
+
+        embeddings = None
+        if isinstance(output, tuple):
+            output, embeddings = output
+        elif hasattr(output, "speaker_embeddings"):
+            embeddings = output.speaker_embeddings
+
+        turns: list[Turn] = []
+        if hasattr(output, "itertracks"):
+            annotation = output
+            for turn, _, speaker in output.itertracks(yield_label=True):
+                turns.append((round(offset + turn.start, 3), round(offset + turn.end, 3), speaker))
+        elif hasattr(output, "speaker_diarization"):
+            annotation = output.speaker_diarization
+            for turn, speaker in output.speaker_diarization:
+                turns.append((round(offset + turn.start, 3), round(offset + turn.end, 3), speaker))
+        else:
+            return [], {}
+
+        speaker_embeddings: dict[str, np.ndarray] = {}
+        if embeddings is not None:
+            for label, emb in zip(annotation.labels(), np.asarray(embeddings)):
+                if np.all(np.isfinite(emb)):
+                    speaker_embeddings[label] = emb.astype(np.float32)
+        return turns, speaker_embeddings
+    except Exception:
+        logger.exception("Diarization failed")
+        return [], {}
+
+
+class TurnIndex:
+    """Diarization turns held in start-sorted NumPy arrays.
+
+    Turns are bucketed by duration, doubling from ``BUCKET_SECONDS``. Within
+    a bucket the running maximum of the end times (its reach) stays within
+    one bucket width of the start, so the turns that can overlap a span are
+    found with two ``searchsorted`` calls per bucket, and one long turn
+    cannot widen the search for every span after it.
+    """
+
+    BUCKET_SECONDS = 8.0  # longest turn in the first duration bucket
+
+    def __init__(self, turns: Iterable[Turn] = ()):
+        turns = list(turns)
+        starts = np.array([t[0] for t in turns], dtype=np.float64)
+        order = np.argsort(starts, kind="stable")
+        self.starts = starts[order]
+        self.ends = np.array([t[1] for t in turns], dtype=np.float64)[order]
+        self.labels = np.array([t[2] for t in turns], dtype=object)[order]
+        # (turn indices, starts, reach) per duration bucket, each start-sorted
+        self._buckets: list[tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+        if len(turns):
+            durations = np.maximum(self.ends - self.starts, self.BUCKET_SECONDS)
+            bucket = np.floor(np.log2(durations / self.BUCKET_SECONDS)).astype(np.int64)
+            for b in np.unique(bucket):
+                members = np.flatnonzero(bucket == b)
+                self._buckets.append(
+                    (members, self.starts[members], np.maximum.accumulate(self.ends[members]))
+                )
+
+    @classmethod
+    def from_dict(cls, diarization: dict[tuple[float, float], str]) -> TurnIndex:
+        return cls((start, end, speaker) for (start, end), speaker in diarization.items())
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def to_dict(self) -> dict[tuple[float, float], str]:
+        return {
+            (float(start), float(end)): speaker
+            for start, end, speaker in zip(self.starts, self.ends, self.labels)
+        }
+
+    def best_overlap(self, starts: Sequence[float], ends: Sequence[float]) -> tuple[np.ndarray, np.ndarray]:
+        """For each span, the index of the turn overlapping it most and that overlap.
+
+        Ties go to the earliest turn. Spans without any overlap get index -1.
+        """
+        seg_starts = np.asarray(starts, dtype=np.float64)
+        seg_ends = np.asarray(ends, dtype=np.float64)
+        n = len(seg_starts)
+        best_turn = np.full(n, -1, dtype=np.int64)
+        best = np.zeros(n, dtype=np.float64)
+        if n == 0 or len(self) == 0:
+            return best_turn, best
+
+        pairs = [self._candidates(bucket, seg_starts, seg_ends) for bucket in self._buckets]
+        seg_idx = np.concatenate([p[0] for p in pairs])
+        turn_idx = np.concatenate([p[1] for p in pairs])
+        if len(seg_idx) == 0:
+            return best_turn, best
+        overlap = np.minimum(seg_ends[seg_idx], self.ends[turn_idx]) - np.maximum(
+            seg_starts[seg_idx], self.starts[turn_idx]
+        )
+
+        # Per span: largest overlap first, earliest turn on ties
+        order = np.lexsort((turn_idx, -overlap, seg_idx))
+        grouped = seg_idx[order]
+        heads = order[np.r_[0, np.flatnonzero(np.diff(grouped)) + 1]]
+        hit = overlap[heads] > 0
+        best_turn[seg_idx[heads[hit]]] = turn_idx[heads[hit]]
+        best[seg_idx[heads[hit]]] = overlap[heads[hit]]
+        return best_turn, best
+
+    @staticmethod
+    def _candidates(
+        bucket: tuple[np.ndarray, np.ndarray, np.ndarray], seg_starts: np.ndarray, seg_ends: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """(span, turn) index pairs that may overlap, among one bucket's turns."""
+        members, starts, reach = bucket
+        # Candidates for span i are bucket turns [lo[i], hi[i]): they start
+        # before the span ends and are not entirely behind it
+        hi = np.searchsorted(starts, seg_ends, side="left")
+        lo = np.searchsorted(reach, seg_starts, side="right")
+        counts = np.maximum(hi - lo, 0)
+        total = int(counts.sum())
+        seg_idx = np.repeat(np.arange(len(seg_starts)), counts)
+        first_pair = np.cumsum(counts) - counts
+        return seg_idx, members[np.arange(total) - np.repeat(first_pair - lo, counts)]
+
+    def assign(
+        self,
+        starts: Sequence[float],
+        ends: Sequence[float],
+        min_overlap: float = 0.0,
+    ) -> list[Optional[str]]:
+        """Label of the most-overlapping turn per span, or None.
+
+        Spans longer than ``min_overlap`` need at least that much overlap.
+        """
+        best_turn, best = self.best_overlap(starts, ends)
+        durations = np.asarray(ends, dtype=np.float64) - np.asarray(starts, dtype=np.float64)
+        rejected = (best < min_overlap) & (durations > min_overlap)
+        return [
+            None if turn < 0 or reject else self.labels[turn]
+            for turn, reject in zip(best_turn, rejected)
+        ]
+
+
 class SlidingWindowDiarizer:
-    """Maintains audio buffer for session-consistent diarization."""
+    """Incremental diarization over overlapping windows of the session audio.
+
+    Windows of ``window_seconds`` are cut every ``step_seconds`` as audio
+    arrives. Each window is diarized on its own and its local speaker labels
+    are matched to session-wide speakers by embedding cosine distance. Turns
+    are committed up to the middle of the overlap with the next window, and
+    audio before the next window start is released from the shared buffer.
+    """
 
     MIN_OVERLAP_SECONDS = 0.3  # Minimum overlap to assign a speaker
+    DEFAULT_MATCH_THRESHOLD = 0.7  # cosine distance, pyannote 3.1 clustering default
+    MERGE_GAP_SECONDS = 0.2  # same-speaker turns closer than this are joined
 
     def __init__(
         self,
@@ -56,86 +250,260 @@ class SlidingWindowDiarizer:
         clustering_threshold: float | None = None,
         min_speakers: int | None = None,
         max_speakers: int | None = None,
+        buffer: AudioBuffer | None = None,
+        step_seconds: float | None = None,
     ):
         self.window_seconds = window_seconds
+        self.step_seconds = min(step_seconds or window_seconds * 2 / 3, window_seconds)
         self.sample_rate = sample_rate
         self.hf_token = hf_token
         self.clustering_threshold = clustering_threshold
+        self.match_threshold = (
+            clustering_threshold if clustering_threshold is not None else self.DEFAULT_MATCH_THRESHOLD
+        )
         self.min_speakers = min_speakers
         self.max_speakers = max_speakers
-        self._buffer = np.array([], dtype=np.float32)
-        self._offset = 0.0  # start time of the buffer
+        self._buffer = buffer if buffer is not None else AudioBuffer()
+        self._offset = 0.0  # start time of the next window; audio before it is released
+        self._committed_until = 0.0
+        self._turns: list[Turn] = []
+        self._centroids: dict[str, np.ndarray] = {}  # unit-norm sum of matched embeddings
+        self._counts: dict[str, int] = {}
+        self._speaker_count = 0
 
     @property
     def buffer_duration(self) -> float:
         return len(self._buffer) / self.sample_rate
 
+    @property
+    def retain_from(self) -> int:
+        """Absolute sample index of the oldest audio still needed."""
+        return int(round(self._offset * self.sample_rate))
+
+    @property
+    def window_samples(self) -> int:
+        return int(self.window_seconds * self.sample_rate)
+
+    @property
+    def speaker_embeddings(self) -> dict[str, np.ndarray]:
+        return dict(self._centroids)
+
+    @property
+    def speaker_counts(self) -> dict[str, int]:
+        """Embeddings folded into each speaker's centroid so far."""
+        return dict(self._counts)
+
     def add_audio(self, audio: np.ndarray) -> None:
-        self._buffer = np.concatenate([self._buffer, audio])
+        """Append audio when the diarizer owns its buffer (not shared with a session)."""
+        self._buffer.append(audio)
 
-    def diarize(self) -> dict[tuple[float, float], str]:
-        """Run diarization on the current buffer. Returns {(start, end): speaker_label}."""
-        pipeline = get_pipeline(self.hf_token, self.clustering_threshold)
-        if pipeline is None or len(self._buffer) < self.sample_rate:
-            return {}
+    def window_kwargs(self, final: bool = False) -> dict:
+        """Pipeline arguments for ``diarize_window``.
 
-        try:
-            import torch
-
-            waveform = torch.from_numpy(self._buffer).unsqueeze(0)
-            audio_input = {"waveform": waveform, "sample_rate": self.sample_rate}
-
-            # Build kwargs for speaker count hints
-            kwargs: dict = {}
-            if self.min_speakers is not None:
-                kwargs["min_speakers"] = self.min_speakers
-            if self.max_speakers is not None:
-                kwargs["max_speakers"] = self.max_speakers
-
-            if kwargs:
-                logger.info("Diarization speaker hints: %s", kwargs)
-
-            output = pipeline(audio_input, **kwargs)
-
-            result: dict[tuple[float, float], str] = {}
-            if hasattr(output, "itertracks"):
-                for turn, _, speaker in output.itertracks(yield_label=True):
-                    abs_start = round(self._offset + turn.start, 3)
-                    abs_end = round(self._offset + turn.end, 3)
-                    result[(abs_start, abs_end)] = speaker
-            elif hasattr(output, "speaker_diarization"):
-                for turn, speaker in output.speaker_diarization:
-                    abs_start = round(self._offset + turn.start, 3)
-                    abs_end = round(self._offset + turn.end, 3)
-                    result[(abs_start, abs_end)] = speaker
-            return result
-        except Exception:
-            logger.exception("Diarization failed")
-            return {}
+        ``min_speakers`` only holds for the stream as a whole, so it is only
+        passed when the final window is also the first one.
+        """
+        kwargs = {
+            "sample_rate": self.sample_rate,
+            "hf_token": self.hf_token,
+            "clustering_threshold": self.clustering_threshold,
+            "max_speakers": self.max_speakers,
+        }
+        if final and not self._turns and self._committed_until == 0.0:
+            kwargs["min_speakers"] = self.min_speakers
+        return kwargs
 
-    def assign_speaker(self, start: float, end: float, diarization: dict[tuple[float, float], str]) -> Optional[str]:
-        """Find the best matching speaker for a transcript segment.
+    def has_window(self) -> bool:
+        return self._buffer.end_sample - self.retain_from >= self.window_samples
 
-        Uses overlap-weighted matching with a minimum overlap threshold
-        to avoid spurious assignments at segment boundaries.
+    def next_window(self) -> tuple[np.ndarray, float]:
+        """The next full window and its start time.
+
+        Zero-copy while the window is in memory; read back through a memmap
+        when the session had to spill it to disk.
         """
-        if not diarization:
+        start = self.retain_from
+        return self._buffer.read(start, start + self.window_samples), self._offset
+
+    def final_window(self) -> tuple[np.ndarray, float] | None:
+        """The trailing audio not yet committed, or None if there is none."""
+        end = self._buffer.end_sample
+        if end / self.sample_rate <= self._committed_until:
             return None
+        start = max(self.retain_from, end - self.window_samples)
+        return self._buffer.read(start, end), start / self.sample_rate
 
-        seg_duration = end - start
-        best_speaker = None
-        best_overlap = 0.0
+    def merge_window(
+        self,
+        turns: list[Turn],
+        embeddings: dict[str, np.ndarray],
+        offset: float,
+        final: bool = False,
+    ) -> None:
+        """Fold one diarized window into the session-wide turns.
 
-        for (d_start, d_end), speaker in diarization.items():
-            overlap_start = max(start, d_start)
-            overlap_end = min(end, d_end)
-            overlap = max(0.0, overlap_end - overlap_start)
-            if overlap > best_overlap:
-                best_overlap = overlap
-                best_speaker = speaker
+        ``offset`` is the window start that was passed to ``diarize_window``.
+        """
+        window_end = offset + self.window_seconds
+        if final:
+            cut = float("inf")
+        else:
+            overlap = self.window_seconds - self.step_seconds
+            cut = window_end - overlap / 2
 
-        # Require minimum overlap to avoid wrong assignments at boundaries
-        if best_overlap < self.MIN_OVERLAP_SECONDS and seg_duration > self.MIN_OVERLAP_SECONDS:
-            return None
+        mapping = self._match_speakers(turns, embeddings)
+        for start, end, label in turns:
+            start = max(start, self._committed_until)
+            end = min(end, cut)
+            if end > start:
+                self._turns.append((round(start, 3), round(end, 3), mapping[label]))
+
+        if final:
+            if turns:
+                self._committed_until = max(self._committed_until, max(end for _, end, _ in turns))
+        else:
+            self._committed_until = max(self._committed_until, cut)
+            self._offset = offset + self.step_seconds
+
+    def _match_speakers(self, turns: list[Turn], embeddings: dict[str, np.ndarray]) -> dict[str, str]:
+        """Map window-local labels to session speakers, one-to-one, nearest first."""
+        labels = sorted({label for _, _, label in turns})
+        mapping: dict[str, str] = {}
+
+        known = list(self._centroids)
+        candidates = []
+        for label in labels:
+            emb = embeddings.get(label)
+            if emb is None or not known:
+                continue
+            emb = emb / (np.linalg.norm(emb) or 1.0)
+            for speaker in known:
+                distance = 1.0 - float(np.dot(emb, self._centroids[speaker]))
+                if distance <= self.match_threshold:
+                    candidates.append((distance, label, speaker))
+
+        taken: set[str] = set()
+        for _, label, speaker in sorted(candidates):
+            if label in mapping or speaker in taken:
+                continue
+            mapping[label] = speaker
+            taken.add(speaker)
+
+        # Labels without a usable embedding follow whoever they overlap in committed turns
+        for label in labels:
+            if label in mapping or label in embeddings:
+                continue
+            speaker = self._overlapping_speaker(turns, label, taken)
+            if speaker is not None:
+                mapping[label] = speaker
+                taken.add(speaker)
+
+        for label in labels:
+            if label not in mapping:
+                mapping[label] = f"SPEAKER_{self._speaker_count:02d}"
+                self._speaker_count += 1
+            if label in embeddings:
+                self._update_centroid(mapping[label], embeddings[label])
+        return mapping
 
-        return best_speaker
+    def _overlapping_speaker(self, turns: list[Turn], label: str, exclude: set[str]) -> Optional[str]:
+        overlap: dict[str, float] = {}
+        for start, end, local in turns:
+            if local != label:
+                continue
+            for c_start, c_end, speaker in self._turns:
+                if speaker in exclude:
+                    continue
+                amount = min(end, c_end) - max(start, c_start)
+                if amount > 0:
+                    overlap[speaker] = overlap.get(speaker, 0.0) + amount
+        return max(overlap, key=overlap.get) if overlap else None
+
+    def _update_centroid(self, speaker: str, embedding: np.ndarray) -> None:
+        emb = embedding / (np.linalg.norm(embedding) or 1.0)
+        count = self._counts.get(speaker, 0)
+        centroid = self._centroids.get(speaker)
+        total = emb if centroid is None else centroid * count + emb
+        self._centroids[speaker] = total / (np.linalg.norm(total) or 1.0)
+        self._counts[speaker] = count + 1
+
+    def reconcile(self) -> TurnIndex:
+        """Final pass once the stream has ended.
+
+        Merges speakers whose centroids converged closer than the match
+        threshold, joins adjacent turns of the same speaker and returns them
+        as a ``TurnIndex``.
+        """
+        rename = self._merge_close_speakers()
+        turns = sorted((start, end, rename.get(speaker, speaker)) for start, end, speaker in self._turns)
+
+        merged: list[Turn] = []
+        for start, end, speaker in turns:
+            if merged and merged[-1][2] == speaker and start - merged[-1][1] <= self.MERGE_GAP_SECONDS:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end), speaker)
+            else:
+                merged.append((start, end, speaker))
+        self._turns = merged
+        return TurnIndex(merged)
+
+    def _merge_close_speakers(self) -> dict[str, str]:
+        rename: dict[str, str] = {}
+        speakers = sorted(self._centroids)
+        for i, a in enumerate(speakers):
+            if a in rename:
+                continue
+            for b in speakers[i + 1:]:
+                if b in rename:
+                    continue
+                if 1.0 - float(np.dot(self._centroids[a], self._centroids[b])) <= self.match_threshold:
+                    rename[b] = a
+                    count_a, count_b = self._counts[a], self._counts[b]
+                    total = self._centroids[a] * count_a + self._centroids[b] * count_b
+                    self._centroids[a] = total / (np.linalg.norm(total) or 1.0)
+                    self._counts[a] = count_a + count_b
+        for speaker in rename:
+            self._centroids.pop(speaker, None)
+            self._counts.pop(speaker, None)
+        return rename
+
+    def diarize(self) -> TurnIndex:
+        """Diarize all buffered audio in one go.
+
+        Runs inline; the streaming path drives ``next_window``/``merge_window``
+        through the inference executor instead.
+        """
+        while self.has_window():
+            audio, offset = self.next_window()
+            turns, embeddings = diarize_window(audio, offset, **self.window_kwargs())
+            self.merge_window(turns, embeddings, offset)
+        window = self.final_window()
+        if window is not None:
+            audio, offset = window
+            turns, embeddings = diarize_window(audio, offset, **self.window_kwargs(final=True))
+            self.merge_window(turns, embeddings, offset, final=True)
+        return self.reconcile()
+
+    def assign_speaker(
+        self,
+        start: float,
+        end: float,
+        diarization: TurnIndex | dict[tuple[float, float], str],
+    ) -> Optional[str]:
+        """Find the best matching speaker for a transcript segment.
+
+        Uses overlap-weighted matching with a minimum overlap threshold
+        to avoid spurious assignments at segment boundaries.
+        """
+        if isinstance(diarization, dict):
+            diarization = TurnIndex.from_dict(diarization)
+        return self.assign_speakers([start], [end], diarization)[0]
+
+    def assign_speakers(
+        self,
+        starts: Sequence[float],
+        ends: Sequence[float],
+        diarization: TurnIndex,
+    ) -> list[Optional[str]]:
+        """``assign_speaker`` for many segments in one vectorized pass."""
+        # Require minimum overlap to avoid wrong assignments at boundaries
+        return diarization.assign(starts, ends, self.MIN_OVERLAP_SECONDS)
@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable
+
+from common.config import ASRSettings
+from asr_service.metrics import EXECUTOR_WAIT
+
+logger = logging.getLogger(__name__)
+
+_executor: InferenceExecutor | None = None
+
+
+class InferenceExecutor:
+    """Runs blocking model inference on a worker pool behind a bounded queue.
+
+    At most ``workers`` calls run at once; up to ``max_queue`` more may wait
+    for a worker. Callers beyond that block in ``run`` until a slot frees up,
+    which is what pushes back on the per-session receive loops.
+    """
+
+    def __init__(self, workers: int = 1, kind: str = "thread", max_queue: int = 32):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown executor kind: {kind}")
+        self.workers = max(1, workers)
+        self.kind = kind
+        self.max_queue = max_queue
+        self._pool: Executor | None = None
+        self._admission = asyncio.Semaphore(self.workers + max_queue)
+        self._worker_slots = asyncio.Semaphore(self.workers)
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._total_wait = 0.0
+        self._last_wait = 0.0
+        self._max_wait = 0.0
+
+    def _get_pool(self) -> Executor:
+        if self._pool is None:
+            if self.kind == "process":
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="inference"
+                )
+            logger.info("Inference executor started: %s x%d", self.kind, self.workers)
+        return self._pool
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run ``fn(*args)`` on the pool once a worker is free.
+
+        With the process pool, ``fn`` and its arguments must be picklable and
+        each worker process loads its own copy of the models.
+        """
+        async with self._admission:
+            submitted = time.monotonic()
+            self._queued += 1
+            try:
+                await self._worker_slots.acquire()
+            finally:
+                self._queued -= 1
+            try:
+                wait = time.monotonic() - submitted
+                self._record_wait(wait)
+                self._running += 1
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._get_pool(), fn, *args)
+            finally:
+                self._running -= 1
+                self._completed += 1
+                self._worker_slots.release()
+
+    async def run_on_each_worker(self, fn: Callable[..., Any], *args: Any, timeout: float = 600.0) -> list[Any]:
+        """Run ``fn(*args)`` exactly once on every worker thread or process, for warmup.
+
+        Each call waits at a barrier after ``fn`` until all of them have run,
+        so no worker is free to pick up a second call while another has had
+        none. Raises ``threading.BrokenBarrierError`` if the workers do not
+        all get there within ``timeout`` seconds, e.g. while one is busy.
+        """
+        manager = multiprocessing.Manager() if self.kind == "process" else None
+        barrier = manager.Barrier(self.workers) if manager else threading.Barrier(self.workers)
+        try:
+            return list(await asyncio.gather(
+                *(self.run(_then_wait, barrier, timeout, fn, *args) for _ in range(self.workers))
+            ))
+        finally:
+            if manager is not None:
+                manager.shutdown()
+
+    def _record_wait(self, wait: float) -> None:
+        self._last_wait = wait
+        self._total_wait += wait
+        self._max_wait = max(self._max_wait, wait)
+        EXECUTOR_WAIT.observe(wait)
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of calls waiting for a worker."""
+        return self._queued
+
+    @property
+    def saturated(self) -> bool:
+        return self._queued >= self.max_queue
+
+    def stats(self) -> dict:
+        started = self._completed + self._running
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "running": self._running,
+            "queue_depth": self._queued,
+            "max_queue": self.max_queue,
+            "completed": self._completed,
+            "avg_wait_s": round(self._total_wait / started, 4) if started else 0.0,
+            "last_wait_s": round(self._last_wait, 4),
+            "max_wait_s": round(self._max_wait, 4),
+        }
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+def _then_wait(barrier, timeout: float, fn: Callable[..., Any], *args: Any) -> Any:
+    try:
+        return fn(*args)
+    finally:
+        barrier.wait(timeout)
+
+
+def get_executor(settings: ASRSettings | None = None) -> InferenceExecutor:
+    global _executor
+    if _executor is None:
+        settings = settings or ASRSettings()
+        _executor = InferenceExecutor(
+            workers=settings.inference_workers,
+            kind=settings.inference_executor,
+            max_queue=settings.inference_queue_size,
+        )
+    return _executor
@@ -1,14 +1,20 @@
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
+import time
+from functools import partial
+from typing import AsyncIterator, Awaitable, Callable
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
 
 from common.config import ASRSettings
+from common.metrics import mount_metrics
 from common.schemas import (
+    BatchRequest,
     ClientMessageType,
-    SegmentMessage,
     SegmentStatus,
     ServerMessageType,
     TranscriptCompleteMessage,
@@ -16,23 +22,581 @@ from common.schemas import (
     ErrorMessage,
     StartMessage,
 )
+from common.wire import WIRE_FORMATS, BinaryWriter, FrameKind, JsonWriter, WireError, decode_frame, encode_credit, encode_frame
+from asr_service.batch import BatchTranscriber, collect_files
+from asr_service.diarizer import TurnIndex, diarize_window
+from asr_service.executor import get_executor
+from asr_service.metrics import CHUNK_QUEUE_WAIT, SEGMENT_LATENCY
+from asr_service.model_registry import get_registry
+from asr_service.models import Word
 from asr_service.session import StreamSession
-from asr_service.transcriber import transcribe_chunk, get_model
+from asr_service.speaker_store import get_speaker_store
+from asr_service.streaming import words_to_result
+from asr_service.transcriber import BatchScheduler, transcribe_words
+from asr_service.warmup import WarmupState, run_warmup
 
 logger = logging.getLogger(__name__)
 
+Writer = JsonWriter | BinaryWriter
+
 settings = ASRSettings()
 app = FastAPI(title="ASR Service")
+mount_metrics(app)
+executor = get_executor(settings)
+registry = get_registry(settings)
+scheduler = BatchScheduler(
+    executor,
+    max_batch_size=settings.batch_max_size,
+    max_wait_ms=settings.batch_max_wait_ms,
+    registry=registry,
+    degrade_queue_depth=settings.model_degrade_queue_depth,
+)
+speaker_store = get_speaker_store(settings)
+batch = BatchTranscriber(executor, scheduler, settings, speaker_store)
+sessions: dict[str, StreamSession] = {}
+warmup = WarmupState()
+_warmup_task: asyncio.Task | None = None
 
 
 @app.on_event("startup")
 async def startup():
-    get_model(settings)
+    # Warm up in the background so liveness answers while models load
+    global _warmup_task
+    _warmup_task = asyncio.create_task(run_warmup(warmup, executor, settings))
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    if _warmup_task is not None:
+        _warmup_task.cancel()
+    executor.shutdown()
+
+
+@app.get("/health/live")
+async def health_live():
+    return {"status": "ok"}
+
+
+@app.get("/health/ready")
+async def health_ready():
+    """200 once warmup has finished, 503 until then (or if it failed)."""
+    return JSONResponse(warmup.to_dict(), status_code=200 if warmup.ready else 503)
 
 
 @app.get("/health")
 async def health():
-    return {"status": "ok"}
+    return {
+        "status": "ok",
+        "ready": warmup.ready,
+        "sessions": len(sessions),
+        "audio_in_flight_s": round(sum(s.audio_in_flight_s for s in sessions.values()), 2),
+        "inference": executor.stats(),
+        "batching": scheduler.stats(),
+        "models": registry.stats(),
+        "wire_formats": WIRE_FORMATS,
+    }
+
+
+@app.post("/batch")
+async def batch_endpoint(req: BatchRequest):
+    """Transcribe files on this host; streams one NDJSON line per file, then a summary."""
+    if not settings.batch_root:
+        raise HTTPException(status_code=403, detail="Path-based batch transcription is disabled; set ASR_BATCH_ROOT")
+    try:
+        files = collect_files(req, settings.batch_root)
+        registry.resolve(req.model_tier)
+    except (ValueError, OSError) as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return StreamingResponse(batch.run(files, req), media_type="application/x-ndjson")
+
+
+@app.post("/batch/file", response_model=TranscriptCompleteMessage)
+async def batch_file_endpoint(
+    request: Request,
+    stream_id: str = "upload",
+    language: str | None = None,
+    model_tier: str | None = None,
+    diarize: bool = True,
+):
+    """Transcribe an audio file sent as the raw request body."""
+    try:
+        registry.resolve(model_tier)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    data = await _read_upload(request, int(settings.batch_max_upload_mb * 2**20))
+    if not data:
+        raise HTTPException(status_code=400, detail="Empty request body")
+    try:
+        return await batch.transcribe_bytes(
+            data, stream_id, language=language, model_tier=model_tier, diarize=diarize
+        )
+    except Exception as exc:
+        logger.exception("Batch upload failed")
+        raise HTTPException(status_code=422, detail=f"Could not transcribe upload: {exc}")
+
+
+async def _read_upload(request: Request, limit: int) -> bytes:
+    """The request body, refused with 413 as soon as it is known to exceed ``limit`` bytes."""
+    too_large = HTTPException(status_code=413, detail=f"Upload exceeds {limit} bytes")
+    declared = request.headers.get("content-length")
+    if declared is not None and declared.isdigit() and int(declared) > limit:
+        raise too_large
+    # Content-Length may be absent (chunked) or wrong, so count as it streams in
+    body = bytearray()
+    async for piece in request.stream():
+        body += piece
+        if len(body) > limit:
+            raise too_large
+    return bytes(body)
+
+
+async def _transcribe_worker(out: Writer, session: StreamSession, queue: asyncio.Queue) -> None:
+    """Decode queued chunks on the inference executor and send partial segments."""
+    while True:
+        item = await queue.get()
+        if item is None:
+            return
+        chunk, offset, queued_at = item
+        CHUNK_QUEUE_WAIT.observe(time.monotonic() - queued_at)
+        logger.debug("Transcribing chunk at offset=%.1fs", offset)
+        segments = await scheduler.submit(chunk, offset, session.language, session.model_tier)
+        session.decoded_time = offset + len(chunk) / session.sample_rate
+        logger.debug("Transcribed %d segments", len(segments))
+
+        for seg in segments:
+            ts = TranscriptSegment(
+                status=SegmentStatus.partial,
+                segment_id=session.next_segment_id(),
+                start_time=seg.start_time,
+                end_time=seg.end_time,
+                text=seg.text,
+                speaker=None,
+                confidence=seg.confidence,
+            )
+            session.all_partial_segments.append(ts)
+            await out.segment(ts)
+            # The chunk was queued as soon as its last audio arrived
+            SEGMENT_LATENCY.labels(ts.status.value).observe(time.monotonic() - queued_at)
+
+
+def _words_segment(words: list[Word], status: SegmentStatus, segment_id: int) -> TranscriptSegment:
+    result = words_to_result(words)
+    return TranscriptSegment(
+        status=status,
+        segment_id=segment_id,
+        start_time=result.start_time,
+        end_time=result.end_time,
+        text=result.text,
+        speaker=None,
+        confidence=result.confidence,
+    )
+
+
+async def _stream_worker(out: Writer, session: StreamSession, ticks: asyncio.Queue) -> None:
+    """Re-decode the trailing window on each tick and send stabilised segments.
+
+    Tentative words go out as a partial segment whose id is reused on every
+    update; once they are committed the same id is sent again as final.
+    """
+    streamer = session.streamer
+    open_id: int | None = None
+    while True:
+        final = await ticks.get() is None
+        while final or session.has_stream_window():
+            audio, offset = streamer.next_window()
+            received_at = session.audio_received_at
+            window_end = offset + len(audio) / session.sample_rate
+            words = []
+            if len(audio):
+                decode = partial(
+                    transcribe_words,
+                    language=session.language,
+                    initial_prompt=streamer.prompt,
+                    tier=scheduler.effective_tier(session.model_tier),
+                )
+                words = await executor.run(decode, audio, offset)
+            session.decoded_time = window_end
+            committed, tentative = streamer.merge_window(words, window_end, final=final)
+            session.trim()
+
+            updates = []
+            if committed:
+                segment_id = open_id if open_id is not None else session.next_segment_id()
+                ts = _words_segment(committed, SegmentStatus.final, segment_id)
+                session.all_partial_segments.append(ts)
+                updates.append(ts)
+                open_id = None
+            if tentative:
+                if open_id is None:
+                    open_id = session.next_segment_id()
+                updates.append(_words_segment(tentative, SegmentStatus.partial, open_id))
+            for ts in updates:
+                await out.segment(ts)
+                SEGMENT_LATENCY.labels(ts.status.value).observe(time.monotonic() - received_at)
+            if final:
+                return
+
+
+async def _diarize_worker(session: StreamSession, ticks: asyncio.Queue) -> None:
+    """Diarize each full window on the inference executor as audio arrives."""
+    diarizer = session.diarizer
+    while True:
+        if await ticks.get() is None:
+            return
+        while diarizer.has_window():
+            audio, offset = diarizer.next_window()
+            turns, embeddings = await executor.run(
+                partial(diarize_window, **diarizer.window_kwargs()), audio, offset
+            )
+            diarizer.merge_window(turns, embeddings, offset)
+            session.trim()
+            if session.speakers is not None:
+                session.speakers.update(diarizer.speaker_embeddings, diarizer.speaker_counts)
+
+
+async def _finish_diarization(session: StreamSession) -> TurnIndex:
+    """Diarize the trailing partial window and reconcile speakers across windows."""
+    diarizer = session.diarizer
+    window = diarizer.final_window()
+    if window is not None:
+        audio, offset = window
+        turns, embeddings = await executor.run(
+            partial(diarize_window, **diarizer.window_kwargs(final=True)), audio, offset
+        )
+        diarizer.merge_window(turns, embeddings, offset, final=True)
+    return diarizer.reconcile()
+
+
+async def _enqueue_chunk(queue: asyncio.Queue, worker: asyncio.Task, item) -> None:
+    """Queue a chunk for the session worker, blocking while the queue is full.
+
+    Raises if the worker dies instead of waiting on a queue nobody drains.
+    Also used for the diarization tick queue.
+    """
+    put = asyncio.ensure_future(queue.put(item))
+    done, _ = await asyncio.wait({put, worker}, return_when=asyncio.FIRST_COMPLETED)
+    if put not in done:
+        put.cancel()
+        worker.result()
+        raise RuntimeError("Transcription worker stopped")
+
+
+def _open_session(start: StartMessage) -> StreamSession:
+    """Create and register the session for a start message; raises ValueError on an unknown tier."""
+    model_tier = registry.resolve(start.model_tier)
+    min_speakers, max_speakers = start.min_speakers, start.max_speakers
+    if start.meeting_series and speaker_store is not None:
+        hint_min, hint_max = speaker_store.speaker_hints(start.meeting_series)
+        min_speakers = min_speakers if min_speakers is not None else hint_min
+        max_speakers = max_speakers if max_speakers is not None else hint_max
+    session = StreamSession(
+        stream_id=start.stream_id,
+        settings=settings,
+        language=start.language,
+        min_speakers=min_speakers,
+        max_speakers=max_speakers,
+        diarize=start.diarize,
+        speaker_store=speaker_store,
+        meeting_series=start.meeting_series,
+        model_tier=model_tier,
+    )
+    sessions[session.stream_id] = session
+    logger.info(
+        "ASR session started: %s (diarize=%s, tier=%s, wire=%s)",
+        start.stream_id, start.diarize, model_tier, start.wire,
+    )
+    return session
+
+
+def _close_session(session: StreamSession | None) -> None:
+    if session is not None:
+        session.close()
+        if sessions.get(session.stream_id) is session:
+            del sessions[session.stream_id]
+    logger.info("ASR session ended: %s", session.stream_id if session else "unknown")
+
+
+async def _run_stream(session: StreamSession, out: Writer, audio: AsyncIterator[bytes]) -> None:
+    """Transcribe a stream's audio as it arrives and send segments, then the complete transcript.
+
+    ``audio`` yields 16 kHz s16le PCM and ends with the stream (end message
+    or disconnect). It is only pulled once the previous piece has been
+    queued, so a session that falls behind stops reading.
+    """
+    diarize_enabled = session.diarize
+    if session.streamer is None:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=settings.max_pending_chunks)
+        worker = asyncio.create_task(_transcribe_worker(out, session, queue))
+    else:
+        # At most one tick waits: steps that arrive mid-decode fold into the next window
+        queue = asyncio.Queue(maxsize=1)
+        worker = asyncio.create_task(_stream_worker(out, session, queue))
+    ticks: asyncio.Queue = asyncio.Queue(maxsize=1)
+    diarize_task = (
+        asyncio.create_task(_diarize_worker(session, ticks)) if diarize_enabled else None
+    )
+
+    try:
+        async for pcm in audio:
+            session.add_audio(pcm)
+            logger.debug("Audio received: buffer=%d samples", session.pending_samples)
+
+            # Hand complete chunks and diarization windows to the workers
+            if session.streamer is None:
+                while session.has_chunk():
+                    await _enqueue_chunk(queue, worker, (*session.pop_chunk(), time.monotonic()))
+            elif session.has_stream_window() and queue.empty():
+                queue.put_nowait(True)
+            if diarize_task is not None and session.diarizer.has_window() and ticks.empty():
+                ticks.put_nowait(True)
+
+        await _enqueue_chunk(queue, worker, None)
+        await worker
+        if diarize_task is not None:
+            await _enqueue_chunk(ticks, diarize_task, None)
+            await diarize_task
+    finally:
+        for task in (worker, diarize_task):
+            if task is not None and not task.done():
+                task.cancel()
+
+    # Flush remaining audio and reconcile diarization across windows
+    remainder = session.flush()
+    if remainder:
+        chunk, offset = remainder
+        segments = await scheduler.submit(chunk, offset, session.language, session.model_tier)
+        for seg in segments:
+            ts = TranscriptSegment(
+                status=SegmentStatus.final,
+                segment_id=session.next_segment_id(),
+                start_time=seg.start_time,
+                end_time=seg.end_time,
+                text=seg.text,
+                speaker=None,
+                confidence=seg.confidence,
+            )
+            session.all_partial_segments.append(ts)
+
+    speaker_map: dict[str, str] = {}
+    if diarize_enabled:
+        logger.info("Finishing diarization for %s...", session.stream_id)
+        diarization = await _finish_diarization(session)
+        logger.info("Diarization complete: %d turns", len(diarization))
+
+        # Assign speakers to all segments in one pass
+        segments = session.all_partial_segments
+        speakers = session.diarizer.assign_speakers(
+            [seg.start_time for seg in segments],
+            [seg.end_time for seg in segments],
+            diarization,
+        )
+        all_segments = [
+            TranscriptSegment(
+                status=SegmentStatus.final,
+                segment_id=seg.segment_id,
+                start_time=seg.start_time,
+                end_time=seg.end_time,
+                text=seg.text,
+                speaker=speaker,
+                confidence=seg.confidence,
+            )
+            for seg, speaker in zip(segments, speakers)
+        ]
+        if session.speakers is not None:
+            speaker_map = await session.speakers.finish(
+                session.diarizer.speaker_embeddings,
+                session.diarizer.speaker_counts,
+                session.meeting_series,
+                enroll_new=settings.speaker_auto_enroll,
+            )
+    else:
+        # Skip diarization — return segments without speaker labels
+        logger.info("Skipping diarization for %s (diarize=False)", session.stream_id)
+        all_segments = [
+            TranscriptSegment(
+                status=SegmentStatus.final,
+                segment_id=seg.segment_id,
+                start_time=seg.start_time,
+                end_time=seg.end_time,
+                text=seg.text,
+                speaker=None,
+                confidence=seg.confidence,
+            )
+            for seg in session.all_partial_segments
+        ]
+
+    complete = TranscriptCompleteMessage(
+        stream_id=session.stream_id,
+        segments=all_segments,
+        speaker_map=speaker_map,
+    )
+    await out.message(complete)
+
+
+async def _websocket_audio(ws: WebSocket, binary: bool) -> AsyncIterator[bytes]:
+    """PCM from a one-stream socket, until the end message or a disconnect."""
+    while True:
+        message = await ws.receive()
+        if message.get("type") == "websocket.disconnect":
+            return
+        if "bytes" in message:
+            if not binary:
+                yield message["bytes"]
+                continue
+            frame = decode_frame(message["bytes"])
+            if frame.kind == FrameKind.end:
+                return
+            if frame.kind == FrameKind.audio:
+                yield frame.payload
+        elif "text" in message:
+            data = json.loads(message["text"])
+            if data.get("type") == ClientMessageType.end:
+                return
+
+
+async def _channel_audio(
+    inbox: asyncio.Queue, grant: Callable[[int], Awaitable[None]], window: int
+) -> AsyncIterator[bytes]:
+    """PCM from one mux channel, returning credit as the session takes each piece."""
+    returned = 0
+    while True:
+        frame = await inbox.get()
+        if frame.kind == FrameKind.end:
+            return
+        yield frame.payload
+        # Resumed only once the session has queued this piece; batch the credit
+        returned += len(frame.payload)
+        if returned >= window // 4:
+            await grant(returned)
+            returned = 0
+
+
+async def _mux_channel(
+    send: Callable[[bytes], Awaitable[None]],
+    grant: Callable[[int], Awaitable[None]],
+    channel: int,
+    start: StartMessage,
+    inbox: asyncio.Queue,
+    window: int,
+) -> None:
+    session: StreamSession | None = None
+    out = BinaryWriter(send, start.stream_id, channel)
+    try:
+        try:
+            session = _open_session(start)
+        except ValueError as exc:
+            await out.message(ErrorMessage(stream_id=start.stream_id, detail=str(exc)))
+            return
+        await grant(window)
+        await _run_stream(session, out, _channel_audio(inbox, grant, window))
+    except asyncio.CancelledError:
+        logger.info("Mux channel abandoned: %s", start.stream_id)
+        raise
+    except Exception as exc:
+        logger.exception("ASR stream error: %s", exc)
+        try:
+            await out.message(ErrorMessage(stream_id=start.stream_id, detail="Internal ASR error"))
+        except Exception:
+            pass
+    finally:
+        _close_session(session)
+        try:
+            await send(encode_frame(FrameKind.close, channel))
+        except Exception:
+            pass
+
+
+@app.websocket("/mux")
+async def mux_endpoint(ws: WebSocket):
+    """Many streams over one socket, one common.wire channel each.
+
+    The read loop never waits on a session: audio goes to per-channel
+    inboxes, bounded by the credit each channel was granted. A bad frame,
+    or audio beyond that credit, ends only the channel it was sent on,
+    with an error message.
+    """
+    await ws.accept()
+    window = int(settings.mux_window_s * 16000) * 2
+    inboxes: dict[int, asyncio.Queue] = {}
+    tasks: dict[int, asyncio.Task] = {}
+    stream_ids: dict[int, str] = {}
+    credit: dict[int, int] = {}
+    lock = asyncio.Lock()
+
+    async def send(data: bytes) -> None:
+        async with lock:
+            await ws.send_bytes(data)
+
+    async def grant(channel: int, nbytes: int) -> None:
+        credit[channel] += nbytes
+        await send(encode_credit(channel, nbytes))
+
+    def forget(channel: int, task: asyncio.Task) -> None:
+        if tasks.get(channel) is task:
+            del tasks[channel], inboxes[channel], stream_ids[channel], credit[channel]
+
+    async def reject(channel: int, detail: str) -> None:
+        logger.warning("Rejecting mux channel %d: %s", channel, detail)
+        error = ErrorMessage(stream_id=stream_ids.get(channel, ""), detail=detail)
+        await BinaryWriter(send, error.stream_id, channel).message(error)
+        if channel in tasks:
+            tasks[channel].cancel()  # its session sends the close
+        else:
+            await send(encode_frame(FrameKind.close, channel))
+
+    try:
+        while True:
+            message = await ws.receive()
+            if message.get("type") == "websocket.disconnect":
+                break
+            if "bytes" not in message:
+                continue
+            try:
+                frame = decode_frame(message["bytes"])
+            except WireError as exc:
+                if exc.channel is None:
+                    logger.warning("Skipping unreadable mux frame: %s", exc)
+                else:
+                    await reject(exc.channel, f"Bad frame: {exc}")
+                continue
+            channel = frame.channel
+            if frame.kind == FrameKind.start:
+                if channel in tasks:
+                    await reject(channel, f"Channel {channel} is already open")
+                    continue
+                try:
+                    start = StartMessage.model_validate_json(bytes(frame.payload))
+                except ValueError:
+                    await reject(channel, "Invalid start message")
+                    continue
+                # Every queued audio frame holds at least one byte of credit
+                inbox = inboxes[channel] = asyncio.Queue(maxsize=window + 1)
+                stream_ids[channel] = start.stream_id
+                credit[channel] = 0
+                task = tasks[channel] = asyncio.create_task(
+                    _mux_channel(send, partial(grant, channel), channel, start, inbox, window)
+                )
+                task.add_done_callback(partial(forget, channel))
+            elif frame.kind == FrameKind.close:
+                if channel in tasks:
+                    tasks[channel].cancel()
+            elif channel not in inboxes:
+                continue
+            elif frame.kind == FrameKind.audio and frame.payload:
+                size = len(frame.payload)
+                if size > credit[channel]:
+                    await reject(channel, f"Audio frame of {size} bytes exceeds credit of {credit[channel]}")
+                    continue
+                credit[channel] -= size
+                inboxes[channel].put_nowait(frame)
+            elif frame.kind == FrameKind.end:
+                try:
+                    inboxes[channel].put_nowait(frame)
+                except asyncio.QueueFull:
+                    await reject(channel, "Channel inbox is full")
+    finally:
+        for task in list(tasks.values()):
+            task.cancel()
 
 
 @app.websocket("/stream")
@@ -50,112 +614,17 @@ async def stream_endpoint(ws: WebSocket):
             return
 
         start = StartMessage(**msg)
-        diarize_enabled = start.diarize
-        session = StreamSession(
-            stream_id=start.stream_id,
-            settings=settings,
-            language=start.language,
-            min_speakers=start.min_speakers,
-            max_speakers=start.max_speakers,
+        try:
+            session = _open_session(start)
+        except ValueError as exc:
+            await ws.send_text(ErrorMessage(stream_id=start.stream_id, detail=str(exc)).model_dump_json())
+            await ws.close()
+            return
+        binary = start.wire == "binary"
+        out: Writer = (
+            BinaryWriter(ws.send_bytes, start.stream_id) if binary else JsonWriter(ws.send_text, start.stream_id)
         )
-        logger.info("ASR session started: %s (diarize=%s)", start.stream_id, diarize_enabled)
-
-        while True:
-            message = await ws.receive()
-            if message.get("type") == "websocket.disconnect":
-                break
-
-            if "bytes" in message:
-                session.add_audio(message["bytes"])
-                logger.info("Audio received: buffer=%d samples", len(session._audio_buffer))
-
-                # Process complete chunks (transcription only, diarization at end)
-                while session.has_chunk():
-                    chunk, offset = session.pop_chunk()
-                    logger.info("Transcribing chunk at offset=%.1fs", offset)
-                    segments = transcribe_chunk(chunk, offset, session.language)
-                    logger.info("Transcribed %d segments", len(segments))
-
-                    for seg in segments:
-                        ts = TranscriptSegment(
-                            status=SegmentStatus.partial,
-                            segment_id=session.next_segment_id(),
-                            start_time=seg.start_time,
-                            end_time=seg.end_time,
-                            text=seg.text,
-                            speaker=None,
-                            confidence=seg.confidence,
-                        )
-                        session.all_partial_segments.append(ts)
-                        await ws.send_text(
-                            SegmentMessage(stream_id=start.stream_id, segment=ts).model_dump_json()
-                        )
-
-            elif "text" in message:
-                data = json.loads(message["text"])
-                if data.get("type") == ClientMessageType.end:
-                    break
-
-        # Flush remaining audio and run diarization once on full buffer
-        if session:
-            remainder = session.flush()
-            if remainder:
-                chunk, offset = remainder
-                segments = transcribe_chunk(chunk, offset, session.language)
-                for seg in segments:
-                    ts = TranscriptSegment(
-                        status=SegmentStatus.final,
-                        segment_id=session.next_segment_id(),
-                        start_time=seg.start_time,
-                        end_time=seg.end_time,
-                        text=seg.text,
-                        speaker=None,
-                        confidence=seg.confidence,
-                    )
-                    session.all_partial_segments.append(ts)
-
-            if diarize_enabled:
-                # Run diarization once on the full audio buffer
-                logger.info("Running diarization for %s...", session.stream_id)
-                diarization = session.diarizer.diarize()
-                logger.info("Diarization complete: %d turns", len(diarization))
-
-                # Assign speakers to all segments
-                all_segments = []
-                for seg in session.all_partial_segments:
-                    speaker = session.diarizer.assign_speaker(
-                        seg.start_time, seg.end_time, diarization
-                    )
-                    all_segments.append(TranscriptSegment(
-                        status=SegmentStatus.final,
-                        segment_id=seg.segment_id,
-                        start_time=seg.start_time,
-                        end_time=seg.end_time,
-                        text=seg.text,
-                        speaker=speaker,
-                        confidence=seg.confidence,
-                    ))
-            else:
-                # Skip diarization — return segments without speaker labels
-                logger.info("Skipping diarization for %s (diarize=False)", session.stream_id)
-                all_segments = [
-                    TranscriptSegment(
-                        status=SegmentStatus.final,
-                        segment_id=seg.segment_id,
-                        start_time=seg.start_time,
-                        end_time=seg.end_time,
-                        text=seg.text,
-                        speaker=None,
-                        confidence=seg.confidence,
-                    )
-                    for seg in session.all_partial_segments
-                ]
-
-            complete = TranscriptCompleteMessage(
-                stream_id=session.stream_id,
-                segments=all_segments,
-            )
-            await ws.send_text(complete.model_dump_json())
+        await _run_stream(session, out, _websocket_audio(ws, binary))
 
     except WebSocketDisconnect:
         logger.info("ASR client disconnected: %s", session.stream_id if session else "unknown")
@@ -169,7 +638,7 @@ async def stream_endpoint(ws: WebSocket):
         except Exception:
             pass
     finally:
-        logger.info("ASR session ended: %s", session.stream_id if session else "unknown")
+        _close_session(session)
 
 
 if __name__ == "__main__":
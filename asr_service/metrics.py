@@ -0,0 +1,46 @@
+"""Prometheus metrics for the ASR service.
+
+Decode and diarization timings are observed where the work runs. With the
+process executor that is a worker process, whose samples ``/metrics``
+does not see; the thread executor (the default) reports them all.
+"""
+
+from __future__ import annotations
+
+from prometheus_client import Histogram
+
+from common.metrics import LATENCY_BUCKETS, RTF_BUCKETS
+
+CHUNK_QUEUE_WAIT = Histogram(
+    "asr_chunk_queue_wait_seconds",
+    "Time a complete chunk waits in its session queue before the worker takes it",
+    buckets=LATENCY_BUCKETS,
+)
+EXECUTOR_WAIT = Histogram(
+    "asr_executor_wait_seconds",
+    "Time an inference call waits for a free executor worker",
+    buckets=LATENCY_BUCKETS,
+)
+DECODE_SECONDS = Histogram(
+    "asr_decode_seconds",
+    "Whisper decode time per call (one chunk, window or batch)",
+    ["tier"],
+    buckets=LATENCY_BUCKETS,
+)
+REALTIME_FACTOR = Histogram(
+    "asr_realtime_factor",
+    "Whisper decode time divided by the duration of the audio decoded",
+    ["tier"],
+    buckets=RTF_BUCKETS,
+)
+DIARIZATION_SECONDS = Histogram(
+    "asr_diarization_seconds",
+    "Diarization pipeline time per window",
+    buckets=LATENCY_BUCKETS,
+)
+SEGMENT_LATENCY = Histogram(
+    "asr_segment_latency_seconds",
+    "Time from receiving the audio a segment was decoded from to sending the segment",
+    ["status"],
+    buckets=LATENCY_BUCKETS,
+)
@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator
+
+from faster_whisper import BatchedInferencePipeline, WhisperModel
+
+from common.config import ASRSettings
+from asr_service.metrics import DECODE_SECONDS, REALTIME_FACTOR
+
+logger = logging.getLogger(__name__)
+
+_registry: ModelRegistry | None = None
+
+# Approximate parameter counts (millions), for memory estimates
+_PARAMS_M = {
+    "tiny": 39,
+    "base": 74,
+    "small": 244,
+    "medium": 769,
+    "turbo": 809,  # checked before "large" for large-v3-turbo
+    "large": 1550,
+    "distil-large": 756,
+    "distil-medium": 394,
+    "distil-small": 166,
+}
+_BYTES_PER_PARAM = {"int8": 1, "int8_float16": 1, "int8_bfloat16": 1, "float32": 4}
+
+
+@dataclass(frozen=True)
+class ModelKey:
+    size: str
+    compute_type: str = "auto"
+    device: str = "auto"
+
+    @classmethod
+    def parse(cls, spec: str, device: str = "auto") -> ModelKey:
+        """"small:int8" or "large-v3:float16:cuda" -> ModelKey."""
+        parts = spec.split(":")
+        return cls(
+            size=parts[0],
+            compute_type=parts[1] if len(parts) > 1 else "auto",
+            device=parts[2] if len(parts) > 2 else device,
+        )
+
+    def estimated_mb(self) -> float:
+        name = self.size.split("/")[-1].removeprefix("faster-whisper-").removeprefix("faster-")
+        params = next(
+            (m for prefix, m in sorted(_PARAMS_M.items(), key=lambda kv: -len(kv[0])) if prefix in name),
+            _PARAMS_M["large"],
+        )
+        return params * _BYTES_PER_PARAM.get(self.compute_type, 2)
+
+
+@dataclass
+class _TierStats:
+    decodes: int = 0
+    audio_s: float = 0.0
+    compute_s: float = 0.0
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return 0.0
+
+
+class ModelRegistry:
+    """Whisper models by tier, loaded on demand and evicted LRU under a memory budget.
+
+    Tiers are ordered largest first; ``smaller`` gives the next one down for
+    load shedding. Memory is budgeted on a size x compute-type estimate,
+    since VRAM is not visible from the process. Evicting a model only drops
+    the registry's reference, so decodes still holding it finish normally.
+    Loads run outside the lock; concurrent callers for a model that is
+    already loading wait on that load instead of starting their own.
+    """
+
+    def __init__(
+        self,
+        tiers: dict[str, ModelKey],
+        default_tier: str | None = None,
+        memory_budget_mb: float = 0.0,
+    ):
+        if not tiers:
+            raise ValueError("At least one model tier is required")
+        self.tiers = dict(tiers)
+        self.default_tier = default_tier or next(iter(self.tiers))
+        if self.default_tier not in self.tiers:
+            raise ValueError(f"Unknown default model tier: {self.default_tier}")
+        self.memory_budget_mb = memory_budget_mb
+        self._models: OrderedDict[ModelKey, WhisperModel] = OrderedDict()
+        self._pipelines: dict[ModelKey, BatchedInferencePipeline] = {}
+        self._loading: dict[ModelKey, Future[WhisperModel]] = {}
+        self._rss_delta: dict[ModelKey, float] = {}
+        self._stats = {tier: _TierStats() for tier in self.tiers}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings: ASRSettings) -> ModelRegistry:
+        specs = settings.model_tiers or {
+            "default": f"{settings.model_size}:{settings.compute_type}:{settings.device}"
+        }
+        tiers = {name: ModelKey.parse(spec, settings.device) for name, spec in specs.items()}
+        return cls(tiers, settings.default_model_tier or None, settings.model_memory_budget_mb)
+
+    def resolve(self, tier: str | None) -> str:
+        """Tier name to use for a request; None means the default. Raises on unknown tiers."""
+        tier = tier or self.default_tier
+        if tier not in self.tiers:
+            raise ValueError(f"Unknown model tier: {tier}")
+        return tier
+
+    def smaller(self, tier: str) -> str:
+        """The next tier down, or ``tier`` itself if it is already the smallest."""
+        names = list(self.tiers)
+        return names[min(names.index(tier) + 1, len(names) - 1)]
+
+    def get(self, tier: str | None = None) -> WhisperModel:
+        key = self.tiers[self.resolve(tier)]
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                self._models.move_to_end(key)
+                return model
+            loading = self._loading.get(key)
+            if loading is not None:
+                waiting = True
+            else:
+                waiting = False
+                loading = self._loading[key] = Future()
+                # Free memory before the new model arrives, not after
+                self._evict_for(key.estimated_mb())
+        if waiting:
+            return loading.result()
+        try:
+            logger.info("Loading faster-whisper model: %s (%s, %s)", key.size, key.compute_type, key.device)
+            before = _rss_mb()
+            model = WhisperModel(key.size, device=key.device, compute_type=key.compute_type)
+            rss_delta = max(0.0, _rss_mb() - before)
+        except BaseException as exc:
+            with self._lock:
+                del self._loading[key]
+            loading.set_exception(exc)
+            raise
+        with self._lock:
+            # Other tiers may have loaded meanwhile
+            self._evict_for(key.estimated_mb())
+            self._rss_delta[key] = rss_delta
+            self._models[key] = model
+            del self._loading[key]
+        loading.set_result(model)
+        logger.info("Model loaded")
+        return model
+
+    def get_batched(self, tier: str | None = None) -> BatchedInferencePipeline:
+        model = self.get(tier)
+        key = self.tiers[self.resolve(tier)]
+        with self._lock:
+            pipeline = self._pipelines.get(key)
+            if pipeline is None or pipeline.model is not model:
+                pipeline = self._pipelines[key] = BatchedInferencePipeline(model=model)
+            return pipeline
+
+    def _evict_for(self, needed_mb: float) -> None:
+        if self.memory_budget_mb <= 0:
+            return
+        while self._models and self.loaded_mb + needed_mb > self.memory_budget_mb:
+            key, _ = self._models.popitem(last=False)
+            self._pipelines.pop(key, None)
+            logger.info("Evicted model %s (%s) to stay within memory budget", key.size, key.compute_type)
+
+    @property
+    def loaded_mb(self) -> float:
+        return sum(key.estimated_mb() for key in self._models)
+
+    def record(self, tier: str, audio_s: float, compute_s: float) -> None:
+        tier = self.resolve(tier)
+        stats = self._stats[tier]
+        stats.decodes += 1
+        stats.audio_s += audio_s
+        stats.compute_s += compute_s
+        DECODE_SECONDS.labels(tier).observe(compute_s)
+        if audio_s > 0:
+            REALTIME_FACTOR.labels(tier).observe(compute_s / audio_s)
+
+    @contextmanager
+    def timed(self, tier: str | None, audio_s: float) -> Iterator[None]:
+        """Record the compute time of the enclosed decode against ``tier``."""
+        started = time.perf_counter()
+        yield
+        self.record(self.resolve(tier), audio_s, time.perf_counter() - started)
+
+    def stats(self) -> dict:
+        tiers = {}
+        for name, key in self.tiers.items():
+            s = self._stats[name]
+            tiers[name] = {
+                "model": key.size,
+                "compute_type": key.compute_type,
+                "device": key.device,
+                "loaded": key in self._models,
+                "memory_mb": round(key.estimated_mb(), 1),
+                "rss_delta_mb": round(self._rss_delta[key], 1) if key in self._rss_delta else None,
+                "decodes": s.decodes,
+                "audio_s": round(s.audio_s, 2),
+                "rtf": round(s.compute_s / s.audio_s, 4) if s.audio_s else None,
+            }
+        return {
+            "default_tier": self.default_tier,
+            "memory_budget_mb": self.memory_budget_mb,
+            "loaded_mb": round(self.loaded_mb, 1),
+            "tiers": tiers,
+        }
+
+
+def get_registry(settings: ASRSettings | None = None) -> ModelRegistry:
+    global _registry
+    if _registry is None:
+        _registry = ModelRegistry.from_settings(settings or ASRSettings())
+    return _registry
@@ -20,3 +20,11 @@ class DiarizedSegment:
     end_time: float
     speaker: str
     confidence: float = 0.0
+
+
+@dataclass
+class Word:
+    text: str  # as emitted by Whisper, usually with a leading space
+    start_time: float
+    end_time: float
+    probability: float = 0.0
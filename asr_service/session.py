@@ -1,9 +1,15 @@
 from __future__ import annotations
 
+import time
+
 import numpy as np
 
 from common.config import ASRSettings
+from asr_service.audio_buffer import AudioBuffer
 from asr_service.diarizer import SlidingWindowDiarizer
+from asr_service.speaker_store import SessionSpeakers, SpeakerStore
+from asr_service.streaming import LocalAgreementStreamer
+from asr_service.vad import VadChunker
 
 
 class StreamSession:
@@ -16,18 +22,36 @@ class StreamSession:
         language: str | None = None,
         min_speakers: int | None = None,
         max_speakers: int | None = None,
+        diarize: bool = True,
+        speaker_store: SpeakerStore | None = None,
+        meeting_series: str | None = None,
+        model_tier: str | None = None,
     ):
         self.stream_id = stream_id
         self.settings = settings
         self.language = language
+        self.diarize = diarize
+        self.meeting_series = meeting_series
+        self.model_tier = model_tier
         self.sample_rate = 16000
         self.chunk_samples = int(settings.chunk_duration_s * self.sample_rate)
 
-        self._audio_buffer = np.array([], dtype=np.float32)
-        self._processed_time = 0.0
+        # Shared by the chunker and the diarizer; trimmed once both are done with it
+        self.audio = AudioBuffer(
+            initial_capacity=self.chunk_samples * 4,
+            max_memory_samples=int(settings.session_memory_budget_mb * 2**20 / 4),
+            spill_dir=settings.spill_dir,
+        )
+        self._read_pos = 0  # absolute sample index of the next untranscribed sample
+        self._cut: int | None = None  # end of the next VAD chunk, once decided
+        self._taken_end = 0  # end of the last chunk handed out
+        self.decoded_time = 0.0  # end of the audio whose transcription has come back
+        self.audio_received_at = 0.0  # monotonic time of the latest add_audio
         self._segment_counter = 0
 
         self.diarizer = SlidingWindowDiarizer(
+            buffer=self.audio,
+            step_seconds=settings.diarize_step_s,
             window_seconds=settings.diarize_window_s,
             sample_rate=self.sample_rate,
             hf_token=settings.hf_token,
@@ -36,36 +60,133 @@ class StreamSession:
             max_speakers=max_speakers,
         )
 
+        # Known-voice lookups for speaker_map, cached per session
+        self.speakers = (
+            SessionSpeakers(speaker_store) if speaker_store is not None and diarize else None
+        )
+
+        self.vad = (
+            VadChunker(
+                sample_rate=self.sample_rate,
+                min_chunk_s=settings.vad_min_chunk_s,
+                max_chunk_s=settings.vad_max_chunk_s,
+                min_silence_ms=settings.vad_min_silence_ms,
+                threshold_db=settings.vad_threshold_db,
+            )
+            if settings.vad_chunking
+            else None
+        )
+        self.skipped_samples = 0  # silence never sent for transcription
+        self.streamer = (
+            LocalAgreementStreamer(
+                buffer=self.audio,
+                sample_rate=self.sample_rate,
+                step_seconds=settings.stream_step_s,
+                window_seconds=settings.stream_window_s,
+                prompt_chars=settings.stream_prompt_chars,
+            )
+            if settings.stream_mode == "local_agreement"
+            else None
+        )
+
         self.final_segments: list[dict] = []
         self.all_partial_segments: list = []
 
+    @property
+    def pending_samples(self) -> int:
+        """Samples received but not yet handed out for transcription."""
+        return self.audio.end_sample - self._read_pos
+
+    @property
+    def audio_in_flight_s(self) -> float:
+        """Seconds of received audio still waiting for or inside a decode."""
+        return max(0.0, self.audio.end_sample / self.sample_rate - self.decoded_time)
+
     def add_audio(self, pcm_bytes: bytes) -> None:
         """Append raw 16-bit PCM audio to the buffer."""
-        audio = np.frombuffer(pcm_bytes, dtype=np.int16).astype(np.float32) / 32768.0
-        self._audio_buffer = np.concatenate([self._audio_buffer, audio])
-        self.diarizer.add_audio(audio)
+        self.audio.append_pcm16(pcm_bytes)
+        self.audio_received_at = time.monotonic()
+        if self.vad is not None:
+            self.vad.feed(self.audio)
 
     def has_chunk(self) -> bool:
-        return len(self._audio_buffer) >= self.chunk_samples
+        if self.vad is None:
+            return self.pending_samples >= self.chunk_samples
+        if self._cut is None:
+            self._skip_silence()
+            self._cut = self.vad.next_cut(self._read_pos)
+        return self._cut is not None
 
     def pop_chunk(self) -> tuple[np.ndarray, float]:
-        """Pop a chunk of audio for transcription. Returns (audio, offset)."""
-        chunk = self._audio_buffer[: self.chunk_samples]
-        self._audio_buffer = self._audio_buffer[self.chunk_samples:]
-        offset = self._processed_time
-        self._processed_time += len(chunk) / self.sample_rate
-        return chunk, offset
+        """Pop a chunk of audio for transcription. Returns (audio, offset).
+
+        The audio is a zero-copy view unless it had to be spilled to disk.
+        Call only after ``has_chunk`` returned True.
+        """
+        if self.vad is None:
+            return self._take(self._read_pos + self.chunk_samples)
+        end, self._cut = self._cut, None
+        return self._take(end)
+
+    def has_stream_window(self) -> bool:
+        """Whether the streamer is due another re-decode (local_agreement mode).
+
+        Leading silence is skipped first, so windows with no speech are never decoded.
+        """
+        if self.vad is not None:
+            self.streamer.skip_to(self.vad.skip_silence(self.streamer.retain_from))
+            self.trim()
+            if not self.vad.has_speech(self.streamer.retain_from):
+                self.decoded_time = max(self.decoded_time, self.streamer.retain_from / self.sample_rate)
+                return False
+        return self.streamer.has_window()
 
     def flush(self) -> tuple[np.ndarray, float] | None:
-        """Return remaining audio if any."""
-        if len(self._audio_buffer) > 0:
-            chunk = self._audio_buffer
-            self._audio_buffer = np.array([], dtype=np.float32)
-            offset = self._processed_time
-            self._processed_time += len(chunk) / self.sample_rate
-            return chunk, offset
+        """Return remaining audio if any (and, with VAD, if it holds speech).
+
+        In local_agreement mode the streamer decodes the tail itself.
+        """
+        if self.streamer is not None:
+            return None
+        if self.vad is not None:
+            self._skip_silence()
+            if not self.vad.has_speech(self._read_pos):
+                self._read_pos = self.audio.end_sample
+                self.trim()
+                return None
+        if self.pending_samples > 0:
+            return self._take(self.audio.end_sample)
         return None
 
+    def _skip_silence(self) -> None:
+        start = self.vad.skip_silence(self._read_pos)
+        if start > self._read_pos:
+            self.skipped_samples += start - self._read_pos
+            self._read_pos = start
+            self.trim()
+        # Skipped silence counts as decoded once every chunk before it has come back
+        if self.decoded_time * self.sample_rate >= self._taken_end - 1:
+            self.decoded_time = self._read_pos / self.sample_rate
+
+    def _take(self, end: int) -> tuple[np.ndarray, float]:
+        chunk = self.audio.read(self._read_pos, end)
+        offset = self._read_pos / self.sample_rate
+        self._read_pos = self._taken_end = end
+        self.trim()
+        return chunk, offset
+
+    def trim(self) -> None:
+        position = self._read_pos if self.streamer is None else self.streamer.retain_from
+        keep_from = position
+        if self.diarize:
+            keep_from = min(keep_from, self.diarizer.retain_from)
+        self.audio.discard_before(keep_from)
+        if self.vad is not None:
+            self.vad.consume(position)
+
+    def close(self) -> None:
+        self.audio.close()
+
     def next_segment_id(self) -> int:
         sid = self._segment_counter
         self._segment_counter += 1
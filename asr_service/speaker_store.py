@@ -0,0 +1,266 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from common.config import ASRSettings
+
+logger = logging.getLogger(__name__)
+
+_store: SpeakerStore | None = None
+
+
+def get_speaker_store(settings: ASRSettings | None = None) -> SpeakerStore | None:
+    """The shared voice profile store, or None when ``speaker_store_path`` is unset."""
+    global _store
+    settings = settings or ASRSettings()
+    if _store is None and settings.speaker_store_path:
+        _store = SpeakerStore(
+            settings.speaker_store_path, settings.speaker_match_threshold, settings.speaker_store_max_profiles
+        )
+    return _store
+
+
+def _unit(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    return x / np.where(norms == 0, 1.0, norms)
+
+
+class SpeakerStore:
+    """Voice profiles persisted in one ``.npz`` file.
+
+    Each profile is a unit-norm centroid of the speaker embeddings it was
+    enrolled from. Lookups are a brute-force matrix product against all
+    profiles, which is plenty for a few thousand voices. The file also keeps
+    how many speakers each past meeting of a series had, for speaker-count
+    hints. Beyond ``max_profiles`` the profiles enrolled into least recently
+    are dropped.
+    """
+
+    MAX_PROFILE_COUNT = 50  # caps the centroid weight so profiles keep adapting
+    SERIES_HISTORY = 10  # past meetings remembered per series
+
+    def __init__(self, path: str, match_threshold: float = 0.5, max_profiles: int = 0):
+        self.path = path
+        self.match_threshold = match_threshold
+        self.max_profiles = max_profiles
+        self.ids: list[str] = []
+        self.embeddings = np.zeros((0, 0), dtype=np.float32)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.last_seen = np.zeros(0, dtype=np.float64)  # unix time each profile was last enrolled into
+        self._save_lock = asyncio.Lock()
+        self._history: dict[str, list[int]] = {}
+        self._next_id = 0
+        if os.path.exists(path):
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _load(self) -> None:
+        with np.load(self.path) as data:
+            self.ids = [str(i) for i in data["ids"]]
+            self.embeddings = data["embeddings"].astype(np.float32)
+            self.counts = data["counts"].astype(np.int64)
+            # Stores written before eviction existed: all equally old
+            self.last_seen = (
+                data["last_seen"].astype(np.float64) if "last_seen" in data.files else np.zeros(len(self.ids))
+            )
+            self._next_id = int(data["next_id"])
+            for series, speakers in zip(data["meeting_series"], data["meeting_speakers"]):
+                self._history.setdefault(str(series), []).append(int(speakers))
+        logger.info("Loaded %d voice profiles from %s", len(self.ids), self.path)
+
+    def save(self) -> None:
+        """Write the store atomically next to its final path."""
+        self._write(self._snapshot())
+
+    async def persist(self) -> None:
+        """``save`` off the event loop, one write at a time and in call order."""
+        snapshot = self._snapshot()
+        async with self._save_lock:
+            await asyncio.to_thread(self._write, snapshot)
+
+    def _snapshot(self) -> dict[str, np.ndarray]:
+        series = [s for s, counts in self._history.items() for _ in counts]
+        speakers = [c for counts in self._history.values() for c in counts]
+        return {
+            "ids": np.array(self.ids, dtype=str),
+            "embeddings": self.embeddings.copy(),
+            "counts": self.counts.copy(),
+            "last_seen": self.last_seen.copy(),
+            "next_id": np.int64(self._next_id),
+            "meeting_series": np.array(series, dtype=str),
+            "meeting_speakers": np.array(speakers, dtype=np.int64),
+        }
+
+    def _write(self, snapshot: dict[str, np.ndarray]) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(prefix=".speakers-", suffix=".npz", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **snapshot)
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def nearest(self, embeddings: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Index of the closest profile and its cosine distance, per embedding row."""
+        queries = _unit(np.atleast_2d(np.asarray(embeddings, dtype=np.float32)))
+        if not self.ids or queries.shape[1] != self.embeddings.shape[1]:
+            return np.full(len(queries), -1), np.full(len(queries), np.inf)
+        distances = 1.0 - queries @ self.embeddings.T
+        best = np.argmin(distances, axis=1)
+        return best, distances[np.arange(len(queries)), best]
+
+    def identify(self, centroids: dict[str, np.ndarray]) -> dict[str, str]:
+        """Map session speakers to known profiles, one-to-one, closest pairs first."""
+        labels = list(centroids)
+        if not labels or not self.ids:
+            return {}
+        queries = _unit(np.stack([centroids[label] for label in labels]).astype(np.float32))
+        if queries.shape[1] != self.embeddings.shape[1]:
+            return {}
+        distances = 1.0 - queries @ self.embeddings.T
+
+        mapping: dict[str, str] = {}
+        taken: set[int] = set()
+        for flat in np.argsort(distances, axis=None):
+            row, col = divmod(int(flat), distances.shape[1])
+            if distances[row, col] > self.match_threshold:
+                break
+            if labels[row] in mapping or col in taken:
+                continue
+            mapping[labels[row]] = self.ids[col]
+            taken.add(col)
+        return mapping
+
+    def enroll(
+        self,
+        centroids: dict[str, np.ndarray],
+        counts: dict[str, int],
+        known: dict[str, str],
+        create: bool = True,
+    ) -> dict[str, str]:
+        """Fold a finished session's speakers into the store.
+
+        Speakers in ``known`` update their profile; the rest become new
+        profiles when ``create`` is set. Returns the speaker -> profile
+        mapping for speakers whose profile is in the store.
+        """
+        mapping = dict(known)
+        index = {profile: i for i, profile in enumerate(self.ids)}
+        now = time.time()
+        for label, centroid in centroids.items():
+            emb = _unit(np.asarray(centroid, dtype=np.float32))
+            profile = mapping.get(label)
+            if profile in index:
+                i = index[profile]
+                weight = min(int(self.counts[i]), self.MAX_PROFILE_COUNT)
+                self.embeddings[i] = _unit(self.embeddings[i] * weight + emb * counts.get(label, 1))
+                self.counts[i] += counts.get(label, 1)
+                self.last_seen[i] = now
+                continue
+            if not create or (self.embeddings.size and len(emb) != self.embeddings.shape[1]):
+                continue
+            profile = f"VOICE_{self._next_id:04d}"
+            self._next_id += 1
+            self.ids.append(profile)
+            self.embeddings = (
+                emb[None, :] if not self.embeddings.size else np.vstack([self.embeddings, emb])
+            )
+            self.counts = np.append(self.counts, counts.get(label, 1))
+            self.last_seen = np.append(self.last_seen, now)
+            index[profile] = len(self.ids) - 1
+            mapping[label] = profile
+        self._evict()
+        present = set(self.ids)
+        return {label: profile for label, profile in mapping.items() if profile in present}
+
+    def _evict(self) -> None:
+        excess = len(self.ids) - self.max_profiles
+        if self.max_profiles <= 0 or excess <= 0:
+            return
+        # Stable sort, so on a tie the older profile goes first
+        keep = np.sort(np.argsort(self.last_seen, kind="stable")[excess:])
+        self.ids = [self.ids[i] for i in keep]
+        self.embeddings = self.embeddings[keep]
+        self.counts = self.counts[keep]
+        self.last_seen = self.last_seen[keep]
+        logger.info("Evicted %d voice profiles to stay within %d", excess, self.max_profiles)
+
+    def record_meeting(self, series: str, speakers: int) -> None:
+        history = self._history.setdefault(series, [])
+        history.append(speakers)
+        del history[:-self.SERIES_HISTORY]
+
+    def speaker_hints(self, series: str) -> tuple[int | None, int | None]:
+        """(min_speakers, max_speakers) from past meetings of a series.
+
+        The max leaves room for one guest. (None, None) for an unknown series.
+        """
+        history = self._history.get(series)
+        if not history:
+            return None, None
+        return max(1, min(history)), max(history) + 1
+
+
+class SessionSpeakers:
+    """Per-session view of the store that caches lookups.
+
+    A speaker is looked up again only once its centroid has absorbed twice
+    as many windows as when it was last matched.
+    """
+
+    def __init__(self, store: SpeakerStore):
+        self.store = store
+        self._cache: dict[str, tuple[int, str | None]] = {}  # speaker -> (count, profile)
+
+    def update(self, centroids: dict[str, np.ndarray], counts: dict[str, int]) -> None:
+        stale = {
+            label: emb
+            for label, emb in centroids.items()
+            if label not in self._cache or counts.get(label, 1) >= 2 * self._cache[label][0]
+        }
+        if not stale:
+            return
+        matches = self.store.identify(stale)
+        for label in stale:
+            self._cache[label] = (counts.get(label, 1), matches.get(label))
+
+    def speaker_map(self, centroids: dict[str, np.ndarray], counts: dict[str, int]) -> dict[str, str]:
+        """Speaker -> profile for the session's final speakers, one-to-one."""
+        for label in list(self._cache):
+            if label not in centroids:
+                del self._cache[label]  # merged away by reconcile
+        self.update(centroids, counts)
+        mapping: dict[str, str] = {}
+        taken: set[str] = set()
+        for label, (_, profile) in sorted(self._cache.items(), key=lambda kv: -kv[1][0]):
+            if profile is not None and profile not in taken:
+                mapping[label] = profile
+                taken.add(profile)
+        return mapping
+
+    async def finish(
+        self,
+        centroids: dict[str, np.ndarray],
+        counts: dict[str, int],
+        series: str | None = None,
+        enroll_new: bool = True,
+    ) -> dict[str, str]:
+        """Resolve the final speaker map, enroll the session and persist the store.
+
+        Unrecognised speakers become new profiles only with ``enroll_new``.
+        """
+        mapping = self.store.enroll(centroids, counts, self.speaker_map(centroids, counts), create=enroll_new)
+        if series and centroids:
+            self.store.record_meeting(series, len(centroids))
+        await self.store.persist()
+        return mapping
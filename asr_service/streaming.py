@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import math
+import re
+
+import numpy as np
+
+from asr_service.audio_buffer import AudioBuffer
+from asr_service.models import ChunkResult, Word
+
+_NON_WORD = re.compile(r"[^\w']+")
+
+
+def _norm(word: Word) -> str:
+    return _NON_WORD.sub("", word.text.lower())
+
+
+def words_to_result(words: list[Word]) -> ChunkResult:
+    """Join consecutive words into one segment; confidence is the mean log-probability."""
+    logprob = np.mean([math.log(max(w.probability, 1e-6)) for w in words])
+    return ChunkResult(
+        text="".join(w.text for w in words).strip(),
+        start_time=words[0].start_time,
+        end_time=words[-1].end_time,
+        confidence=round(float(logprob), 4),
+    )
+
+
+class HypothesisBuffer:
+    """LocalAgreement-2 over successive word hypotheses of a growing window.
+
+    A word is committed once two consecutive decodes agree on it and on
+    every word before it. Words that end before the committed point, and
+    n-grams repeating the tail of the committed text, are dropped first so
+    re-decoded overlap is not committed twice.
+    """
+
+    MAX_NGRAM = 5
+    TIME_TOLERANCE = 0.1  # seconds of timestamp jitter between decodes
+    KEEP_COMMITTED = 64  # committed words kept for the prompt and n-gram check
+
+    def __init__(self):
+        self.committed: list[Word] = []  # most recent only
+        self.committed_until = 0.0
+        self._previous: list[Word] = []
+
+    @property
+    def tentative(self) -> list[Word]:
+        """The latest hypothesis past the committed point."""
+        return list(self._previous)
+
+    def _new_words(self, words: list[Word]) -> list[Word]:
+        words = [w for w in words if w.start_time > self.committed_until - self.TIME_TOLERANCE]
+        if words and self.committed and abs(words[0].start_time - self.committed_until) < 1.0:
+            tail = [_norm(w) for w in self.committed[-self.MAX_NGRAM:]]
+            head = [_norm(w) for w in words[:self.MAX_NGRAM]]
+            for n in range(min(len(tail), len(head)), 0, -1):
+                if tail[-n:] == head[:n]:
+                    return words[n:]
+        return words
+
+    def insert(self, words: list[Word], final: bool = False) -> list[Word]:
+        """Add a new hypothesis; return the words it commits.
+
+        With ``final`` the whole hypothesis is committed.
+        """
+        words = self._new_words(words)
+        if final:
+            agreed = len(words)
+        else:
+            agreed = 0
+            for new, old in zip(words, self._previous):
+                if _norm(new) != _norm(old):
+                    break
+                agreed += 1
+        self._previous = words[agreed:]
+        return self._commit(words[:agreed])
+
+    def commit_before(self, time: float) -> list[Word]:
+        """Commit the leading tentative words that end by ``time``, agreed or not."""
+        n = 0
+        while n < len(self._previous) and self._previous[n].end_time <= time:
+            n += 1
+        commit, self._previous = self._previous[:n], self._previous[n:]
+        return self._commit(commit)
+
+    def _commit(self, words: list[Word]) -> list[Word]:
+        if words:
+            self.committed.extend(words)
+            del self.committed[:-self.KEEP_COMMITTED]
+            self.committed_until = words[-1].end_time
+        return words
+
+    def prompt(self, max_chars: int) -> str:
+        """Tail of the committed text, for Whisper's initial prompt."""
+        text = "".join(w.text for w in self.committed).strip()
+        return text[-max_chars:] if max_chars > 0 else ""
+
+
+class LocalAgreementStreamer:
+    """Re-decodes a trailing window every ``step_seconds`` and stabilises the result.
+
+    The window runs from the start of uncommitted audio to the newest sample.
+    Once it is longer than ``window_seconds`` it is cut at the committed
+    point; past twice that with nothing agreed, the oldest tentative words are
+    committed anyway so the window stays bounded.
+    """
+
+    def __init__(
+        self,
+        buffer: AudioBuffer,
+        sample_rate: int = 16000,
+        step_seconds: float = 1.0,
+        window_seconds: float = 8.0,
+        prompt_chars: int = 200,
+    ):
+        self._buffer = buffer
+        self.sample_rate = sample_rate
+        self.step_samples = int(step_seconds * sample_rate)
+        self.window_samples = int(window_seconds * sample_rate)
+        self.prompt_chars = prompt_chars
+        self.hypothesis = HypothesisBuffer()
+        self._start = 0  # absolute sample index where the window starts
+        self._decoded_until = 0  # window end of the last decode
+
+    @property
+    def retain_from(self) -> int:
+        """Absolute sample index of the oldest audio still needed."""
+        return self._start
+
+    @property
+    def prompt(self) -> str:
+        return self.hypothesis.prompt(self.prompt_chars)
+
+    def skip_to(self, sample: int) -> None:
+        """Move the window start forward past audio known to hold no speech."""
+        if not self.hypothesis.tentative:
+            self._start = max(self._start, sample)
+
+    def has_window(self) -> bool:
+        return self._buffer.end_sample - max(self._decoded_until, self._start) >= self.step_samples
+
+    def next_window(self) -> tuple[np.ndarray, float]:
+        """Audio from the window start to the newest sample, and its start time."""
+        end = self._buffer.end_sample
+        self._decoded_until = end
+        return self._buffer.read(self._start, end), self._start / self.sample_rate
+
+    def merge_window(
+        self,
+        words: list[Word],
+        window_end: float,
+        final: bool = False,
+    ) -> tuple[list[Word], list[Word]]:
+        """Fold a decode of the window in. Returns (newly committed, tentative) words."""
+        committed = self.hypothesis.insert(words, final=final)
+
+        end = int(round(window_end * self.sample_rate))
+        if end - self._start > 2 * self.window_samples:
+            # No agreement for too long: commit what is clearly behind the newest step
+            cutoff = window_end - self.step_samples / self.sample_rate
+            committed += self.hypothesis.commit_before(cutoff)
+        if final or end - self._start > self.window_samples:
+            until = int(self.hypothesis.committed_until * self.sample_rate)
+            if final:
+                until = end
+            self._start = min(max(self._start, until), self._buffer.end_sample)
+        return committed, self.hypothesis.tentative
@@ -1,53 +1,246 @@
 from __future__ import annotations
 
+import asyncio
 import logging
+from itertools import groupby
+
 import numpy as np
-from faster_whisper import WhisperModel
+from faster_whisper import BatchedInferencePipeline, WhisperModel
 
 from common.config import ASRSettings
-from asr_service.models import ChunkResult
+from asr_service.executor import InferenceExecutor
+from asr_service.model_registry import ModelRegistry, get_registry
+from asr_service.models import ChunkResult, Word
 
 logger = logging.getLogger(__name__)
 
-_model: WhisperModel | None = None
+SAMPLE_RATE = 16000
 
 
-def get_model(settings: ASRSettings | None = None) -> WhisperModel:
-    global _model
-    if _model is None:
-        settings = settings or ASRSettings()
-        logger.info("Loading faster-whisper model: %s", settings.model_size)
-        _model = WhisperModel(
-            settings.model_size,
-            device=settings.device,
-            compute_type=settings.compute_type,
-        )
-        logger.info("Model loaded")
-    return _model
+def get_model(settings: ASRSettings | None = None, tier: str | None = None) -> WhisperModel:
+    return get_registry(settings).get(tier)
+
+
+def get_batched_pipeline(tier: str | None = None) -> BatchedInferencePipeline:
+    return get_registry().get_batched(tier)
 
 
 def transcribe_chunk(
     audio: np.ndarray,
     offset: float,
     language: str | None = None,
+    tier: str | None = None,
 ) -> list[ChunkResult]:
     """Transcribe a numpy audio array (16kHz float32) and return segments."""
-    model = get_model()
-    segments, info = model.transcribe(
-        audio,
-        language=language,
-        vad_filter=True,
-        vad_parameters={"min_silence_duration_ms": 300},
-        beam_size=5,
-    )
-    results: list[ChunkResult] = []
-    for seg in segments:
-        results.append(
-            ChunkResult(
-                text=seg.text.strip(),
-                start_time=round(offset + seg.start, 3),
-                end_time=round(offset + seg.end, 3),
-                confidence=round(seg.avg_logprob, 4) if seg.avg_logprob else 0.0,
+    registry = get_registry()
+    with registry.timed(tier, len(audio) / SAMPLE_RATE):
+        segments, info = registry.get(tier).transcribe(
+            audio,
+            language=language,
+            vad_filter=True,
+            vad_parameters={"min_silence_duration_ms": 300},
+            beam_size=5,
+        )
+        results: list[ChunkResult] = []
+        for seg in segments:
+            results.append(
+                ChunkResult(
+                    text=seg.text.strip(),
+                    start_time=round(offset + seg.start, 3),
+                    end_time=round(offset + seg.end, 3),
+                    confidence=round(seg.avg_logprob, 4) if seg.avg_logprob else 0.0,
+                )
+            )
+    return results
+
+
+def transcribe_words(
+    audio: np.ndarray,
+    offset: float,
+    language: str | None = None,
+    initial_prompt: str | None = None,
+    tier: str | None = None,
+) -> list[Word]:
+    """Transcribe with word timestamps, for streaming re-decodes of a window.
+
+    ``initial_prompt`` carries the text already committed before the window.
+    """
+    registry = get_registry()
+    with registry.timed(tier, len(audio) / SAMPLE_RATE):
+        segments, info = registry.get(tier).transcribe(
+            audio,
+            language=language,
+            initial_prompt=initial_prompt or None,
+            condition_on_previous_text=False,
+            word_timestamps=True,
+            vad_filter=True,
+            vad_parameters={"min_silence_duration_ms": 300},
+            beam_size=5,
+        )
+        return [
+            Word(
+                text=word.word,
+                start_time=round(offset + word.start, 3),
+                end_time=round(offset + word.end, 3),
+                probability=word.probability,
             )
+            for seg in segments
+            for word in seg.words or []
+        ]
+
+
+def transcribe_batch(
+    chunks: list[tuple[np.ndarray, float]],
+    language: str,
+    tier: str | None = None,
+) -> list[list[ChunkResult]]:
+    """Transcribe independent (audio, offset) chunks in one batched encoder pass.
+
+    The chunks are laid end to end and passed as clip timestamps, so each one
+    is decoded as its own batch row. Returns one result list per chunk.
+
+    Unlike ``transcribe_chunk`` this does not run Silero VAD: clip timestamps
+    replace the pipeline's own VAD segmentation, so silence inside a chunk is
+    decoded as is. The language must be given, since one detection would
+    otherwise be shared by every chunk in the batch.
+    """
+    lengths = np.array([len(audio) for audio, _ in chunks])
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    clips = [
+        {"start": start / SAMPLE_RATE, "end": end / SAMPLE_RATE}
+        for start, end in zip(starts, ends)
+    ]
+    registry = get_registry()
+    with registry.timed(tier, int(ends[-1]) / SAMPLE_RATE):
+        segments, info = registry.get_batched(tier).transcribe(
+            np.concatenate([audio for audio, _ in chunks]),
+            language=language,
+            clip_timestamps=clips,
+            batch_size=len(chunks),
+            beam_size=5,
         )
+
+        clip_starts = starts / SAMPLE_RATE
+        results: list[list[ChunkResult]] = [[] for _ in chunks]
+        for seg in segments:
+            idx = int(np.searchsorted(clip_starts, seg.start, side="right")) - 1
+            base = chunks[idx][1] - clip_starts[idx]
+            results[idx].append(
+                ChunkResult(
+                    text=seg.text.strip(),
+                    start_time=round(base + seg.start, 3),
+                    end_time=round(base + seg.end, 3),
+                    confidence=round(seg.avg_logprob, 4) if seg.avg_logprob else 0.0,
+                )
+            )
     return results
+
+
+class BatchScheduler:
+    """Gathers chunks from all live sessions into batched decodes.
+
+    A batch is dispatched when ``max_batch_size`` chunks are waiting or
+    ``max_wait_ms`` after the first one arrived, whichever comes first.
+    Chunks are grouped by language and model tier since a batch shares one
+    decode config; chunks without an explicit language are decoded on their
+    own, with language detection and VAD. While the executor queue is at
+    least ``degrade_queue_depth`` deep, chunks drop to the next smaller tier.
+    """
+
+    def __init__(
+        self,
+        executor: InferenceExecutor,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 20.0,
+        registry: ModelRegistry | None = None,
+        degrade_queue_depth: int = 0,
+    ):
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.registry = registry
+        self.degrade_queue_depth = degrade_queue_depth
+        self._pending: list[tuple[np.ndarray, float, str | None, str | None, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self._batches = 0
+        self._chunks = 0
+        self._degraded = 0
+
+    def effective_tier(self, tier: str | None) -> str | None:
+        """The tier a chunk will actually decode on, given the current load."""
+        if self.registry is None:
+            return tier
+        tier = self.registry.resolve(tier)
+        if 0 < self.degrade_queue_depth <= self.executor.queue_depth:
+            smaller = self.registry.smaller(tier)
+            if smaller != tier:
+                self._degraded += 1
+                return smaller
+        return tier
+
+    async def submit(
+        self,
+        audio: np.ndarray,
+        offset: float,
+        language: str | None = None,
+        tier: str | None = None,
+    ) -> list[ChunkResult]:
+        tier = self.effective_tier(tier)
+        if self.max_batch_size <= 1 or language is None:
+            return await self.executor.run(transcribe_chunk, audio, offset, language, tier)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((audio, offset, language, tier, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._dispatch()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._dispatch)
+        return await future
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, []
+
+        def config(item):
+            return item[2], item[3] or ""
+
+        pending.sort(key=config)
+        for _, group in groupby(pending, key=config):
+            task = asyncio.create_task(self._run_batch(list(group)))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, items: list) -> None:
+        language, tier = items[0][2], items[0][3]
+        self._batches += 1
+        self._chunks += len(items)
+        try:
+            if len(items) == 1:
+                audio, offset, *_ = items[0]
+                results = [await self.executor.run(transcribe_chunk, audio, offset, language, tier)]
+            else:
+                chunks = [(audio, offset) for audio, offset, *_ in items]
+                results = await self.executor.run(transcribe_batch, chunks, language, tier)
+        except Exception as exc:
+            for *_, future in items:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for (*_, future), result in zip(items, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "pending": len(self._pending),
+            "batches": self._batches,
+            "avg_batch_size": round(self._chunks / self._batches, 2) if self._batches else 0.0,
+            "degraded_chunks": self._degraded,
+        }
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import numpy as np
+
+from asr_service.audio_buffer import AudioBuffer
+
+
+class VadChunker:
+    """Streaming energy VAD that decides where to cut audio for transcription.
+
+    Audio is classified in fixed frames as it arrives. A frame is speech when
+    its level is above both ``threshold_db`` and the running noise floor plus
+    ``margin_db``. Chunks start a little before the first speech frame and end
+    in the middle of the first pause of at least ``min_silence_ms`` once the
+    chunk is ``min_chunk_s`` long. With no pause by ``max_chunk_s``, the cut
+    goes at the quietest frame in the allowed range. Pure silence is skipped
+    and never becomes a chunk.
+    """
+
+    FLOOR_RISE = 0.0005  # per-frame pull of the noise floor towards louder frames (~1 min)
+
+    def __init__(
+        self,
+        sample_rate: int = 16000,
+        min_chunk_s: float = 1.0,
+        max_chunk_s: float = 6.0,
+        min_silence_ms: float = 300.0,
+        pad_ms: float = 150.0,
+        threshold_db: float = -45.0,
+        margin_db: float = 10.0,
+        frame_ms: float = 30.0,
+    ):
+        self.frame = int(sample_rate * frame_ms / 1000)
+        self.min_chunk_frames = max(1, round(min_chunk_s * 1000 / frame_ms))
+        self.max_chunk_frames = max(self.min_chunk_frames, round(max_chunk_s * 1000 / frame_ms))
+        self.min_silence_frames = max(1, round(min_silence_ms / frame_ms))
+        self.pad_frames = round(pad_ms / frame_ms)
+        self.threshold_db = threshold_db
+        self.margin_db = margin_db
+        self._floor: float | None = None
+        self._first = 0  # absolute frame index of _speech[0]
+        self._speech = np.zeros(0, dtype=bool)
+        self._db = np.zeros(0, dtype=np.float32)
+
+    @property
+    def classified_until(self) -> int:
+        """Absolute sample index up to which frames have been classified."""
+        return (self._first + len(self._speech)) * self.frame
+
+    def feed(self, buffer: AudioBuffer) -> None:
+        """Classify every complete frame that arrived since the last call."""
+        start = self.classified_until
+        n = (buffer.end_sample - start) // self.frame
+        if n <= 0:
+            return
+        frames = buffer.read(start, start + n * self.frame).reshape(n, self.frame)
+        db = 10.0 * np.log10(np.mean(np.square(frames, dtype=np.float32), axis=1) + 1e-10)
+
+        speech = np.empty(n, dtype=bool)
+        floor = self.threshold_db if self._floor is None else self._floor
+        for i, level in enumerate(db):
+            speech[i] = level > self.threshold_db and level > floor + self.margin_db
+            floor = level if level < floor else floor + self.FLOOR_RISE * (level - floor)
+        self._floor = float(floor)
+
+        self._speech = np.concatenate([self._speech, speech])
+        self._db = np.concatenate([self._db, db.astype(np.float32)])
+
+    def consume(self, sample: int) -> None:
+        """Forget frames before absolute sample index ``sample``."""
+        drop = min(len(self._speech), sample // self.frame - self._first)
+        if drop > 0:
+            self._speech = self._speech[drop:]
+            self._db = self._db[drop:]
+            self._first += drop
+
+    def skip_silence(self, read_pos: int) -> int:
+        """Where the next chunk should start: just before the next speech frame.
+
+        Returns ``read_pos`` unchanged if speech is already there.
+        """
+        offset = read_pos // self.frame - self._first
+        voiced = np.flatnonzero(self._speech[offset:])
+        first_speech = offset + (voiced[0] if len(voiced) else len(self._speech) - offset)
+        start_frame = max(offset, first_speech - self.pad_frames)
+        return max(read_pos, (self._first + start_frame) * self.frame)
+
+    def next_cut(self, read_pos: int) -> int | None:
+        """Absolute end sample of the chunk starting at ``read_pos``, or None to wait."""
+        offset = read_pos // self.frame - self._first
+        speech = self._speech[offset:]
+        if len(speech) < self.min_chunk_frames or not speech.any():
+            return None
+
+        # Runs of silence: starts and (exclusive) ends, relative to read_pos
+        edges = np.diff(np.concatenate([[1], speech.view(np.int8), [1]]))
+        starts = np.flatnonzero(edges == -1)
+        ends = np.flatnonzero(edges == 1)
+        long_enough = (ends - starts >= self.min_silence_frames) & (ends < len(speech))
+        cuts = starts[long_enough] + self.min_silence_frames // 2
+        cuts = cuts[(cuts >= self.min_chunk_frames) & (cuts <= self.max_chunk_frames)]
+        if len(cuts):
+            return (self._first + offset + int(cuts[0])) * self.frame
+
+        if len(speech) >= self.max_chunk_frames:
+            window = self._db[offset + self.min_chunk_frames:offset + self.max_chunk_frames]
+            # Latest of the quietest frames, so steady speech runs to the max
+            cut = self.max_chunk_frames - int(np.argmin(window[::-1]))
+            return (self._first + offset + cut) * self.frame
+        return None
+
+    def has_speech(self, read_pos: int) -> bool:
+        """Whether any classified frame from ``read_pos`` on is speech."""
+        offset = read_pos // self.frame - self._first
+        return bool(self._speech[offset:].any())
+
+    def speech_end(self, read_pos: int) -> int:
+        """Absolute sample just past the last speech frame from ``read_pos`` on, plus padding."""
+        offset = read_pos // self.frame - self._first
+        voiced = np.flatnonzero(self._speech[offset:])
+        if not len(voiced):
+            return read_pos
+        last = offset + int(voiced[-1]) + 1 + self.pad_frames
+        return min(self.classified_until, (self._first + last) * self.frame)
@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import logging
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from common.config import ASRSettings
+from asr_service.diarizer import diarize_window, get_pipeline
+from asr_service.executor import InferenceExecutor
+from asr_service.transcriber import SAMPLE_RATE, get_model, transcribe_batch
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class WarmupState:
+    ready: bool = False
+    started_at: float | None = None
+    finished_at: float | None = None
+    timings: dict[str, float] = field(default_factory=dict)
+    error: str | None = None
+
+    def to_dict(self) -> dict:
+        return {
+            "ready": self.ready,
+            "warmup_s": (
+                round(self.finished_at - self.started_at, 3)
+                if self.started_at is not None and self.finished_at is not None
+                else None
+            ),
+            "timings": self.timings,
+            "error": self.error,
+        }
+
+
+def synthetic_speech(seconds: float, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Deterministic voiced-sounding audio: harmonics under a syllable-rate envelope."""
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    pitch = 140.0 + 20.0 * np.sin(2 * np.pi * 0.5 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 6))
+    envelope = 0.5 * (1 - np.cos(2 * np.pi * 4.0 * t))
+    noise = np.random.default_rng(0).normal(0.0, 0.01, len(t))
+    return (0.2 * voiced * envelope + noise).astype(np.float32)
+
+
+def _timed(fn, *args) -> float:
+    started = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - started
+
+
+def warm_decode(seconds: float) -> float:
+    """One full decode of synthetic audio, VAD off so the decoder always runs."""
+    def decode():
+        segments, _ = get_model().transcribe(
+            synthetic_speech(seconds), vad_filter=False, beam_size=5
+        )
+        list(segments)  # decoding is lazy
+    return _timed(decode)
+
+
+def warm_batch_decode(seconds: float, batch_size: int) -> float:
+    audio = synthetic_speech(seconds)
+    # Batched decodes always carry a language; the synthetic audio has none
+    return _timed(transcribe_batch, [(audio, i * seconds) for i in range(batch_size)], "en")
+
+
+def warm_diarization(seconds: float, hf_token: str, clustering_threshold: float | None) -> float | None:
+    """Load pyannote and diarize one synthetic window; None if it is unavailable."""
+    if get_pipeline(hf_token, clustering_threshold) is None:
+        return None
+    return _timed(
+        lambda: diarize_window(
+            synthetic_speech(seconds),
+            0.0,
+            hf_token=hf_token,
+            clustering_threshold=clustering_threshold,
+        )
+    )
+
+
+def decode_seconds(settings: ASRSettings) -> float:
+    """Length of the audio each decode sees with the configured chunking."""
+    if settings.stream_mode == "local_agreement":
+        return settings.stream_window_s
+    if settings.vad_chunking:
+        return settings.vad_max_chunk_s
+    return settings.chunk_duration_s
+
+
+async def run_warmup(state: WarmupState, executor: InferenceExecutor, settings: ASRSettings) -> None:
+    """Load both models and run synthetic passes on the executor, recording timings.
+
+    ``state.ready`` flips only once every step has finished. Diarization
+    being unavailable does not block readiness, since sessions then run
+    without it anyway.
+    """
+    state.started_at = time.monotonic()
+    timings = state.timings
+    try:
+        timings["model_load_s"] = round(await executor.run(_timed, get_model, settings), 3)
+        if settings.warmup_enabled:
+            seconds = decode_seconds(settings)
+            # Exactly one pass on every thread (or process), so each has loaded and run the model
+            decodes = await executor.run_on_each_worker(warm_decode, seconds)
+            timings["decode_s"] = round(max(decodes), 3)
+            if settings.batch_max_size > 1:
+                timings["batch_decode_s"] = round(
+                    await executor.run(warm_batch_decode, seconds, min(settings.batch_max_size, 4)), 3
+                )
+            diarization = await executor.run(
+                warm_diarization,
+                settings.diarize_window_s,
+                settings.hf_token,
+                settings.diarize_clustering_threshold,
+            )
+            if diarization is not None:
+                timings["diarization_s"] = round(diarization, 3)
+        state.ready = True
+        logger.info("Warmup complete: %s", timings)
+    except Exception as exc:
+        state.error = f"{type(exc).__name__}: {exc}"
+        logger.exception("Warmup failed")
+    finally:
+        state.finished_at = time.monotonic()
@@ -0,0 +1,308 @@
+"""Open many concurrent client streams against the gateway and report per-stream latency.
+
+    python -m benchmarks.loadgen run --url ws://localhost:8000/audio --streams 50 --ramp-s 10
+
+Each stream replays a recording in real time, in client-sized frames and
+the chosen rate, channel count and encoding, like ws_test.py does for one.
+It records time to the first partial segment, the interval between
+partials, and the time from sending ``end`` to ``transcript_complete``.
+``send_lag_s`` is how far the sender fell behind its schedule; if it grows,
+the load generator itself is saturated and should be split across processes.
+
+To benchmark the gateway by itself, point it at a stub ASR service that
+answers with a partial segment per ``--chunk-s`` of audio after
+``--decode-ms``:
+
+    python -m benchmarks.loadgen stub-asr --port 8001
+    GATEWAY_ASR_WS_URL=ws://localhost:8001/stream python -m gateway.main
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+import websockets
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+
+from benchmarks.pipeline import BYTES_PER_SECOND, SAMPLE_RATE, load_recordings, percentiles
+from common.schemas import ClientMessageType, SegmentStatus, StartMessage, TranscriptCompleteMessage, TranscriptSegment
+from common.wire import BinaryWriter, FrameKind, JsonWriter, decode_frame
+
+SAMPLE_WIDTH = {"pcm_s16le": 2, "pcm_f32le": 4}
+
+
+def encode_audio(pcm: bytes, rate: int, channels: int, encoding: str) -> bytes:
+    """16 kHz mono s16le to what a client would send; done once, before streaming starts."""
+    audio = np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32768
+    if rate != SAMPLE_RATE:
+        times = np.arange(int(len(audio) * rate / SAMPLE_RATE)) / rate
+        audio = np.interp(times, np.arange(len(audio)) / SAMPLE_RATE, audio).astype(np.float32)
+    audio = np.repeat(audio[:, None], channels, axis=1)
+    if encoding == "pcm_s16le":
+        return (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+    return audio.astype("<f4").tobytes()
+
+
+# --- load generator ------------------------------------------------------------
+
+
+@dataclass
+class StreamStats:
+    stream_id: str
+    audio_s: float
+    queued: bool = False
+    error: str | None = None
+    first_partial_s: float | None = None
+    complete_s: float | None = None
+    send_lag_s: float = 0.0  # worst lateness of a frame against the real-time schedule
+    partial_times: list[float] = field(default_factory=list)
+
+    @property
+    def cadence_s(self) -> list[float]:
+        return list(np.diff(self.partial_times)) if len(self.partial_times) > 1 else []
+
+
+async def run_stream(url: str, stream_id: str, data: bytes, delay_s: float, args: argparse.Namespace) -> StreamStats:
+    bytes_per_second = args.sample_rate * args.channels * SAMPLE_WIDTH[args.encoding]
+    frame_bytes = bytes_per_second * args.frame_ms // 1000
+    stats = StreamStats(stream_id, len(data) / bytes_per_second)
+    await asyncio.sleep(delay_s)
+    try:
+        async with websockets.connect(
+            url, ping_interval=30, ping_timeout=300, close_timeout=300, max_size=None
+        ) as ws:
+            await ws.send(json.dumps({
+                "type": "start",
+                "stream_id": stream_id,
+                "sample_rate": args.sample_rate,
+                "encoding": args.encoding,
+                "channels": args.channels,
+                "diarize": args.diarize,
+            }))
+            started = time.monotonic()
+            ended: list[float] = []
+
+            async def receive() -> None:
+                async for raw in ws:
+                    message = json.loads(raw)
+                    kind = message.get("type")
+                    if kind == "segment" and message["segment"]["status"] == "partial":
+                        at = time.monotonic() - started
+                        if stats.first_partial_s is None:
+                            stats.first_partial_s = at
+                        stats.partial_times.append(at)
+                    elif kind == "queued":
+                        stats.queued = True
+                    elif kind == "transcript_complete":
+                        stats.complete_s = time.monotonic() - ended[0] if ended else None
+                        return
+                    elif kind == "error":
+                        stats.error = message.get("detail")
+                        return
+                stats.error = "closed before transcript_complete"
+
+            receiver = asyncio.create_task(receive())
+            try:
+                for i in range(0, len(data), frame_bytes):
+                    # Sleep to an absolute schedule so pacing does not drift
+                    lag = time.monotonic() - (started + i / bytes_per_second)
+                    if lag < 0:
+                        await asyncio.sleep(-lag)
+                    else:
+                        stats.send_lag_s = max(stats.send_lag_s, lag)
+                    await ws.send(data[i:i + frame_bytes])
+                    if receiver.done():
+                        break
+                await ws.send(json.dumps({"type": "end", "stream_id": stream_id}))
+                ended.append(time.monotonic())
+                await receiver
+            finally:
+                receiver.cancel()
+    except Exception as exc:
+        stats.error = stats.error or f"{type(exc).__name__}: {exc}"
+    return stats
+
+
+def summarize(results: list[StreamStats], wall_s: float, args: argparse.Namespace) -> dict:
+    ok = [r for r in results if r.error is None]
+    errors: dict[str, int] = {}
+    for r in results:
+        if r.error is not None:
+            errors[r.error] = errors.get(r.error, 0) + 1
+    report = {
+        "config": {
+            "url": args.url,
+            "streams": args.streams,
+            "ramp_s": args.ramp_s,
+            "sample_rate": args.sample_rate,
+            "channels": args.channels,
+            "encoding": args.encoding,
+            "frame_ms": args.frame_ms,
+            "diarize": args.diarize,
+        },
+        "wall_s": round(wall_s, 2),
+        "completed": len(ok),
+        "queued": sum(r.queued for r in results),
+        "errors": errors,
+        "first_partial_s": percentiles([r.first_partial_s for r in ok if r.first_partial_s is not None]),
+        "partial_cadence_s": percentiles([c for r in ok for c in r.cadence_s]),
+        "complete_s": percentiles([r.complete_s for r in ok if r.complete_s is not None]),
+        "send_lag_s": percentiles([r.send_lag_s for r in results]),
+    }
+    if args.per_stream:
+        report["per_stream"] = [
+            {
+                "stream_id": r.stream_id,
+                "error": r.error,
+                "first_partial_s": r.first_partial_s,
+                "partials": len(r.partial_times),
+                "complete_s": r.complete_s,
+                "send_lag_s": round(r.send_lag_s, 4),
+            }
+            for r in results
+        ]
+    return report
+
+
+async def generate(args: argparse.Namespace) -> dict:
+    recordings = [
+        encode_audio(pcm, args.sample_rate, args.channels, args.encoding)
+        for _, pcm in load_recordings(args.samples, args.duration_s)
+    ]
+    spacing = args.ramp_s / args.streams
+    started = time.perf_counter()
+    results = await asyncio.gather(*(
+        run_stream(args.url, f"load-{i}", recordings[i % len(recordings)], i * spacing, args)
+        for i in range(args.streams)
+    ))
+    return summarize(results, time.perf_counter() - started, args)
+
+
+# --- stub ASR service ------------------------------------------------------------
+
+
+def stub_asr_app(chunk_s: float, decode_ms: float):
+    """An ASR service stand-in speaking the /stream protocol, JSON or binary wire."""
+    app = FastAPI(title="Stub ASR Service")
+    streams: set[str] = set()
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok", "ready": True, "sessions": len(streams), "wire_formats": ["json", "binary"]}
+
+    @app.get("/health/ready")
+    async def health_ready():
+        return {"ready": True}
+
+    @app.websocket("/stream")
+    async def stream_endpoint(ws: WebSocket):
+        await ws.accept()
+        try:
+            start = StartMessage.model_validate_json(await ws.receive_text())
+        except WebSocketDisconnect:
+            return  # an unused warm connection
+        out = (
+            BinaryWriter(ws.send_bytes, start.stream_id)
+            if start.wire == "binary"
+            else JsonWriter(ws.send_text, start.stream_id)
+        )
+        streams.add(start.stream_id)
+        segments: list[TranscriptSegment] = []
+        pending: list[asyncio.Task] = []
+
+        async def decode(segment: TranscriptSegment) -> None:
+            await asyncio.sleep(decode_ms / 1000)
+            await out.segment(segment)
+
+        def cut(start_s: float, end_s: float, status: SegmentStatus) -> TranscriptSegment:
+            segment = TranscriptSegment(
+                status=status,
+                segment_id=len(segments),
+                start_time=round(start_s, 3),
+                end_time=round(end_s, 3),
+                text=f"segment {len(segments)}",
+            )
+            segments.append(segment)
+            return segment
+
+        received_s = cut_s = 0.0
+        try:
+            while True:
+                message = await ws.receive()
+                if message.get("type") == "websocket.disconnect":
+                    return
+                if "text" in message:
+                    if json.loads(message["text"]).get("type") == ClientMessageType.end:
+                        break
+                    continue
+                payload = message["bytes"]
+                if start.wire == "binary":
+                    frame = decode_frame(payload)
+                    if frame.kind == FrameKind.end:
+                        break
+                    payload = frame.payload
+                received_s += len(payload) / BYTES_PER_SECOND
+                while received_s - cut_s >= chunk_s:
+                    pending.append(asyncio.create_task(decode(cut(cut_s, cut_s + chunk_s, SegmentStatus.partial))))
+                    cut_s += chunk_s
+            await asyncio.gather(*pending)
+            if received_s > cut_s:
+                cut(cut_s, received_s, SegmentStatus.partial)
+            final = [segment.model_copy(update={"status": SegmentStatus.final}) for segment in segments]
+            await out.message(TranscriptCompleteMessage(stream_id=start.stream_id, segments=final))
+        except WebSocketDisconnect:
+            pass
+        finally:
+            for task in pending:
+                task.cancel()
+            streams.discard(start.stream_id)
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="stream load at a gateway")
+    run.add_argument("--url", default="ws://localhost:8000/audio")
+    run.add_argument("--streams", type=int, default=10)
+    run.add_argument("--ramp-s", type=float, default=10.0, help="stream starts are spread evenly over this")
+    run.add_argument("--samples", default="samples/*.wav", help="glob of 16 kHz mono WAVs")
+    run.add_argument("--duration-s", type=float, default=0.0, help="repeat each recording to this length")
+    run.add_argument("--sample-rate", type=int, default=48000)
+    run.add_argument("--channels", type=int, default=1)
+    run.add_argument("--encoding", choices=sorted(SAMPLE_WIDTH), default="pcm_f32le")
+    run.add_argument("--frame-ms", type=int, default=20)
+    run.add_argument("--no-diarize", dest="diarize", action="store_false")
+    run.add_argument("--per-stream", action="store_true", help="include every stream in the report")
+    run.add_argument("--output", help="write the JSON report here as well as printing it")
+
+    stub = commands.add_parser("stub-asr", help="serve a stub ASR service for the gateway")
+    stub.add_argument("--host", default="127.0.0.1")
+    stub.add_argument("--port", type=int, default=8001)
+    stub.add_argument("--chunk-s", type=float, default=3.0, help="audio per partial segment")
+    stub.add_argument("--decode-ms", type=float, default=200.0, help="delay before each partial is sent")
+    args = parser.parse_args()
+
+    if args.command == "stub-asr":
+        import uvicorn
+
+        uvicorn.run(stub_asr_app(args.chunk_s, args.decode_ms), host=args.host, port=args.port, log_level="warning")
+        return
+
+    report = asyncio.run(generate(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
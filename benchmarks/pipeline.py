@@ -0,0 +1,470 @@
+"""Replay recordings through the streaming pipeline and report latency, realtime factor and resource use.
+
+    python -m benchmarks.pipeline --path asr --concurrency 4 --pace asap --output bench.json
+
+``--path asr`` runs sessions in-process through the ASR stream loop
+(StreamSession, the batch scheduler, transcribe_chunk and the sliding-window
+diarizer). ``--path gateway`` serves the ASR service and the gateway on
+local ports in this process and streams through both over WebSockets.
+
+Whisper is faster-whisper ``tiny`` on CPU, downloaded from the Hugging Face
+Hub on the first run and cached after that, or with ``--model stub`` a
+stand-in that spends ``--stub-rtf`` of the audio duration per decode. The
+pyannote pipeline is always a stub, so no GPU or Hugging Face token is
+needed, and with ``--model stub`` no network either. Everything runs in
+one process, so CPU and peak RSS cover the services and the clients
+together; compare reports between commits on the same machine and settings.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import glob
+import json
+import os
+import resource
+import socket
+import subprocess
+import time
+import wave
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+BYTES_PER_SECOND = SAMPLE_RATE * 2
+
+
+def _cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def percentiles(values: list[float]) -> dict:
+    if not values:
+        return {"count": 0, "p50": None, "p95": None, "p99": None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"count": len(values), "p50": round(p50, 4), "p95": round(p95, 4), "p99": round(p99, 4)}
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# --- stand-ins for the models -------------------------------------------------
+
+
+class StubWhisper:
+    """Takes the place of ``WhisperModel``: one segment of placeholder words per clip."""
+
+    rtf = 0.05
+
+    def __init__(self, size: str, device: str = "auto", compute_type: str = "auto"):
+        self.size = size
+
+    def transcribe(self, audio: np.ndarray, clip_timestamps=None, **kwargs):
+        duration = len(audio) / SAMPLE_RATE
+        time.sleep(duration * self.rtf)
+        clips = clip_timestamps or [{"start": 0.0, "end": duration}]
+        segments = []
+        for clip in clips:
+            start, end = clip["start"], clip["end"]
+            words = [
+                SimpleNamespace(word=f" w{i}", start=t, end=min(end, t + 0.4), probability=0.9)
+                for i, t in enumerate(np.arange(start, end, 0.5))
+            ]
+            text = "".join(w.word for w in words).strip() or "..."
+            segments.append(SimpleNamespace(start=start, end=end, text=text, avg_logprob=-0.2, words=words))
+        return iter(segments), SimpleNamespace(language="en")
+
+
+class StubBatchedPipeline:
+    def __init__(self, model):
+        self.model = model
+
+    def transcribe(self, audio: np.ndarray, **kwargs):
+        return self.model.transcribe(audio, **kwargs)
+
+
+class _StubAnnotation:
+    def __init__(self, tracks: list[tuple[float, float, str]]):
+        self.tracks = tracks
+
+    def itertracks(self, yield_label: bool = False):
+        for start, end, label in self.tracks:
+            yield SimpleNamespace(start=start, end=end), None, label
+
+    def labels(self) -> list[str]:
+        return sorted({label for _, _, label in self.tracks})
+
+
+class StubDiarization:
+    """Takes the place of the pyannote pipeline: two speakers alternating every ``turn_s``."""
+
+    def __init__(self, rtf: float = 0.01, turn_s: float = 4.0):
+        self.rtf = rtf
+        self.turn_s = turn_s
+        self.voices = {f"SPEAKER_0{i}": np.eye(1, 192, i, dtype=np.float32)[0] for i in range(2)}
+
+    def apply(self, file: dict, return_embeddings: bool = False, **kwargs):
+        duration = file["waveform"].shape[-1] / file["sample_rate"]
+        time.sleep(duration * self.rtf)
+        tracks = [
+            (start, min(duration, start + self.turn_s), f"SPEAKER_0{i % 2}")
+            for i, start in enumerate(np.arange(0.0, duration, self.turn_s))
+        ]
+        annotation = _StubAnnotation(tracks)
+        if not return_embeddings:
+            return annotation
+        return annotation, np.stack([self.voices[label] for label in annotation.labels()])
+
+    __call__ = apply
+
+
+def configure(args: argparse.Namespace) -> None:
+    """Point the service settings at the benchmark models; call before importing the services."""
+    os.environ.update({
+        "ASR_MODEL_SIZE": args.model,
+        "ASR_DEVICE": "cpu",
+        "ASR_COMPUTE_TYPE": "int8",
+        "ASR_MODEL_TIERS": "{}",
+        "ASR_INFERENCE_EXECUTOR": "thread",  # the stubs are patched into this process only
+        "ASR_INFERENCE_WORKERS": str(args.workers),
+        "ASR_HF_TOKEN": "",
+        "ASR_SPEAKER_STORE_PATH": "",
+        "GATEWAY_MAX_SESSIONS": str(args.concurrency),
+        "GATEWAY_ASR_WS_URLS": "[]",
+    })
+
+    from asr_service import diarizer, model_registry, warmup
+
+    stub = StubDiarization(rtf=args.diarize_rtf)
+    diarizer.get_pipeline = warmup.get_pipeline = lambda *a, **kw: stub
+    if args.model == "stub":
+        StubWhisper.rtf = args.stub_rtf
+        model_registry.WhisperModel = StubWhisper
+        model_registry.BatchedInferencePipeline = StubBatchedPipeline
+
+
+# --- input ----------------------------------------------------------------------
+
+
+def load_recordings(pattern: str, tile_s: float) -> list[tuple[str, bytes]]:
+    """16 kHz mono s16le WAVs matching ``pattern``; with ``tile_s``, each repeated to that length."""
+    recordings = []
+    for path in sorted(glob.glob(pattern)):
+        with wave.open(path, "rb") as wf:
+            if (wf.getframerate(), wf.getnchannels(), wf.getsampwidth()) != (SAMPLE_RATE, 1, 2):
+                raise SystemExit(f"{path}: expected 16 kHz mono 16-bit PCM")
+            pcm = wf.readframes(wf.getnframes())
+        if tile_s > 0:
+            target = int(tile_s * BYTES_PER_SECOND)
+            pcm = (pcm * (target // len(pcm) + 1))[:target]
+        recordings.append((os.path.basename(path), pcm))
+    if not recordings:
+        raise SystemExit(f"No recordings match {pattern}")
+    return recordings
+
+
+# --- one session ------------------------------------------------------------------
+
+
+@dataclass
+class SessionResult:
+    recording: str
+    audio_s: float
+    wall_s: float = 0.0
+    first_partial_s: float | None = None
+    complete_latency_s: float | None = None
+    segment_latencies: list[float] = field(default_factory=list)
+
+
+class Replay:
+    """Sends one recording at the chosen pace and times the segments that come back."""
+
+    def __init__(self, recording: str, pcm: bytes, frame_ms: int, realtime: bool):
+        from gateway.channels import AudioClock
+
+        self.pcm = pcm
+        self.frame_bytes = BYTES_PER_SECOND * frame_ms // 1000
+        self.realtime = realtime
+        self.clock = AudioClock(horizon_s=float("inf"))
+        self.result = SessionResult(recording, len(pcm) / BYTES_PER_SECOND)
+        self.started = 0.0
+        self.ended = 0.0
+
+    async def frames(self):
+        self.started = time.monotonic()
+        for i in range(0, len(self.pcm), self.frame_bytes):
+            if self.realtime:
+                # Sleep to an absolute schedule so pacing does not drift
+                await asyncio.sleep(max(0.0, self.started + i / BYTES_PER_SECOND - time.monotonic()))
+            else:
+                await asyncio.sleep(0)
+            frame = self.pcm[i:i + self.frame_bytes]
+            yield frame
+            self.clock.sent(len(frame))
+        self.ended = time.monotonic()
+
+    def on_segment(self, end_time: float, partial: bool) -> None:
+        if partial and self.result.first_partial_s is None:
+            self.result.first_partial_s = time.monotonic() - self.started
+        latency = self.clock.latency(end_time)
+        if latency is not None:
+            self.result.segment_latencies.append(latency)
+
+    def on_complete(self) -> SessionResult:
+        now = time.monotonic()
+        self.result.wall_s = now - self.started
+        self.result.complete_latency_s = now - self.ended
+        return self.result
+
+
+class ReplayWriter:
+    """Stands in for the ASR service's JSON writer, feeding segments to a ``Replay``."""
+
+    binary = False
+
+    def __init__(self, replay: Replay, stream_id: str):
+        self.replay = replay
+        self.stream_id = stream_id
+
+    async def segment(self, segment) -> None:
+        self.replay.on_segment(segment.end_time, segment.status == "partial")
+
+    async def message(self, message) -> None:
+        pass
+
+
+async def run_asr_path(recordings, args, usage: Usage) -> list[SessionResult]:
+    from asr_service import main as asr_main
+    from asr_service import transcriber
+    from common.schemas import StartMessage
+
+    async def one(i: int) -> SessionResult:
+        name, pcm = recordings[i % len(recordings)]
+        replay = Replay(name, pcm, args.frame_ms, args.pace == "realtime")
+        session = asr_main._open_session(StartMessage(stream_id=f"bench-{i}", diarize=args.diarize))
+        try:
+            await asr_main._run_stream(session, ReplayWriter(replay, session.stream_id), replay.frames())
+        finally:
+            asr_main._close_session(session)
+        return replay.on_complete()
+
+    # Load the model and run one decode outside the measurement
+    await asr_main.executor.run(transcriber.transcribe_chunk, np.zeros(SAMPLE_RATE, np.float32), 0.0)
+    return await _measured(usage, lambda: asyncio.gather(*(one(i) for i in range(args.concurrency))))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _serve(app, port: int):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.05)
+    return server, task
+
+
+async def _wait_ready(url: str, timeout_s: float = 300.0) -> None:
+    import httpx
+
+    deadline = time.monotonic() + timeout_s
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if (await client.get(url)).status_code == 200:
+                return
+            await asyncio.sleep(0.2)
+    raise SystemExit(f"ASR service not ready after {timeout_s:.0f}s")
+
+
+async def _gateway_session(url: str, i: int, recordings, args) -> SessionResult:
+    import websockets
+
+    name, pcm = recordings[i % len(recordings)]
+    replay = Replay(name, pcm, args.frame_ms, args.pace == "realtime")
+    stream_id = f"bench-{i}"
+    async with websockets.connect(url, max_size=None) as ws:
+        await ws.send(json.dumps({
+            "type": "start",
+            "stream_id": stream_id,
+            "sample_rate": SAMPLE_RATE,
+            "encoding": "pcm_s16le",
+            "channels": 1,
+            "diarize": args.diarize,
+        }))
+
+        async def receive() -> SessionResult:
+            async for raw in ws:
+                message = json.loads(raw)
+                if message["type"] == "segment":
+                    segment = message["segment"]
+                    replay.on_segment(segment["end_time"], segment["status"] == "partial")
+                elif message["type"] == "transcript_complete":
+                    return replay.on_complete()
+                elif message["type"] == "error":
+                    raise RuntimeError(f"{stream_id}: {message.get('detail')}")
+            raise RuntimeError(f"{stream_id}: closed before transcript_complete")
+
+        receiver = asyncio.create_task(receive())
+        try:
+            async for frame in replay.frames():
+                await ws.send(frame)
+            await ws.send(json.dumps({"type": "end", "stream_id": stream_id}))
+            return await receiver
+        finally:
+            receiver.cancel()
+
+
+async def run_gateway_path(recordings, args, usage: Usage) -> list[SessionResult]:
+    asr_port, gateway_port = _free_port(), _free_port()
+    os.environ["GATEWAY_ASR_WS_URL"] = f"ws://127.0.0.1:{asr_port}/stream"
+    from asr_service import main as asr_main
+    from gateway import main as gateway_main
+
+    asr_server, asr_task = await _serve(asr_main.app, asr_port)
+    await _wait_ready(f"http://127.0.0.1:{asr_port}/health/ready")
+    gateway_server, gateway_task = await _serve(gateway_main.app, gateway_port)
+    url = f"ws://127.0.0.1:{gateway_port}/audio"
+    try:
+        return await _measured(
+            usage,
+            lambda: asyncio.gather(*(_gateway_session(url, i, recordings, args) for i in range(args.concurrency)))
+        )
+    finally:
+        for server, task in ((gateway_server, gateway_task), (asr_server, asr_task)):
+            server.should_exit = True
+            await task
+
+
+# --- measurement ---------------------------------------------------------------------
+
+
+@dataclass
+class Usage:
+    wall_s: float = 0.0
+    cpu_s: float = 0.0
+    baseline_rss_mb: float = 0.0
+    peak_rss_mb: float = 0.0
+    decode_s: dict[str, float] = field(default_factory=dict)
+    decoded_audio_s: dict[str, float] = field(default_factory=dict)
+
+
+def _decode_totals() -> tuple[dict[str, float], dict[str, float]]:
+    from prometheus_client import REGISTRY
+
+    from asr_service.model_registry import get_registry
+
+    tiers = get_registry().stats()["tiers"]
+    decode = {tier: REGISTRY.get_sample_value("asr_decode_seconds_sum", {"tier": tier}) or 0.0 for tier in tiers}
+    audio = {tier: stats["audio_s"] for tier, stats in tiers.items()}
+    return decode, audio
+
+
+async def _measured(usage: Usage, run):
+    """Await ``run()`` while recording its wall time, CPU, peak RSS and Whisper decode time in ``usage``."""
+    from asr_service.model_registry import _rss_mb
+
+    usage.baseline_rss_mb = usage.peak_rss_mb = _rss_mb()
+    decode, audio = _decode_totals()
+
+    async def sample_rss() -> None:
+        while True:
+            usage.peak_rss_mb = max(usage.peak_rss_mb, _rss_mb())
+            await asyncio.sleep(0.05)
+
+    sampler = asyncio.create_task(sample_rss())
+    cpu, wall = _cpu_seconds(), time.perf_counter()
+    try:
+        return await run()
+    finally:
+        usage.cpu_s, usage.wall_s = _cpu_seconds() - cpu, time.perf_counter() - wall
+        sampler.cancel()
+        usage.peak_rss_mb = max(usage.peak_rss_mb, _rss_mb())
+        decode_after, audio_after = _decode_totals()
+        usage.decode_s = {tier: decode_after[tier] - decode[tier] for tier in decode}
+        usage.decoded_audio_s = {tier: audio_after[tier] - audio[tier] for tier in audio}
+
+
+def build_report(results: list[SessionResult], usage: Usage, args: argparse.Namespace) -> dict:
+    audio_s = sum(r.audio_s for r in results)
+    decode_rtf = {
+        tier: round(usage.decode_s[tier] / usage.decoded_audio_s[tier], 4)
+        for tier in usage.decode_s
+        if usage.decoded_audio_s[tier] > 0
+    }
+    return {
+        "commit": _commit(),
+        "config": {
+            "path": args.path,
+            "model": args.model,
+            "concurrency": args.concurrency,
+            "pace": args.pace,
+            "frame_ms": args.frame_ms,
+            "diarize": args.diarize,
+            "workers": args.workers,
+            "recordings": sorted({r.recording for r in results}),
+            "tile_s": args.tile_s,
+        },
+        "audio_s": round(audio_s, 2),
+        "wall_s": round(usage.wall_s, 2),
+        "realtime_factor": {
+            "decode": decode_rtf,  # Whisper compute time over audio decoded, per tier
+            "session": percentiles([r.wall_s / r.audio_s for r in results]),  # wall time over audio length
+        },
+        "segment_latency_s": percentiles([lat for r in results for lat in r.segment_latencies]),
+        "first_partial_s": percentiles([r.first_partial_s for r in results if r.first_partial_s is not None]),
+        "complete_latency_s": percentiles([r.complete_latency_s for r in results]),
+        "baseline_rss_mb": round(usage.baseline_rss_mb, 1),
+        "peak_rss_mb_per_session": round((usage.peak_rss_mb - usage.baseline_rss_mb) / len(results), 2),
+        "cpu_s_per_audio_hour": round(usage.cpu_s / (audio_s / 3600), 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--path", choices=["asr", "gateway"], default="asr")
+    parser.add_argument("--samples", default="samples/*.wav", help="glob of 16 kHz mono WAVs")
+    parser.add_argument("--tile-s", type=float, default=0.0,
+                        help="repeat each recording to this many seconds, for long meetings")
+    parser.add_argument("--concurrency", type=int, default=1, help="sessions streamed at once")
+    parser.add_argument("--pace", choices=["realtime", "asap"], default="asap")
+    parser.add_argument("--frame-ms", type=int, default=20)
+    parser.add_argument("--model", default="tiny", help='Whisper size on CPU, downloaded on first use (needs network once), or "stub" to run offline')
+    parser.add_argument("--stub-rtf", type=float, default=0.05, help="decode cost of --model stub")
+    parser.add_argument("--diarize-rtf", type=float, default=0.01, help="cost of the stub diarization pipeline")
+    parser.add_argument("--no-diarize", dest="diarize", action="store_false")
+    parser.add_argument("--workers", type=int, default=1, help="inference executor threads")
+    parser.add_argument("--output", help="write the JSON report here as well as printing it")
+    args = parser.parse_args()
+
+    configure(args)
+    recordings = load_recordings(args.samples, args.tile_s)
+    run = run_asr_path if args.path == "asr" else run_gateway_path
+    usage = Usage()
+    results = asyncio.run(run(recordings, args, usage))
+    report = build_report(results, usage, args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
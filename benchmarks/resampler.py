@@ -0,0 +1,109 @@
+"""Compare in-process PCM conversion against ffmpeg, in CPU seconds per audio second.
+
+    python -m benchmarks.resampler --rate 48000 --channels 2 --encoding pcm_s16le
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import resource
+import shutil
+import subprocess
+import time
+
+import numpy as np
+
+from gateway.audio_utils import FfmpegTranscoder, PcmTranscoder, _ffmpeg_command
+
+
+def _cpu_seconds() -> float:
+    """CPU time of this process plus reaped children (ffmpeg)."""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def make_frames(seconds: float, rate: int, channels: int, encoding: str, frame_ms: int) -> list[bytes]:
+    t = np.arange(int(seconds * rate)) / rate
+    tone = 0.3 * np.sin(2 * np.pi * 440 * t) + 0.05 * np.random.default_rng(0).standard_normal(len(t))
+    audio = np.repeat(tone[:, None], channels, axis=1)
+    if encoding == "pcm_s16le":
+        data = (audio * 32767).astype("<i2").tobytes()
+    else:
+        data = audio.astype("<f4").tobytes()
+    frame_bytes = rate * frame_ms // 1000 * channels * (2 if encoding == "pcm_s16le" else 4)
+    return [data[i:i + frame_bytes] for i in range(0, len(data), frame_bytes)]
+
+
+async def _discard(_: bytes) -> None:
+    pass
+
+
+async def run_numpy(frames, rate, channels, encoding) -> None:
+    transcoder = PcmTranscoder(rate, channels, encoding, _discard)
+    for frame in frames:
+        await transcoder.feed(frame)
+    await transcoder.close()
+
+
+async def run_ffmpeg_stream(frames, rate, channels, encoding) -> None:
+    transcoder = FfmpegTranscoder(rate, channels, encoding, _discard)
+    await transcoder.start()
+    for frame in frames:
+        await transcoder.feed(frame)
+    await transcoder.close()
+
+
+async def run_ffmpeg_per_frame(frames, rate, channels, encoding) -> None:
+    # The pre-transcoder path: one ffmpeg process per frame
+    cmd = _ffmpeg_command(encoding, rate, channels)
+    for frame in frames:
+        subprocess.run(cmd, input=frame, capture_output=True, check=True)
+
+
+def measure(fn, frames, rate, channels, encoding, audio_seconds) -> dict:
+    cpu, wall = _cpu_seconds(), time.perf_counter()
+    asyncio.run(fn(frames, rate, channels, encoding))
+    cpu, wall = _cpu_seconds() - cpu, time.perf_counter() - wall
+    return {
+        "cpu_s_per_audio_s": round(cpu / audio_seconds, 6),
+        "wall_s_per_audio_s": round(wall / audio_seconds, 6),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rate", type=int, default=48000)
+    parser.add_argument("--channels", type=int, default=2)
+    parser.add_argument("--encoding", choices=["pcm_s16le", "pcm_f32le"], default="pcm_s16le")
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--frame-ms", type=int, default=20)
+    parser.add_argument("--per-frame-seconds", type=float, default=2.0,
+                        help="audio length for the (slow) ffmpeg-per-frame baseline")
+    args = parser.parse_args()
+
+    frames = make_frames(args.seconds, args.rate, args.channels, args.encoding, args.frame_ms)
+    report = {
+        "input": {
+            "rate": args.rate,
+            "channels": args.channels,
+            "encoding": args.encoding,
+            "frame_ms": args.frame_ms,
+        },
+        "numpy_polyphase": measure(run_numpy, frames, args.rate, args.channels, args.encoding, args.seconds),
+    }
+    if shutil.which("ffmpeg"):
+        report["ffmpeg_stream"] = measure(
+            run_ffmpeg_stream, frames, args.rate, args.channels, args.encoding, args.seconds
+        )
+        short = frames[: int(args.per_frame_seconds * 1000 / args.frame_ms)]
+        report["ffmpeg_per_frame"] = measure(
+            run_ffmpeg_per_frame, short, args.rate, args.channels, args.encoding, args.per_frame_seconds
+        )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
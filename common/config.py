@@ -5,7 +5,18 @@ class GatewaySettings(BaseSettings):
     host: str = "0.0.0.0"
     port: int = 8000
     asr_ws_url: str = "ws://asr:8001/stream"
+    asr_ws_urls: list[str] = []  # JSON list; overrides asr_ws_url when set
+    asr_health_interval_s: float = 5.0
+    asr_warm_connections: int = 1  # idle upstream connections kept open per backend
     max_sessions: int = 10
+    admission_queue_size: int = 50  # streams allowed to wait for capacity; 0 rejects at once
+    admission_timeout_s: float = 120.0
+    admission_buffer_bytes: int = 4_000_000  # client audio held per queued stream while watching for a disconnect
+    asr_max_queue_depth: int = 16  # admission pauses while every backend is this backed up
+    asr_max_audio_in_flight_s: float = 60.0
+    pcm_backend: str = "numpy"  # numpy | ffmpeg, for raw PCM that needs converting
+    asr_wire: str = "binary"  # binary | json; binary only with backends that advertise it
+    asr_mux_connections: int = 0  # shared sockets per backend carrying many streams; 0 is one socket per stream
 
     model_config = {"env_prefix": "GATEWAY_"}
 
@@ -16,10 +27,44 @@ class ASRSettings(BaseSettings):
     model_size: str = "large-v3"
     device: str = "auto"
     compute_type: str = "auto"
+    # JSON object of tier -> "size[:compute_type[:device]]", largest first.
+    # Empty means one "default" tier from model_size/compute_type/device.
+    model_tiers: dict[str, str] = {}
+    default_model_tier: str = ""  # first tier when empty
+    model_memory_budget_mb: float = 0.0  # estimated weights kept loaded; 0 is unlimited
+    model_degrade_queue_depth: int = 16  # queue depth that sheds chunks to a smaller tier; 0 never
     hf_token: str = ""
-    chunk_duration_s: float = 3.0
+    warmup_enabled: bool = True  # synthetic decode + diarization passes before reporting ready
+    chunk_duration_s: float = 3.0  # fixed cut length when VAD chunking is off
+    vad_chunking: bool = True  # cut at pauses and skip silence instead of fixed cuts
+    vad_min_chunk_s: float = 1.0
+    vad_max_chunk_s: float = 6.0
+    vad_min_silence_ms: float = 300.0  # pause length that ends a chunk
+    vad_threshold_db: float = -45.0  # frames quieter than this (dBFS) are never speech
+    stream_mode: str = "chunked"  # chunked | local_agreement
+    stream_step_s: float = 1.0  # local_agreement: re-decode interval
+    stream_window_s: float = 8.0  # local_agreement: window length before cutting at committed text
+    stream_prompt_chars: int = 200  # committed text passed as initial_prompt
     diarize_window_s: float = 15.0
+    diarize_step_s: float = 10.0  # window advance; window - step seconds of overlap
     diarize_clustering_threshold: float = 0.55
+    speaker_store_path: str = ""  # .npz of known voice profiles; empty disables identification
+    speaker_match_threshold: float = 0.5  # cosine distance to accept a stored profile
+    speaker_store_max_profiles: int = 5000  # least recently enrolled profiles are dropped beyond this; 0 = no limit
+    speaker_auto_enroll: bool = True  # streaming sessions add unrecognised voices as new profiles
+    batch_speaker_auto_enroll: bool = False  # same for /batch, where one bulk import could flood the store
+    session_memory_budget_mb: float = 64.0  # in-RAM audio per session before spilling to disk
+    spill_dir: str = ""  # defaults to the system temp dir
+    inference_executor: str = "thread"  # thread | process
+    inference_workers: int = 1
+    inference_queue_size: int = 32
+    max_pending_chunks: int = 4  # per-session chunks queued before the receive loop blocks
+    batch_max_size: int = 8  # 1 disables cross-session batching
+    batch_max_wait_ms: float = 20.0
+    mux_window_s: float = 2.0  # audio a multiplexed stream may have in flight before it is throttled
+    batch_max_files: int = 2  # files decoded into memory and transcribed at once by /batch
+    batch_max_upload_mb: float = 512.0  # /batch/file request body limit; larger uploads get 413
+    batch_root: str = ""  # /batch only reads and writes under this directory; empty disables /batch
 
     model_config = {"env_prefix": "ASR_"}
 
@@ -28,8 +73,20 @@ class SLMSettings(BaseSettings):
     host: str = "0.0.0.0"
     port: int = 8002
     ollama_url: str = "http://localhost:11434"
+    ollama_urls: list[str] = []  # JSON list; overrides ollama_url when set
+    ollama_max_concurrency: int = 4  # in-flight requests per backend; match OLLAMA_NUM_PARALLEL
+    ollama_max_connections: int = 32
+    ollama_max_keepalive: int = 16  # idle connections kept open across requests
+    ollama_keepalive_expiry_s: float = 60.0
+    ollama_connect_timeout_s: float = 5.0
+    ollama_timeout_s: float = 120.0
     model_name: str = "phi3"
     temperature: float = 0.3
     max_tokens: int = 2048
+    analysis_window_tokens: int = 2000  # transcript tokens per prompt; longer ones are map-reduced, 0 never
+    analysis_concurrency: int = 4  # windows analyzed at once
+    cache_max_entries: int = 256  # analyses kept in memory; 0 disables caching
+    cache_ttl_s: float = 86400.0
+    cache_path: str = ""  # SQLite file for a persistent second tier; empty keeps memory only
 
     model_config = {"env_prefix": "SLM_"}
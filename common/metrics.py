@@ -0,0 +1,24 @@
+"""Prometheus ``/metrics`` endpoint and bucket layouts shared by the services.
+
+Each service defines its own metrics in its ``metrics`` module, with names
+prefixed by the service, so the three can share one process in tests.
+"""
+
+from __future__ import annotations
+
+from fastapi import FastAPI, Response
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+
+# Seconds, from a fast relay hop up to a decode stuck behind a full queue
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Compute time over audio time; above 1.0 the decoder is falling behind
+RTF_BUCKETS = (0.02, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 5.0)
+TOKENS_PER_SECOND_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 250, 500)
+
+
+def mount_metrics(app: FastAPI) -> None:
+    """Serve the default registry in the Prometheus text format at ``/metrics``."""
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics() -> Response:
+        return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
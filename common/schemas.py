@@ -24,6 +24,10 @@ class StartMessage(BaseModel):
     diarize: bool = True
     min_speakers: Optional[int] = None
     max_speakers: Optional[int] = None
+    tenant: Optional[str] = None  # fair-share key for gateway admission
+    meeting_series: Optional[str] = None  # recurring meeting key for speaker-count hints
+    model_tier: Optional[str] = None  # ASR model tier; the service default when unset
+    wire: str = "json"  # json | binary (common.wire framing), gateway <-> ASR only
 
 
 class AudioMessage(BaseModel):
@@ -55,6 +59,8 @@ class TranscriptSegment(BaseModel):
 class ServerMessageType(str, Enum):
     segment = "segment"
     transcript_complete = "transcript_complete"
+    queued = "queued"
+    batch_summary = "batch_summary"
     error = "error"
 
 
@@ -71,12 +77,47 @@ class TranscriptCompleteMessage(BaseModel):
     speaker_map: dict[str, str] = {}
 
 
+class QueuedMessage(BaseModel):
+    type: ServerMessageType = ServerMessageType.queued
+    stream_id: str
+    position: int  # 1-based place in the gateway admission queue
+
+
 class ErrorMessage(BaseModel):
     type: ServerMessageType = ServerMessageType.error
     stream_id: str
     detail: str
 
 
+# --- ASR batch transcription ---
+
+class BatchFile(BaseModel):
+    path: str  # on the ASR host
+    stream_id: Optional[str] = None  # defaults to the file name without extension
+    language: Optional[str] = None
+    min_speakers: Optional[int] = None
+    max_speakers: Optional[int] = None
+
+
+class BatchRequest(BaseModel):
+    files: list[BatchFile] = []
+    directory: Optional[str] = None  # every audio file directly inside it
+    manifest: Optional[str] = None  # one path or BatchFile JSON object per line
+    language: Optional[str] = None  # default for files that do not set one
+    model_tier: Optional[str] = None
+    diarize: bool = True
+    output_dir: Optional[str] = None  # also write <stream_id>.json here
+
+
+class BatchSummaryMessage(BaseModel):
+    type: ServerMessageType = ServerMessageType.batch_summary
+    files: int
+    failed: int
+    audio_s: float
+    wall_s: float
+    audio_hours_per_wall_hour: float
+
+
 # --- SLM request / response ---
 
 class MeetingContext(BaseModel):
@@ -103,3 +144,21 @@ class AnalyzeResponse(BaseModel):
     key_points: list[str]
     action_items: list[str]
     risks: list[RiskItem]
+
+
+class AnalysisEventType(str, Enum):
+    summary = "summary"
+    key_point = "key_point"
+    action_item = "action_item"
+    risk = "risk"
+    complete = "complete"
+    error = "error"
+
+
+class AnalysisEvent(BaseModel):
+    type: AnalysisEventType
+    stream_id: str
+    text: Optional[str] = None  # summary, key_point, action_item
+    risk: Optional[RiskItem] = None
+    result: Optional[AnalyzeResponse] = None  # complete: the full analysis
+    detail: Optional[str] = None  # error
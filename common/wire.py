@@ -0,0 +1,183 @@
+"""Binary framing for the gateway <-> ASR hop.
+
+Every binary WebSocket frame is a 6-byte header followed by a payload:
+
+    version  u8   WIRE_VERSION
+    kind     u8   FrameKind
+    channel  u32  which stream on the connection the frame belongs to
+
+Audio is raw 16 kHz mono s16le, segments are a packed struct, and any other
+schema message travels as its JSON in a ``json`` frame. Text frames on the
+same socket are always plain JSON schema messages, which keeps the JSON
+protocol in ``common.schemas`` working as the fallback.
+
+On a multiplexed socket (the ASR ``/mux`` endpoint) each stream is a
+channel opened by a ``start`` frame. The ASR side grants audio ``credit``
+in bytes as its session consumes audio, and the sender never has more
+than that outstanding, so one slow stream cannot stall the others.
+Either side ends a channel with ``close``: the ASR service once the
+transcript is complete, the gateway to abandon a stream.
+"""
+
+from __future__ import annotations
+
+import math
+import struct
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Awaitable, Callable
+
+from pydantic import BaseModel
+
+from common.schemas import SegmentMessage, SegmentStatus, TranscriptSegment
+
+WIRE_VERSION = 1
+WIRE_FORMATS = ["json", "binary", "mux"]  # advertised by the ASR service on /health
+
+HEADER = struct.Struct("!BBI")
+CREDIT = struct.Struct("!I")
+# status, segment_id, start, end, confidence (NaN for none), speaker byte length
+SEGMENT = struct.Struct("!BIdddH")
+
+_STATUS_CODES = {SegmentStatus.partial: 0, SegmentStatus.final: 1}
+_STATUSES = {code: status for status, code in _STATUS_CODES.items()}
+
+
+class FrameKind(IntEnum):
+    audio = 1  # payload: PCM
+    end = 2  # no payload
+    segment = 3  # payload: SEGMENT + speaker + text, UTF-8
+    json = 4  # payload: any other schema message as JSON
+    start = 5  # payload: StartMessage JSON; opens a channel on a mux socket
+    credit = 6  # payload: CREDIT, audio bytes the sender may add to the channel
+    close = 7  # no payload; the channel is finished or abandoned
+
+
+class WireError(ValueError):
+    """A frame or payload that does not decode; ``channel`` is set when the header did."""
+
+    def __init__(self, message: str, channel: int | None = None):
+        super().__init__(message)
+        self.channel = channel
+
+
+@dataclass
+class Frame:
+    kind: FrameKind
+    channel: int
+    payload: memoryview
+
+
+def encode_frame(kind: FrameKind, channel: int, payload: bytes = b"") -> bytes:
+    return HEADER.pack(WIRE_VERSION, kind, channel) + payload
+
+
+def decode_frame(data: bytes) -> Frame:
+    """Split a binary frame into header fields and a zero-copy payload view."""
+    if len(data) < HEADER.size:
+        raise WireError("Frame shorter than header")
+    version, kind, channel = HEADER.unpack_from(data)
+    if version != WIRE_VERSION:
+        raise WireError(f"Unsupported wire version {version}", channel)
+    try:
+        kind = FrameKind(kind)
+    except ValueError:
+        raise WireError(f"Unknown frame kind {kind}", channel) from None
+    return Frame(kind, channel, memoryview(data)[HEADER.size:])
+
+
+def encode_credit(channel: int, nbytes: int) -> bytes:
+    return HEADER.pack(WIRE_VERSION, FrameKind.credit, channel) + CREDIT.pack(nbytes)
+
+
+def decode_credit(payload: memoryview) -> int:
+    try:
+        return CREDIT.unpack_from(payload)[0]
+    except struct.error:
+        raise WireError("Credit payload too short") from None
+
+
+def encode_segment(channel: int, segment: TranscriptSegment) -> bytes:
+    speaker = segment.speaker.encode() if segment.speaker else b""
+    confidence = math.nan if segment.confidence is None else segment.confidence
+    return b"".join((
+        HEADER.pack(WIRE_VERSION, FrameKind.segment, channel),
+        SEGMENT.pack(
+            _STATUS_CODES[segment.status],
+            segment.segment_id,
+            segment.start_time,
+            segment.end_time,
+            confidence,
+            len(speaker),
+        ),
+        speaker,
+        segment.text.encode(),
+    ))
+
+
+def decode_segment(payload: memoryview) -> TranscriptSegment:
+    try:
+        status, segment_id, start, end, confidence, speaker_len = SEGMENT.unpack_from(payload)
+        text_at = SEGMENT.size + speaker_len
+        return TranscriptSegment(
+            status=_STATUSES[status],
+            segment_id=segment_id,
+            start_time=start,
+            end_time=end,
+            text=bytes(payload[text_at:]).decode(),
+            speaker=bytes(payload[SEGMENT.size:text_at]).decode() or None,
+            confidence=None if math.isnan(confidence) else confidence,
+        )
+    except (struct.error, KeyError, ValueError) as exc:
+        raise WireError(f"Malformed segment payload: {exc}") from None
+
+
+def segment_timing(payload: memoryview) -> tuple[SegmentStatus, float]:
+    """Status and end time of a packed segment, without decoding the text."""
+    try:
+        status, _, _, end, _, _ = SEGMENT.unpack_from(payload)
+        return _STATUSES[status], end
+    except (struct.error, KeyError) as exc:
+        raise WireError(f"Malformed segment payload: {exc}") from None
+
+
+def frame_to_json(frame: Frame, stream_id: str) -> str | None:
+    """The JSON text message a server frame stands for, for clients that speak JSON."""
+    if frame.kind == FrameKind.segment:
+        return SegmentMessage(stream_id=stream_id, segment=decode_segment(frame.payload)).model_dump_json()
+    if frame.kind == FrameKind.json:
+        return bytes(frame.payload).decode()
+    return None
+
+
+class JsonWriter:
+    """Sends server messages as JSON text frames, the default wire format."""
+
+    binary = False
+
+    def __init__(self, send_text: Callable[[str], Awaitable[None]], stream_id: str):
+        self._send_text = send_text
+        self.stream_id = stream_id
+
+    async def segment(self, segment: TranscriptSegment) -> None:
+        await self._send_text(SegmentMessage(stream_id=self.stream_id, segment=segment).model_dump_json())
+
+    async def message(self, message: BaseModel) -> None:
+        await self._send_text(message.model_dump_json())
+
+
+class BinaryWriter:
+    """Sends server messages as binary frames on one channel."""
+
+    binary = True
+
+    def __init__(self, send_bytes: Callable[[bytes], Awaitable[None]], stream_id: str, channel: int = 0):
+        self._send_bytes = send_bytes
+        self.stream_id = stream_id
+        self.channel = channel
+
+    async def segment(self, segment: TranscriptSegment) -> None:
+        await self._send_bytes(encode_segment(self.channel, segment))
+
+    async def message(self, message: BaseModel) -> None:
+        await self._send_bytes(encode_frame(FrameKind.json, self.channel, message.model_dump_json().encode()))
@@ -1,6 +1,24 @@
 from __future__ import annotations
 
+import asyncio
+import logging
+import math
 import subprocess
+from typing import Awaitable, Callable
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TARGET_SAMPLE_RATE = 16000
+
+# Raw sample formats handled in-process, by encoding name
+PCM_DTYPES = {
+    "pcm_s16le": np.dtype("<i2"),
+    "pcm_f32le": np.dtype("<f4"),
+}
+
+Sink = Callable[[bytes], Awaitable[None]]
 
 
 def normalize_audio(
@@ -11,25 +29,18 @@ def normalize_audio(
 ) -> bytes:
     """Convert incoming audio to 16kHz mono 16-bit PCM.
 
-    If the audio is already in the target format, return as-is.
-    Otherwise shell out to ffmpeg for conversion.
+    If the audio is already in the target format, return as-is. Raw PCM is
+    converted in-process; anything else shells out to ffmpeg. This is the
+    one-shot form — streams should use ``create_transcoder`` so converter
+    state carries across frames.
     """
     if input_sample_rate == 16000 and input_channels == 1 and input_encoding == "pcm_s16le":
         return data
 
-    cmd = [
-        "ffmpeg",
-        "-hide_banner",
-        "-loglevel", "error",
-        "-f", _ffmpeg_format(input_encoding),
-        "-ar", str(input_sample_rate),
-        "-ac", str(input_channels),
-        "-i", "pipe:0",
-        "-f", "s16le",
-        "-ar", "16000",
-        "-ac", "1",
-        "pipe:1",
-    ]
+    if input_encoding in PCM_DTYPES:
+        return PcmTranscoder(input_sample_rate, input_channels, input_encoding).convert(data)
+
+    cmd = _ffmpeg_command(input_encoding, input_sample_rate, input_channels)
     result = subprocess.run(cmd, input=data, capture_output=True, check=True)
     return result.stdout
 
@@ -43,3 +54,217 @@ def _ffmpeg_format(encoding: str) -> str:
         "mp3": "mp3",
     }
     return mapping.get(encoding, "s16le")
+
+
+def _ffmpeg_command(encoding: str, sample_rate: int, channels: int) -> list[str]:
+    fmt = _ffmpeg_format(encoding)
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-f", fmt]
+    # Containers carry their own rate and layout
+    if fmt in ("s16le", "f32le"):
+        cmd += ["-ar", str(sample_rate), "-ac", str(channels)]
+    cmd += [
+        "-i", "pipe:0",
+        "-f", "s16le",
+        "-ar", str(TARGET_SAMPLE_RATE),
+        "-ac", "1",
+        "pipe:1",
+    ]
+    return cmd
+
+
+class PolyphaseResampler:
+    """Streaming polyphase resampler for mono float32 audio.
+
+    The rate ratio is reduced to ``up/down`` and a Kaiser-windowed sinc
+    low-pass is split into ``up`` phases. The last ``taps - 1`` input samples
+    and the global output index carry across calls, so frame boundaries are
+    seamless and output length never drifts. Adds a fixed delay of half the
+    filter length (``delay_seconds``, under 1 ms for common rates).
+    """
+
+    ZERO_CROSSINGS = 10
+    KAISER_BETA = 5.0
+
+    def __init__(self, input_rate: int, output_rate: int = TARGET_SAMPLE_RATE):
+        g = math.gcd(input_rate, output_rate)
+        self.up = output_rate // g
+        self.down = input_rate // g
+
+        half = self.ZERO_CROSSINGS * max(self.up, self.down)
+        self.delay_seconds = half / (input_rate * self.up)
+        n = np.arange(-half, half + 1)
+        cutoff = 1.0 / max(self.up, self.down)
+        h = self.up * cutoff * np.sinc(cutoff * n) * np.kaiser(len(n), self.KAISER_BETA)
+
+        self.taps = -(-len(h) // self.up)
+        h = np.pad(h, (0, self.taps * self.up - len(h)))
+        # Row p holds h[p], h[p + up], ...; reversed so it lines up with input windows
+        self._phases = h.reshape(self.taps, self.up).T[:, ::-1].astype(np.float32)
+
+        self._history = np.zeros(self.taps - 1, dtype=np.float32)
+        self._consumed = 0  # input samples seen so far
+        self._produced = 0  # output samples emitted so far
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        if len(samples) == 0:
+            return np.zeros(0, dtype=np.float32)
+        x = np.concatenate([self._history, samples.astype(np.float32, copy=False)])
+        total = self._consumed + len(samples)
+        # Output n needs input sample (n * down) // up, which must already exist
+        end = (total * self.up - 1) // self.down + 1
+        n = np.arange(self._produced, end, dtype=np.int64)
+
+        t = n * self.down
+        # Index in x of the oldest sample under each output's filter window
+        first = t // self.up - self._consumed
+        windows = np.lib.stride_tricks.sliding_window_view(x, self.taps)[first]
+        out = np.einsum("ij,ij->i", windows, self._phases[t % self.up])
+
+        self._history = x[len(x) - (self.taps - 1):]
+        self._consumed = total
+        self._produced = end
+        return out
+
+
+class PcmTranscoder:
+    """In-process conversion of raw PCM frames to 16 kHz mono s16le.
+
+    Handles dtype conversion, channel downmix and resampling with NumPy.
+    Bytes that do not make up a whole multi-channel frame are carried over
+    to the next call.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = 16000,
+        channels: int = 1,
+        encoding: str = "pcm_s16le",
+        sink: Sink | None = None,
+    ):
+        self.sample_rate = sample_rate
+        self.channels = max(1, channels)
+        self.dtype = PCM_DTYPES[encoding]
+        self.sink = sink
+        self._frame_bytes = self.dtype.itemsize * self.channels
+        self._pending = b""
+        self._passthrough = (
+            sample_rate == TARGET_SAMPLE_RATE and self.channels == 1 and encoding == "pcm_s16le"
+        )
+        self._resampler = (
+            PolyphaseResampler(sample_rate) if sample_rate != TARGET_SAMPLE_RATE else None
+        )
+
+    def convert(self, data: bytes) -> bytes:
+        data = self._pending + data
+        usable = len(data) - len(data) % self._frame_bytes
+        data, self._pending = data[:usable], data[usable:]
+        if self._passthrough or not data:
+            return data
+
+        samples = np.frombuffer(data, dtype=self.dtype)
+        if self.dtype.kind == "i":
+            samples = samples.astype(np.float32) / 32768.0
+        if self.channels > 1:
+            samples = samples.reshape(-1, self.channels).mean(axis=1, dtype=np.float32)
+        if self._resampler is not None:
+            samples = self._resampler.process(samples)
+        return _float_to_s16(samples)
+
+    async def feed(self, data: bytes) -> None:
+        out = self.convert(data)
+        if out:
+            await self.sink(out)
+
+    async def close(self) -> None:
+        self._pending = b""
+
+    def abort(self) -> None:
+        self._pending = b""
+
+
+class FfmpegTranscoder:
+    """One long-lived ffmpeg process per stream, fed through pipes.
+
+    Suits container formats (ogg, mp3, wav) whose packets span WebSocket
+    frames. Output is forwarded to the sink from a background reader as soon
+    as ffmpeg produces it.
+    """
+
+    READ_SIZE = 4096
+
+    def __init__(self, sample_rate: int, channels: int, encoding: str, sink: Sink):
+        self.cmd = _ffmpeg_command(encoding, sample_rate, channels)
+        self.sink = sink
+        self._proc: asyncio.subprocess.Process | None = None
+        self._reader: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        self._proc = await asyncio.create_subprocess_exec(
+            *self.cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+        )
+        self._reader = asyncio.create_task(self._pump())
+
+    async def _pump(self) -> None:
+        carry = b""
+        while True:
+            chunk = await self._proc.stdout.read(self.READ_SIZE)
+            if not chunk:
+                break
+            # Only forward whole 16-bit samples
+            chunk = carry + chunk
+            usable = len(chunk) - len(chunk) % 2
+            chunk, carry = chunk[:usable], chunk[usable:]
+            if chunk:
+                await self.sink(chunk)
+
+    async def feed(self, data: bytes) -> None:
+        if self._reader is not None and self._reader.done():
+            self._reader.result()
+            raise RuntimeError("ffmpeg transcoder exited")
+        self._proc.stdin.write(data)
+        await self._proc.stdin.drain()
+
+    async def close(self) -> None:
+        """Signal end of input and wait until all converted audio is forwarded."""
+        if self._proc is None:
+            return
+        self._proc.stdin.close()
+        await self._reader
+        returncode = await self._proc.wait()
+        if returncode != 0:
+            logger.warning("ffmpeg exited with code %d", returncode)
+        self._proc = None
+
+    def abort(self) -> None:
+        if self._reader is not None:
+            self._reader.cancel()
+        if self._proc is not None and self._proc.returncode is None:
+            self._proc.kill()
+        self._proc = None
+
+
+async def create_transcoder(
+    sample_rate: int,
+    channels: int,
+    encoding: str,
+    sink: Sink,
+    pcm_backend: str = "numpy",
+) -> PcmTranscoder | FfmpegTranscoder:
+    """Pick a transcoder for a stream's declared format and start it.
+
+    Raw PCM is converted in-process unless ``pcm_backend`` is "ffmpeg", which
+    trades a process per stream for less CPU on the event loop. Audio already
+    at 16 kHz mono s16le always passes straight through.
+    """
+    passthrough = sample_rate == TARGET_SAMPLE_RATE and channels == 1 and encoding == "pcm_s16le"
+    if encoding in PCM_DTYPES and (pcm_backend == "numpy" or passthrough):
+        return PcmTranscoder(sample_rate, channels, encoding, sink)
+    transcoder = FfmpegTranscoder(sample_rate, channels, encoding, sink)
+    await transcoder.start()
+    return transcoder
+
+
+def _float_to_s16(samples: np.ndarray) -> bytes:
+    return np.clip(np.rint(samples * 32768.0), -32768, 32767).astype("<i2").tobytes()
@@ -0,0 +1,233 @@
+"""Upstream handles for one client stream: its own ASR socket, or a channel on a shared one.
+
+Both expose the same calls to the audio endpoint: ``start``, ``send_audio``,
+``end``, async iteration over the JSON messages meant for the client, and
+``close``. Iteration records relay lag for each message once the consumer
+asks for the next one, i.e. after it has passed the message on.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+import time
+from bisect import bisect_left
+from typing import AsyncIterator
+
+import websockets
+
+from common.schemas import EndMessage, StartMessage
+from common.wire import FrameKind, WireError, decode_credit, decode_frame, encode_frame, frame_to_json, segment_timing
+from gateway.metrics import RELAY_LAG, SEGMENT_LATENCY
+
+logger = logging.getLogger(__name__)
+
+BYTES_PER_SECOND = 16000 * 2  # upstream audio is 16 kHz mono s16le
+CLOCK_HORIZON_S = 120.0  # segments ending further back than this are not timed
+
+
+class AudioClock:
+    """When each stretch of a stream's audio went upstream, to time the segments that come back."""
+
+    def __init__(self, horizon_s: float = CLOCK_HORIZON_S):
+        self.horizon_s = horizon_s
+        self.sent_s = 0.0
+        self._start_s = 0.0  # audio before this has been trimmed
+        self._ends: list[float] = []  # audio position after each send
+        self._times: list[float] = []
+
+    def sent(self, nbytes: int) -> None:
+        self.sent_s += nbytes / BYTES_PER_SECOND
+        self._ends.append(self.sent_s)
+        self._times.append(time.monotonic())
+        if self._ends[0] < self.sent_s - 2 * self.horizon_s:
+            # Trim in bulk so each send stays amortised O(1)
+            keep = bisect_left(self._ends, self.sent_s - self.horizon_s)
+            self._start_s = self._ends[keep - 1]
+            del self._ends[:keep], self._times[:keep]
+
+    def latency(self, end_s: float) -> float | None:
+        """Seconds since the audio up to ``end_s`` was sent, or None if it is out of range."""
+        if not self._ends or end_s <= self._start_s:
+            return None
+        i = min(bisect_left(self._ends, end_s), len(self._ends) - 1)
+        return time.monotonic() - self._times[i]
+
+    def observe_segment(self, payload: memoryview) -> None:
+        status, end_s = segment_timing(payload)
+        latency = self.latency(end_s)
+        if latency is not None:
+            SEGMENT_LATENCY.labels(status.value).observe(latency)
+
+
+class DirectStream:
+    """A stream with an ASR socket to itself, in JSON or binary framing."""
+
+    def __init__(self, ws, stream_id: str, binary: bool):
+        self.ws = ws
+        self.stream_id = stream_id
+        self.binary = binary
+        self.clock = AudioClock()
+
+    async def start(self, start: StartMessage) -> None:
+        await self.ws.send(start.model_copy(update={"wire": "binary" if self.binary else "json"}).model_dump_json())
+
+    async def send_audio(self, pcm: bytes) -> None:
+        await self.ws.send(encode_frame(FrameKind.audio, 0, pcm) if self.binary else pcm)
+        self.clock.sent(len(pcm))
+
+    async def end(self) -> None:
+        if self.binary:
+            await self.ws.send(encode_frame(FrameKind.end, 0))
+        else:
+            await self.ws.send(EndMessage(stream_id=self.stream_id).model_dump_json())
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        async for message in self.ws:
+            received_at = time.monotonic()
+            if isinstance(message, str):
+                # Segment latency is only timed on the binary wire
+                text = message
+            else:
+                frame = decode_frame(message)
+                if frame.kind == FrameKind.segment:
+                    self.clock.observe_segment(frame.payload)
+                text = frame_to_json(frame, self.stream_id)
+                if text is None:
+                    continue
+            yield text
+            RELAY_LAG.observe(time.monotonic() - received_at)
+
+    async def close(self) -> None:
+        await self.ws.close()
+
+
+class MuxStream:
+    """One channel on a ``MuxConnection``.
+
+    ``send_audio`` waits while the ASR side has not granted credit, which
+    throttles this stream alone; the shared socket keeps flowing.
+    """
+
+    def __init__(self, connection: MuxConnection, channel: int, stream_id: str):
+        self.connection = connection
+        self.channel = channel
+        self.stream_id = stream_id
+        self.credit = 0
+        self.finished = False
+        self._credit_granted = asyncio.Event()
+        self._inbox: asyncio.Queue[tuple[float, str] | None] = asyncio.Queue()
+        self.clock = AudioClock()
+
+    async def start(self, start: StartMessage) -> None:
+        payload = start.model_copy(update={"wire": "binary"}).model_dump_json().encode()
+        await self.connection.send(encode_frame(FrameKind.start, self.channel, payload))
+
+    async def send_audio(self, pcm: bytes) -> None:
+        while pcm:
+            while self.credit <= 0:
+                if self.finished:
+                    raise RuntimeError("ASR closed the stream")
+                self._credit_granted.clear()
+                await self._credit_granted.wait()
+            # The ASR side drops a channel that sends past its credit
+            piece, pcm = pcm[: self.credit], pcm[self.credit :]
+            self.credit -= len(piece)
+            await self.connection.send(encode_frame(FrameKind.audio, self.channel, piece))
+            self.clock.sent(len(piece))
+
+    async def end(self) -> None:
+        await self.connection.send(encode_frame(FrameKind.end, self.channel))
+
+    def deliver(self, frame) -> None:
+        """Handle a frame the connection read for this channel."""
+        if frame.kind == FrameKind.credit:
+            self.credit += decode_credit(frame.payload)
+            self._credit_granted.set()
+        elif frame.kind == FrameKind.close:
+            self.finish()
+        else:
+            if frame.kind == FrameKind.segment:
+                self.clock.observe_segment(frame.payload)
+            text = frame_to_json(frame, self.stream_id)
+            if text is not None:
+                self._inbox.put_nowait((time.monotonic(), text))
+
+    def finish(self) -> None:
+        if not self.finished:
+            self.finished = True
+            self._inbox.put_nowait(None)
+            self._credit_granted.set()
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        while True:
+            item = await self._inbox.get()
+            if item is None:
+                return
+            received_at, text = item
+            yield text
+            RELAY_LAG.observe(time.monotonic() - received_at)
+
+    async def close(self) -> None:
+        try:
+            if not self.finished:
+                # Tell the ASR side to drop the session; the socket may be gone already
+                try:
+                    await self.connection.send(encode_frame(FrameKind.close, self.channel))
+                except websockets.ConnectionClosed:
+                    pass
+                self.finish()
+        finally:
+            # Always give back the channel, whatever the send raised
+            self.connection.streams.pop(self.channel, None)
+
+
+class MuxConnection:
+    """A long-lived socket to an ASR ``/mux`` endpoint carrying many streams."""
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.streams: dict[int, MuxStream] = {}
+        self._channels = itertools.count(1)
+        self._reader = asyncio.create_task(self._read_loop())
+
+    @property
+    def open(self) -> bool:
+        return not self._reader.done()
+
+    def open_stream(self, stream_id: str) -> MuxStream:
+        stream = MuxStream(self, next(self._channels), stream_id)
+        self.streams[stream.channel] = stream
+        return stream
+
+    async def send(self, data: bytes) -> None:
+        await self.ws.send(data)
+
+    async def _read_loop(self) -> None:
+        try:
+            async for message in self.ws:
+                if isinstance(message, str):
+                    logger.warning("Unexpected text frame on mux connection: %s", message[:200])
+                    continue
+                try:
+                    frame = decode_frame(message)
+                    stream = self.streams.get(frame.channel)
+                    if stream is not None:
+                        stream.deliver(frame)
+                except WireError as exc:
+                    # One bad frame is not worth every stream on the socket
+                    logger.warning("Skipping bad frame on mux connection: %s", exc)
+        except websockets.ConnectionClosed:
+            pass
+        except Exception:
+            logger.exception("Mux connection reader failed")
+        finally:
+            if self.streams:
+                logger.warning("Mux connection lost with %d streams open", len(self.streams))
+            for stream in list(self.streams.values()):
+                stream.finish()
+
+    async def close(self) -> None:
+        self._reader.cancel()
+        await self.ws.close()
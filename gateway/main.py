@@ -3,35 +3,69 @@ from __future__ import annotations
 import asyncio
 import json
 import logging
+from collections import deque
 
 import websockets
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 
 from common.config import GatewaySettings
+from common.metrics import mount_metrics
 from common.schemas import (
     ClientMessageType,
     ErrorMessage,
+    QueuedMessage,
     StartMessage,
 )
-from gateway.audio_utils import normalize_audio
+from gateway.audio_utils import create_transcoder
 from gateway.session import SessionManager
+from gateway.upstream import AsrPool
 
 logger = logging.getLogger(__name__)
 
 settings = GatewaySettings()
 app = FastAPI(title="Smart Transcriptor Gateway")
-manager = SessionManager(max_sessions=settings.max_sessions)
+mount_metrics(app)
+pool = AsrPool(
+    settings.asr_ws_urls or [settings.asr_ws_url],
+    health_interval_s=settings.asr_health_interval_s,
+    warm_connections=settings.asr_warm_connections,
+    max_queue_depth=settings.asr_max_queue_depth,
+    max_audio_in_flight_s=settings.asr_max_audio_in_flight_s,
+    mux_connections=settings.asr_mux_connections,
+)
+manager = SessionManager(
+    max_sessions=settings.max_sessions,
+    max_queue=settings.admission_queue_size,
+    queue_timeout_s=settings.admission_timeout_s,
+    has_capacity=pool.has_capacity,
+)
+
+
+@app.on_event("startup")
+async def startup():
+    await pool.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await pool.stop()
 
 
 @app.get("/health")
 async def health():
-    return {"status": "ok", "active_sessions": manager.active_count}
+    return {
+        "status": "ok",
+        "active_sessions": manager.active_count,
+        "queued_sessions": manager.queued_count,
+        "asr_backends": pool.stats(),
+    }
 
 
 @app.websocket("/audio")
 async def audio_endpoint(ws: WebSocket):
     await ws.accept()
     stream_id: str | None = None
+    backend = None
     try:
         # Expect a start message first (text frame)
         raw = await ws.receive_text()
@@ -44,35 +78,46 @@ async def audio_endpoint(ws: WebSocket):
         start = StartMessage(**msg)
         stream_id = start.stream_id
 
-        session = await manager.create(
+        async def on_queued(position: int) -> None:
+            await ws.send_text(QueuedMessage(stream_id=stream_id, position=position).model_dump_json())
+
+        held: deque[dict] = deque()  # client messages received while queued
+        session = await _admit(
+            ws,
+            held,
             stream_id=stream_id,
             client_ws=ws,
+            on_queued=on_queued,
+            tenant=start.tenant,
             sample_rate=start.sample_rate,
             channels=start.channels,
             encoding=start.encoding,
             language=start.language,
         )
 
-        # Open upstream connection to ASR service
-        asr_ws = await websockets.connect(
-            settings.asr_ws_url,
-            ping_interval=30,
-            ping_timeout=300,
-            close_timeout=300,
-        )
-        session.asr_ws = asr_ws
+        # Open the stream on the least-loaded ASR backend
+        backend, upstream = await pool.open_stream(stream_id, binary=settings.asr_wire == "binary")
+        session.asr_ws = upstream
+        relay_task: asyncio.Task | None = None
+        relay_done = False
+        try:
+            await upstream.start(start)
 
-        # Forward start message to ASR
-        await asr_ws.send(raw)
+            # Converts client audio to 16 kHz mono s16le and forwards it to ASR
+            session.transcoder = await create_transcoder(
+                session.sample_rate,
+                session.channels,
+                session.encoding,
+                upstream.send_audio,
+                pcm_backend=settings.pcm_backend,
+            )
 
-        # Relay ASR responses back to client in background
-        relay_task = asyncio.create_task(_relay_asr_to_client(asr_ws, ws, stream_id))
+            # Relay ASR responses back to client in background
+            relay_task = asyncio.create_task(_relay_asr_to_client(upstream, ws, stream_id))
 
-        # Main loop: receive audio/end from client
-        relay_done = False
-        try:
+            # Main loop: receive audio/end from client
             while True:
-                message = await ws.receive()
+                message = held.popleft() if held else await ws.receive()
                 if message.get("type") == "websocket.disconnect":
                     break
 
@@ -80,7 +125,8 @@ async def audio_endpoint(ws: WebSocket):
                     data = json.loads(message["text"])
                     if data.get("type") == ClientMessageType.end:
                         logger.info("End received, forwarding to ASR: %s", stream_id)
-                        await asr_ws.send(message["text"])
+                        await session.transcoder.close()
+                        await upstream.end()
                         # Wait for ASR to finish processing and relay all responses
                         logger.info("Waiting for ASR relay to complete: %s", stream_id)
                         await relay_task
@@ -88,22 +134,17 @@ async def audio_endpoint(ws: WebSocket):
                         logger.info("Relay complete: %s", stream_id)
                         break
                 elif "bytes" in message:
-                    await asr_ws.send(
-                        normalize_audio(
-                            message["bytes"],
-                            input_sample_rate=session.sample_rate,
-                            input_channels=session.channels,
-                            input_encoding=session.encoding,
-                        )
-                    )
+                    await session.transcoder.feed(message["bytes"])
         finally:
-            if not relay_done:
+            if session.transcoder is not None:
+                session.transcoder.abort()
+            if relay_task is not None and not relay_done:
                 relay_task.cancel()
                 try:
                     await relay_task
                 except asyncio.CancelledError:
                     pass
-            await asr_ws.close()
+            await upstream.close()
 
     except WebSocketDisconnect:
         logger.info("Client disconnected: %s", stream_id)
@@ -113,18 +154,50 @@ async def audio_endpoint(ws: WebSocket):
     except Exception:
         logger.exception("Unexpected error in audio endpoint")
     finally:
+        if backend is not None:
+            pool.release(backend)
         if stream_id:
             await manager.remove(stream_id)
 
 
-async def _relay_asr_to_client(asr_ws, client_ws: WebSocket, stream_id: str):
+async def _admit(ws: WebSocket, held: deque, **kwargs):
+    """``manager.create``, reading the client meanwhile so a disconnect gives up its place.
+
+    Messages that arrive while the stream is queued are kept in ``held`` for
+    the main loop. Past ``admission_buffer_bytes`` the client is no longer
+    read, leaving it to back-pressure, and only the queue timeout applies.
+    """
+    admission = asyncio.create_task(manager.create(**kwargs))
+    watch = asyncio.create_task(_watch_queued_client(ws, held, settings.admission_buffer_bytes))
+    try:
+        await asyncio.wait({admission, watch}, return_when=asyncio.FIRST_COMPLETED)
+        if not admission.done() and watch.result():
+            raise WebSocketDisconnect()
+        return await admission
+    finally:
+        admission.cancel()
+        watch.cancel()
+        # Let a cancelled admission leave the queue before the caller moves on
+        await asyncio.gather(admission, watch, return_exceptions=True)
+
+
+async def _watch_queued_client(ws: WebSocket, held: deque, limit_bytes: int) -> bool:
+    """Receive into ``held`` until ``limit_bytes``; True if the client disconnected first."""
+    size = 0
+    while size < limit_bytes:
+        message = await ws.receive()
+        held.append(message)
+        if message.get("type") == "websocket.disconnect":
+            return True
+        size += len(message.get("bytes") or message.get("text") or "")
+    return False
+
+
+async def _relay_asr_to_client(upstream, client_ws: WebSocket, stream_id: str):
     """Forward messages from ASR service back to the client."""
     try:
-        async for message in asr_ws:
-            if isinstance(message, str):
-                await client_ws.send_text(message)
-            else:
-                await client_ws.send_bytes(message)
+        async for message in upstream:
+            await client_ws.send_text(message)
     except websockets.ConnectionClosed:
         logger.info("ASR connection closed for %s", stream_id)
     except Exception:
@@ -0,0 +1,19 @@
+"""Prometheus metrics for the gateway."""
+
+from __future__ import annotations
+
+from prometheus_client import Histogram
+
+from common.metrics import LATENCY_BUCKETS
+
+RELAY_LAG = Histogram(
+    "gateway_relay_lag_seconds",
+    "Time from a message arriving from ASR to it being sent to the client",
+    buckets=LATENCY_BUCKETS,
+)
+SEGMENT_LATENCY = Histogram(
+    "gateway_segment_latency_seconds",
+    "Time from forwarding the end of a segment's audio to ASR to receiving the segment",
+    ["status"],
+    buckets=LATENCY_BUCKETS,
+)
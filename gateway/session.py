@@ -2,9 +2,12 @@ from __future__ import annotations
 
 import asyncio
 import logging
+import time
 from dataclasses import dataclass, field
+from typing import Awaitable, Callable
 
 from fastapi import WebSocket
+from fastapi.websockets import WebSocketState
 
 logger = logging.getLogger(__name__)
 
@@ -13,34 +16,110 @@ logger = logging.getLogger(__name__)
 class Session:
     stream_id: str
     client_ws: WebSocket
-    asr_ws: object | None = None  # websockets client connection
+    asr_ws: object | None = None  # upstream handle from AsrPool.open_stream
+    transcoder: object | None = None  # gateway.audio_utils transcoder for this stream
     sample_rate: int = 16000
     channels: int = 1
     encoding: str = "pcm_s16le"
     language: str | None = None
+    tenant: str | None = None
+
+
+@dataclass
+class _Waiter:
+    session: Session
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
 
 
 class SessionManager:
-    def __init__(self, max_sessions: int = 10) -> None:
+    """Tracks active sessions and admits new ones as capacity allows.
+
+    When the gateway is full, new streams wait in a bounded queue rather than
+    being rejected. Freed capacity goes to the waiter whose tenant has the
+    fewest active sessions, oldest first among equals. ``has_capacity`` lets
+    the caller gate admission on live signals such as ASR queue depth on top
+    of the fixed ``max_sessions`` cap. Waiters whose client socket has
+    disconnected are dropped instead of admitted.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 10,
+        max_queue: int = 0,
+        queue_timeout_s: float = 60.0,
+        has_capacity: Callable[[], bool] | None = None,
+        poll_interval_s: float = 0.5,
+    ) -> None:
         self._max = max_sessions
+        self._max_queue = max_queue
+        self._queue_timeout = queue_timeout_s
+        self._has_capacity = has_capacity or (lambda: True)
+        self._poll_interval = poll_interval_s
         self._sessions: dict[str, Session] = {}
+        self._waiters: list[_Waiter] = []
         self._lock = asyncio.Lock()
 
-    async def create(self, stream_id: str, client_ws: WebSocket, **kwargs) -> Session:
+    async def create(
+        self,
+        stream_id: str,
+        client_ws: WebSocket,
+        on_queued: Callable[[int], Awaitable[None]] | None = None,
+        **kwargs,
+    ) -> Session:
+        """Admit a session, waiting in the admission queue if necessary.
+
+        ``on_queued`` is awaited with the 1-based queue position whenever it
+        changes. Raises RuntimeError if the queue is full or the wait times out.
+        """
+        session = Session(stream_id=stream_id, client_ws=client_ws, **kwargs)
         async with self._lock:
-            if len(self._sessions) >= self._max:
-                raise RuntimeError(f"Max sessions ({self._max}) reached")
-            if stream_id in self._sessions:
+            if stream_id in self._sessions or any(
+                w.session.stream_id == stream_id for w in self._waiters
+            ):
                 raise RuntimeError(f"Session {stream_id} already exists")
-            session = Session(stream_id=stream_id, client_ws=client_ws, **kwargs)
-            self._sessions[stream_id] = session
-            logger.info("Session created: %s (%d active)", stream_id, len(self._sessions))
+            self._drop_disconnected()
+            if not self._waiters and self._can_admit():
+                return self._add(session)
+            if len(self._waiters) >= self._max_queue:
+                if self._max_queue == 0:
+                    raise RuntimeError(f"Max sessions ({self._max}) reached")
+                raise RuntimeError(f"Admission queue full ({self._max_queue} waiting)")
+            waiter = _Waiter(session, asyncio.get_running_loop().create_future())
+            self._waiters.append(waiter)
+            logger.info("Session queued: %s (%d waiting)", stream_id, len(self._waiters))
+
+        deadline = time.monotonic() + self._queue_timeout
+        position = 0
+        try:
+            while not waiter.future.done():
+                current = self._position(waiter)
+                if on_queued is not None and current != position:
+                    position = current
+                    await on_queued(position)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise RuntimeError(
+                        f"Timed out waiting for admission ({self._queue_timeout:.0f}s)"
+                    )
+                try:
+                    await asyncio.wait_for(
+                        asyncio.shield(waiter.future), timeout=min(self._poll_interval, remaining)
+                    )
+                except asyncio.TimeoutError:
+                    # Capacity signals can change without any session ending
+                    await self._admit_waiting()
+            waiter.future.result()  # raises if the waiter was dropped
             return session
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
 
     async def remove(self, stream_id: str) -> None:
         async with self._lock:
             self._sessions.pop(stream_id, None)
             logger.info("Session removed: %s (%d active)", stream_id, len(self._sessions))
+        await self._admit_waiting()
 
     def get(self, stream_id: str) -> Session | None:
         return self._sessions.get(stream_id)
@@ -48,3 +127,52 @@ class SessionManager:
     @property
     def active_count(self) -> int:
         return len(self._sessions)
+
+    @property
+    def queued_count(self) -> int:
+        return len(self._waiters)
+
+    def _can_admit(self) -> bool:
+        return len(self._sessions) < self._max and self._has_capacity()
+
+    def _add(self, session: Session) -> Session:
+        self._sessions[session.stream_id] = session
+        logger.info("Session created: %s (%d active)", session.stream_id, len(self._sessions))
+        return session
+
+    def _fair_order(self) -> list[_Waiter]:
+        """Waiters in the order they would be admitted under per-tenant fair share."""
+        active: dict[str | None, int] = {}
+        for session in self._sessions.values():
+            active[session.tenant] = active.get(session.tenant, 0) + 1
+        pending = list(self._waiters)
+        order: list[_Waiter] = []
+        while pending:
+            nxt = min(pending, key=lambda w: (active.get(w.session.tenant, 0), w.enqueued_at))
+            pending.remove(nxt)
+            order.append(nxt)
+            active[nxt.session.tenant] = active.get(nxt.session.tenant, 0) + 1
+        return order
+
+    def _position(self, waiter: _Waiter) -> int:
+        return self._fair_order().index(waiter) + 1
+
+    def _drop_disconnected(self) -> None:
+        for waiter in [w for w in self._waiters if _disconnected(w.session.client_ws)]:
+            self._waiters.remove(waiter)
+            waiter.future.set_exception(RuntimeError("Client disconnected while queued"))
+            logger.info("Dropped queued session: %s (client gone)", waiter.session.stream_id)
+
+    async def _admit_waiting(self) -> None:
+        async with self._lock:
+            self._drop_disconnected()
+            for waiter in self._fair_order():
+                if not self._can_admit():
+                    break
+                self._waiters.remove(waiter)
+                self._add(waiter.session)
+                waiter.future.set_result(None)
+
+
+def _disconnected(ws: WebSocket | None) -> bool:
+    return ws is not None and WebSocketState.DISCONNECTED in (ws.client_state, ws.application_state)
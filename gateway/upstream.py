@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit, urlunsplit
+
+import httpx
+import websockets
+
+from gateway.channels import DirectStream, MuxConnection, MuxStream
+
+logger = logging.getLogger(__name__)
+
+CONNECT_KWARGS = {"ping_interval": 30, "ping_timeout": 300, "close_timeout": 300}
+
+
+def health_url_for(ws_url: str) -> str:
+    """ws://host:port/stream -> http://host:port/health"""
+    parts = urlsplit(ws_url)
+    scheme = "https" if parts.scheme == "wss" else "http"
+    return urlunsplit((scheme, parts.netloc, "/health", "", ""))
+
+
+def mux_url_for(ws_url: str) -> str:
+    """ws://host:port/stream -> ws://host:port/mux"""
+    parts = urlsplit(ws_url)
+    return urlunsplit((parts.scheme, parts.netloc, "/mux", "", ""))
+
+
+@dataclass
+class AsrBackend:
+    ws_url: str
+    health_url: str
+    healthy: bool = True
+    active_sessions: int = 0  # streams this gateway has placed here
+    queue_depth: int = 0  # inference queue depth reported by the backend
+    audio_in_flight_s: float = 0.0  # received but not yet transcribed, reported by the backend
+    binary_wire: bool = False  # backend speaks the common.wire framing
+    mux: bool = False  # backend accepts many streams per socket on /mux
+    warm: deque = field(default_factory=deque)  # idle, already-open connections
+    mux_connections: list = field(default_factory=list)  # shared MuxConnections
+    mux_lock: asyncio.Lock = field(default_factory=asyncio.Lock)  # one mux connect at a time
+
+    @property
+    def load(self) -> int:
+        return self.active_sessions + self.queue_depth
+
+
+class AsrPool:
+    """Places new streams on the least-loaded healthy ASR backend.
+
+    Backends are polled on their /health endpoint for readiness and queue
+    depth. A few idle connections per backend are kept open so a new stream
+    skips the TCP + WebSocket handshake. With ``mux_connections`` set,
+    streams instead share that many long-lived sockets per backend, on
+    backends that support it, and those backends get no idle connections.
+    """
+
+    def __init__(
+        self,
+        ws_urls: list[str],
+        health_interval_s: float = 5.0,
+        warm_connections: int = 1,
+        max_queue_depth: int = 16,
+        max_audio_in_flight_s: float = 60.0,
+        mux_connections: int = 0,
+    ):
+        self.backends = [AsrBackend(ws_url=url, health_url=health_url_for(url)) for url in ws_urls]
+        self.health_interval_s = health_interval_s
+        self.warm_connections = warm_connections
+        self.max_queue_depth = max_queue_depth
+        self.max_audio_in_flight_s = max_audio_in_flight_s
+        self.mux_connections = mux_connections
+        self._http: httpx.AsyncClient | None = None
+        self._task: asyncio.Task | None = None
+        self._refills: set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        self._http = httpx.AsyncClient(timeout=2.0)
+        await self.check_health()
+        self._task = asyncio.create_task(self._health_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        # A refill finishing later would leave a socket nobody closes
+        for refill in list(self._refills):
+            refill.cancel()
+        await asyncio.gather(*self._refills, return_exceptions=True)
+        for backend in self.backends:
+            while backend.warm:
+                await backend.warm.popleft().close()
+            while backend.mux_connections:
+                await backend.mux_connections.pop().close()
+        if self._http is not None:
+            await self._http.aclose()
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_interval_s)
+            try:
+                await self.check_health()
+            except Exception:
+                logger.exception("ASR health check failed")
+
+    async def check_health(self) -> None:
+        await asyncio.gather(*(self._check(backend) for backend in self.backends))
+        await asyncio.gather(*(self._fill_warm(b) for b in self.backends if b.healthy))
+
+    async def _check(self, backend: AsrBackend) -> None:
+        was_healthy = backend.healthy
+        try:
+            resp = await self._http.get(backend.health_url)
+            resp.raise_for_status()
+            data = resp.json()
+            # Backends that are still warming up are live but not ready
+            backend.healthy = data.get("status") == "ok" and data.get("ready", True)
+            backend.queue_depth = int(data.get("inference", {}).get("queue_depth", 0))
+            backend.audio_in_flight_s = float(data.get("audio_in_flight_s", 0.0))
+            backend.binary_wire = "binary" in data.get("wire_formats", [])
+            backend.mux = "mux" in data.get("wire_formats", [])
+        except Exception:
+            backend.healthy = False
+        if backend.healthy != was_healthy:
+            logger.warning(
+                "ASR backend %s is now %s", backend.ws_url, "healthy" if backend.healthy else "unhealthy"
+            )
+
+    def _uses_mux(self, backend: AsrBackend) -> bool:
+        return self.mux_connections > 0 and backend.mux
+
+    async def _fill_warm(self, backend: AsrBackend) -> None:
+        self._drop_closed(backend)
+        if self._uses_mux(backend):
+            # Streams ride the shared sockets; idle ones would each hold an ASR socket for nothing
+            while backend.warm:
+                await backend.warm.popleft().close()
+            return
+        while len(backend.warm) < self.warm_connections:
+            try:
+                backend.warm.append(await websockets.connect(backend.ws_url, **CONNECT_KWARGS))
+            except Exception:
+                logger.warning("Could not open warm connection to %s", backend.ws_url)
+                return
+
+    @staticmethod
+    def _drop_closed(backend: AsrBackend) -> None:
+        backend.warm = deque(ws for ws in backend.warm if ws.open)
+
+    def _pick(self, tried: set[str]) -> AsrBackend:
+        candidates = [b for b in self.backends if b.ws_url not in tried]
+        if not candidates:
+            raise RuntimeError("No ASR backend available")
+        healthy = [b for b in candidates if b.healthy] or candidates
+        backend = min(healthy, key=lambda b: b.load)
+        tried.add(backend.ws_url)
+        return backend
+
+    async def _connect(self, backend: AsrBackend):
+        self._drop_closed(backend)
+        if backend.warm:
+            ws = backend.warm.popleft()
+            refill = asyncio.create_task(self._fill_warm(backend))
+            self._refills.add(refill)
+            refill.add_done_callback(self._refills.discard)
+            return ws
+        return await websockets.connect(backend.ws_url, **CONNECT_KWARGS)
+
+    async def _mux_connection(self, backend: AsrBackend) -> MuxConnection:
+        """The backend's least-used shared socket, opening one while under ``mux_connections``."""
+        # Held across the connect, so concurrent streams cannot each open one past the limit
+        async with backend.mux_lock:
+            backend.mux_connections = [c for c in backend.mux_connections if c.open]
+            if len(backend.mux_connections) < self.mux_connections:
+                ws = await websockets.connect(mux_url_for(backend.ws_url), **CONNECT_KWARGS)
+                backend.mux_connections.append(MuxConnection(ws))
+            return min(backend.mux_connections, key=lambda c: len(c.streams))
+
+    async def acquire(self):
+        """Return (backend, connection) for a new stream.
+
+        Picks the least-loaded healthy backend (any backend if none look
+        healthy) and falls through to the next one if connecting fails. Pair
+        every successful call with ``release``.
+        """
+        tried: set[str] = set()
+        while True:
+            backend = self._pick(tried)
+            try:
+                ws = await self._connect(backend)
+            except Exception:
+                logger.warning("ASR backend %s unreachable", backend.ws_url)
+                backend.healthy = False
+                continue
+            backend.active_sessions += 1
+            return backend, ws
+
+    async def open_stream(self, stream_id: str, binary: bool = True) -> tuple[AsrBackend, DirectStream | MuxStream]:
+        """Like ``acquire``, but return an upstream handle for the stream.
+
+        The handle is a channel on a shared socket when multiplexing is on
+        and the backend supports it, else a socket of its own, binary-framed
+        if ``binary`` and the backend speaks it.
+        """
+        tried: set[str] = set()
+        while True:
+            backend = self._pick(tried)
+            try:
+                if self._uses_mux(backend):
+                    stream = (await self._mux_connection(backend)).open_stream(stream_id)
+                else:
+                    stream = DirectStream(await self._connect(backend), stream_id, binary and backend.binary_wire)
+            except Exception:
+                logger.warning("ASR backend %s unreachable", backend.ws_url)
+                backend.healthy = False
+                continue
+            backend.active_sessions += 1
+            return backend, stream
+
+    def has_capacity(self) -> bool:
+        """Whether some healthy backend can take another stream without falling behind."""
+        return any(
+            b.healthy
+            and b.queue_depth < self.max_queue_depth
+            and b.audio_in_flight_s < self.max_audio_in_flight_s
+            for b in self.backends
+        )
+
+    def release(self, backend: AsrBackend) -> None:
+        backend.active_sessions = max(0, backend.active_sessions - 1)
+
+    def stats(self) -> list[dict]:
+        return [
+            {
+                "url": b.ws_url,
+                "healthy": b.healthy,
+                "active_sessions": b.active_sessions,
+                "queue_depth": b.queue_depth,
+                "audio_in_flight_s": b.audio_in_flight_s,
+                "warm_connections": len(b.warm),
+                "wire": "binary" if b.binary_wire else "json",
+                "mux_connections": sum(1 for c in b.mux_connections if c.open),
+            }
+            for b in self.backends
+        ]
@@ -0,0 +1,296 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import re
+from contextlib import aclosing
+from functools import partial
+from itertools import groupby
+from typing import Any, AsyncIterator
+
+from common.config import SLMSettings
+from common.schemas import MeetingContext
+from slm_service.json_stream import JsonStreamParser
+from slm_service.ollama_client import chat_completion, chat_completion_stream
+from slm_service.prompts import (
+    REDUCE_SYSTEM_PROMPT,
+    SYSTEM_PROMPT,
+    build_reduce_prompt,
+    build_user_prompt,
+    format_transcript,
+)
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4  # rough average for English text with Llama/Phi-style tokenizers
+SEVERITY_RANK = {"low": 0, "medium": 1, "high": 2}
+# Analysis list fields streamed item by item, and the event each item becomes
+STREAMED_ITEMS = {"key_points": "key_point", "action_items": "action_item", "risks": "risk"}
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def split_windows(segments: list[dict], max_tokens: int) -> list[list[dict]]:
+    """Group segments into consecutive windows of at most ``max_tokens`` transcript tokens.
+
+    Windows break between speaker turns. A single turn over budget is split
+    between its segments, and a single segment over budget gets a window of
+    its own.
+    """
+    windows: list[list[dict]] = []
+    current: list[dict] = []
+    used = 0
+    for _, turn in groupby(segments, key=lambda seg: seg.get("speaker")):
+        turn = list(turn)
+        costs = [estimate_tokens(format_transcript([seg])) for seg in turn]
+        if current and used + sum(costs) > max_tokens:
+            windows.append(current)
+            current, used = [], 0
+        for seg, cost in zip(turn, costs):
+            if current and used + cost > max_tokens:
+                windows.append(current)
+                current, used = [], 0
+            current.append(seg)
+            used += cost
+    if current:
+        windows.append(current)
+    return windows
+
+
+def _normalize(text: Any) -> str:
+    return re.sub(r"[\W_]+", " ", str(text or "").lower()).strip()
+
+
+def _dedupe(items: list[str]) -> list[str]:
+    seen: set[str] = set()
+    unique = []
+    for item in items:
+        key = _normalize(item)
+        if key and key not in seen:
+            seen.add(key)
+            unique.append(item)
+    return unique
+
+
+def _risk_key(risk: dict) -> tuple[str, str]:
+    return _normalize(risk.get("category")), _normalize(risk.get("description"))
+
+
+def merge_results(partials: list[dict]) -> dict:
+    """Combine per-window analyses; lists are concatenated in order and deduplicated.
+
+    Risks with the same category and description collapse into one, keeping
+    the highest severity seen. The summary is left for the reduce prompt.
+    """
+    risks: dict[tuple[str, str], dict] = {}
+    for result in partials:
+        for risk in result.get("risks", []):
+            if not isinstance(risk, dict):
+                continue
+            key = _risk_key(risk)
+            kept = risks.get(key)
+            if kept is None or SEVERITY_RANK.get(risk.get("severity"), 0) > SEVERITY_RANK.get(kept.get("severity"), 0):
+                risks[key] = risk
+    return {
+        "key_points": _dedupe([p for result in partials for p in result.get("key_points", [])]),
+        "action_items": _dedupe([a for result in partials for a in result.get("action_items", [])]),
+        "risks": list(risks.values()),
+    }
+
+
+def group_summaries(summaries: list[str], max_tokens: int) -> list[list[str]]:
+    """Group consecutive summaries so each group's reduce prompt stays within ``max_tokens``.
+
+    A group always takes a second summary, even over budget, so every
+    reduce level at least halves the count.
+    """
+    if max_tokens <= 0:
+        return [summaries] if summaries else []
+    groups: list[list[str]] = []
+    current: list[str] = []
+    used = 0
+    for summary in summaries:
+        cost = estimate_tokens(summary) + 2  # "Part n:" header
+        if len(current) > 1 and used + cost > max_tokens:
+            groups.append(current)
+            current, used = [], 0
+        current.append(summary)
+        used += cost
+    if current:
+        groups.append(current)
+    return groups
+
+
+async def _reduce_levels(summaries: list[str], settings: SLMSettings) -> list[str]:
+    """Reduce window summaries level by level until one prompt can hold all that remain."""
+    groups = group_summaries(summaries, settings.analysis_window_tokens)
+    slots = asyncio.Semaphore(max(1, settings.analysis_concurrency))
+
+    async def reduce(group: list[str]) -> str:
+        if len(group) == 1:
+            return group[0]
+        async with slots:
+            reduced = await _complete_json(REDUCE_SYSTEM_PROMPT, build_reduce_prompt(group), settings)
+        return reduced.get("summary", "")
+
+    while len(groups) > 1:
+        logger.info("Reducing %d summaries in %d groups", sum(map(len, groups)), len(groups))
+        summaries = [s for s in await asyncio.gather(*(reduce(g) for g in groups)) if s]
+        groups = group_summaries(summaries, settings.analysis_window_tokens)
+    return groups[0] if groups else []
+
+
+def _windows(segments: list[dict], settings: SLMSettings) -> list[list[dict]]:
+    if settings.analysis_window_tokens > 0:
+        return split_windows(segments, settings.analysis_window_tokens)
+    return [segments]
+
+
+def _window_prompt(window: list[dict], part: tuple[int, int] | None, context: MeetingContext) -> str:
+    return build_user_prompt(
+        format_transcript(window),
+        meeting_type=context.meeting_type,
+        department=context.department,
+        part=part,
+    )
+
+
+async def _complete_json(system: str, user: str, settings: SLMSettings) -> dict:
+    raw = await chat_completion(
+        [{"role": "system", "content": system}, {"role": "user", "content": user}],
+        settings,
+    )
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError:
+        logger.error("SLM returned invalid JSON: %s", raw)
+        raise
+
+
+async def _stream_json(system: str, user: str, settings: SLMSettings) -> AsyncIterator[tuple[str, Any]]:
+    """Stream one completion, yielding ``(event, value)`` as fields finish generating.
+
+    Events are "summary", one "key_point"/"action_item"/"risk" per list
+    entry, and finally "result" with the whole object.
+    """
+    parser = JsonStreamParser()
+    messages = [{"role": "system", "content": system}, {"role": "user", "content": user}]
+    async with aclosing(chat_completion_stream(messages, settings)) as pieces:
+        async for piece in pieces:
+            for path, value in parser.feed(piece):
+                if path == ("summary",) and isinstance(value, str):
+                    yield "summary", value
+                elif len(path) == 2 and path[0] in STREAMED_ITEMS:
+                    yield STREAMED_ITEMS[path[0]], value
+                elif path == () and isinstance(value, dict):
+                    yield "result", value
+    if not parser.done:
+        logger.error("SLM stream ended mid-JSON: %s", parser.text)
+        raise json.JSONDecodeError("SLM stream ended before the JSON object closed", parser.text, len(parser.text))
+
+
+async def analyze_segments(
+    segments: list[dict],
+    context: MeetingContext,
+    settings: SLMSettings,
+) -> dict:
+    """Analyze a transcript in one prompt, or map-reduce it if it is over the window budget.
+
+    Windows are analyzed concurrently, at most ``analysis_concurrency`` at a
+    time, and their summaries reduced in groups that fit the same budget.
+    Raises json.JSONDecodeError if the model returns invalid JSON.
+    """
+    windows = _windows(segments, settings)
+    prompt = partial(_window_prompt, context=context)
+
+    if len(windows) <= 1:
+        return await _complete_json(SYSTEM_PROMPT, prompt(segments, None), settings)
+
+    logger.info("Map-reduce analysis over %d windows", len(windows))
+    slots = asyncio.Semaphore(max(1, settings.analysis_concurrency))
+
+    async def analyze_window(i: int, window: list[dict]) -> dict:
+        async with slots:
+            return await _complete_json(SYSTEM_PROMPT, prompt(window, (i + 1, len(windows))), settings)
+
+    partials = await asyncio.gather(*(analyze_window(i, w) for i, w in enumerate(windows)))
+    merged = merge_results(partials)
+    summaries = await _reduce_levels([p.get("summary", "") for p in partials if p.get("summary")], settings)
+    reduced = await _complete_json(REDUCE_SYSTEM_PROMPT, build_reduce_prompt(summaries), settings)
+    merged["summary"] = reduced.get("summary", "")
+    return merged
+
+
+async def analyze_segments_stream(
+    segments: list[dict],
+    context: MeetingContext,
+    settings: SLMSettings,
+) -> AsyncIterator[tuple[str, Any]]:
+    """Streaming ``analyze_segments``: yield ``(event, value)`` as soon as each item is generated.
+
+    Map-reduced transcripts stream key points, action items and risks from
+    all windows as they finish, skipping duplicates of items already sent,
+    then the reduced summary. The closing "result" event carries the merged
+    analysis, where a repeated risk keeps its highest severity.
+    """
+    windows = _windows(segments, settings)
+    prompt = partial(_window_prompt, context=context)
+
+    if len(windows) <= 1:
+        async with aclosing(_stream_json(SYSTEM_PROMPT, prompt(segments, None), settings)) as events:
+            async for event in events:
+                yield event
+        return
+
+    logger.info("Streaming map-reduce analysis over %d windows", len(windows))
+    slots = asyncio.Semaphore(max(1, settings.analysis_concurrency))
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def stream_window(i: int, window: list[dict]) -> None:
+        try:
+            async with slots:
+                async with aclosing(
+                    _stream_json(SYSTEM_PROMPT, prompt(window, (i + 1, len(windows))), settings)
+                ) as events:
+                    async for event in events:
+                        await queue.put(event)
+            await queue.put(None)
+        except Exception as exc:
+            await queue.put(exc)
+
+    tasks = [asyncio.create_task(stream_window(i, w)) for i, w in enumerate(windows)]
+    partials: list[dict] = []
+    seen: set = set()
+    try:
+        remaining = len(tasks)
+        while remaining:
+            item = await queue.get()
+            if item is None:
+                remaining -= 1
+                continue
+            if isinstance(item, Exception):
+                raise item
+            event, value = item
+            if event == "result":
+                partials.append(value)
+            elif event != "summary":
+                key = (event, _risk_key(value) if isinstance(value, dict) else _normalize(str(value)))
+                if key not in seen:
+                    seen.add(key)
+                    yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    merged = merge_results(partials)
+    summaries = await _reduce_levels([p.get("summary", "") for p in partials if p.get("summary")], settings)
+    async with aclosing(_stream_json(REDUCE_SYSTEM_PROMPT, build_reduce_prompt(summaries), settings)) as events:
+        async for event, value in events:
+            if event == "summary":
+                merged["summary"] = value
+                yield event, value
+    merged.setdefault("summary", "")
+    yield "result", merged
@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+from common.config import SLMSettings
+from common.schemas import MeetingContext
+from slm_service.prompts import PROMPT_VERSION, REDUCE_SYSTEM_PROMPT, SYSTEM_PROMPT
+
+logger = logging.getLogger(__name__)
+
+_cache: ResultCache | None = None
+
+PURGE_EVERY = 100  # disk writes between sweeps of expired rows
+
+
+def cache_key(segments: list[dict], context: MeetingContext, settings: SLMSettings) -> str:
+    """Hash of everything that determines an analysis, and nothing that does not.
+
+    Segments are reduced to what the prompt shows (start time to 0.1s,
+    speaker, whitespace-collapsed text), so ids, statuses and confidences
+    do not split the cache.
+    """
+    material = {
+        "segments": [
+            [
+                round(seg.get("start_time", 0.0), 1),
+                seg.get("speaker") or "UNKNOWN",
+                " ".join(seg.get("text", "").split()),
+            ]
+            for seg in segments
+        ],
+        "context": context.model_dump(),
+        "prompt": [PROMPT_VERSION, SYSTEM_PROMPT, REDUCE_SYSTEM_PROMPT],
+        "model": settings.model_name,
+        "temperature": settings.temperature,
+        "max_tokens": settings.max_tokens,
+        "window_tokens": settings.analysis_window_tokens,
+    }
+    return hashlib.sha256(json.dumps(material, sort_keys=True).encode()).hexdigest()
+
+
+class ResultCache:
+    """Analysis results by cache key: an in-memory LRU in front of optional SQLite.
+
+    Both tiers expire entries after ``ttl_s``. Concurrent requests for the
+    same key share one computation; failures are not cached.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_s: float = 86400.0, path: str = ""):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._memory: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._db: sqlite3.Connection | None = None
+        self._db_lock = threading.Lock()
+        self._writes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, result TEXT, stored_at REAL)"
+            )
+            self._purge()
+
+    @classmethod
+    def from_settings(cls, settings: SLMSettings) -> ResultCache:
+        return cls(settings.cache_max_entries, settings.cache_ttl_s, settings.cache_path)
+
+    def _fresh(self, stored_at: float) -> bool:
+        return time.time() - stored_at < self.ttl_s
+
+    def _memory_get(self, key: str) -> dict | None:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        if not self._fresh(entry[0]):
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return entry[1]
+
+    def _memory_put(self, key: str, result: dict, stored_at: float) -> None:
+        self._memory[key] = (stored_at, result)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_get(self, key: str) -> tuple[float, dict] | None:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT stored_at, result FROM results WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or not self._fresh(row[0]):
+            return None
+        return row[0], json.loads(row[1])
+
+    def _disk_put(self, key: str, result: dict, stored_at: float) -> None:
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?)", (key, json.dumps(result), stored_at)
+            )
+            self._db.commit()
+            self._writes += 1
+            if self._writes % PURGE_EVERY == 0:
+                self._purge()
+
+    def _purge(self) -> None:
+        self._db.execute("DELETE FROM results WHERE stored_at < ?", (time.time() - self.ttl_s,))
+        self._db.commit()
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[dict]]) -> dict:
+        result = self._memory_get(key)
+        if result is not None:
+            self.memory_hits += 1
+            return result
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = self._inflight[key] = asyncio.create_task(self._load(key, compute))
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded so one caller disconnecting does not cancel it for the others
+        return await asyncio.shield(task)
+
+    async def _load(self, key: str, compute: Callable[[], Awaitable[dict]]) -> dict:
+        result = await self._disk_lookup(key)
+        if result is not None:
+            return result
+        self.misses += 1
+        result = await compute()
+        await self.store(key, result)
+        return result
+
+    async def _disk_lookup(self, key: str) -> dict | None:
+        if self._db is None:
+            return None
+        entry = await asyncio.to_thread(self._disk_get, key)
+        if entry is None:
+            return None
+        self.disk_hits += 1
+        self._memory_put(key, entry[1], entry[0])
+        return entry[1]
+
+    async def lookup(self, key: str) -> dict | None:
+        """Cached result for ``key`` from either tier, without computing or coalescing."""
+        result = self._memory_get(key)
+        if result is not None:
+            self.memory_hits += 1
+            return result
+        result = await self._disk_lookup(key)
+        if result is None:
+            self.misses += 1
+        return result
+
+    async def store(self, key: str, result: dict) -> None:
+        stored_at = time.time()
+        self._memory_put(key, result, stored_at)
+        if self._db is not None:
+            await asyncio.to_thread(self._disk_put, key, result, stored_at)
+
+    def stats(self) -> dict:
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round((hits + self.coalesced) / lookups, 4) if lookups else None,
+        }
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def get_cache(settings: SLMSettings | None = None) -> ResultCache:
+    global _cache
+    if _cache is None:
+        _cache = ResultCache.from_settings(settings or SLMSettings())
+    return _cache
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass
+from typing import Any, Union
+
+WHITESPACE = " \t\r\n"
+
+PathKey = Union[str, int]
+
+
+@dataclass
+class _Frame:
+    kind: str  # "{" or "["
+    start: int
+    key: PathKey | None = None  # current key (objects) or index (arrays)
+    awaiting_key: bool = False
+
+
+class JsonStreamParser:
+    """Incremental JSON scanner that reports each value as soon as it is complete.
+
+    ``feed`` takes text chunks as they arrive and returns ``(path, value)``
+    for every value finished inside them, innermost first, e.g.
+    ``(("key_points", 0), "Budget approved")`` before ``(("key_points",),
+    [...])``. Values are decoded with ``json.loads`` once their text is
+    complete, so the scanner only tracks nesting and string boundaries.
+    Text before the first ``{`` or ``[`` is skipped.
+    """
+
+    def __init__(self):
+        self._buf = ""
+        self._pos = 0
+        self._stack: list[_Frame] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._scalar_start: int | None = None
+        self.done = False
+
+    @property
+    def text(self) -> str:
+        return self._buf
+
+    def _path(self) -> tuple[PathKey, ...]:
+        return tuple(frame.key for frame in self._stack)
+
+    def _complete(self, start: int, end: int, events: list) -> None:
+        events.append((self._path(), json.loads(self._buf[start:end])))
+
+    def _end_scalar(self, end: int, events: list) -> None:
+        if self._scalar_start is not None:
+            self._complete(self._scalar_start, end, events)
+            self._scalar_start = None
+
+    def feed(self, chunk: str) -> list[tuple[tuple[PathKey, ...], Any]]:
+        events: list[tuple[tuple[PathKey, ...], Any]] = []
+        self._buf += chunk
+        buf = self._buf
+        for pos in range(self._pos, len(buf)):
+            ch = buf[pos]
+            if self.done:
+                break
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    frame = self._stack[-1]
+                    if frame.awaiting_key:
+                        frame.key = json.loads(buf[self._string_start:pos + 1])
+                        frame.awaiting_key = False
+                    else:
+                        self._complete(self._string_start, pos + 1, events)
+                continue
+            if not self._stack and ch not in "{[":
+                continue
+            if ch in WHITESPACE:
+                self._end_scalar(pos, events)
+            elif ch == '"':
+                self._in_string = True
+                self._string_start = pos
+            elif ch in "{[":
+                self._stack.append(_Frame(ch, pos, None if ch == "{" else 0, ch == "{"))
+            elif ch in "}]":
+                self._end_scalar(pos, events)
+                frame = self._stack.pop()
+                if self._stack:
+                    self._complete(frame.start, pos + 1, events)
+                else:
+                    events.append(((), json.loads(buf[frame.start:pos + 1])))
+                    self.done = True
+            elif ch == ",":
+                self._end_scalar(pos, events)
+                frame = self._stack[-1]
+                if frame.kind == "{":
+                    frame.awaiting_key = True
+                else:
+                    frame.key += 1
+            elif ch == ":":
+                pass
+            elif self._scalar_start is None:
+                self._scalar_start = pos
+        self._pos = len(buf)
+        return events
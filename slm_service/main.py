@@ -2,58 +2,160 @@ from __future__ import annotations
 
 import json
 import logging
+from contextlib import aclosing
+from typing import Any, AsyncIterator
 
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
 
 from common.config import SLMSettings
-from common.schemas import AnalyzeRequest, AnalyzeResponse, RiskItem
-from slm_service.ollama_client import chat_completion
-from slm_service.prompts import SYSTEM_PROMPT, build_user_prompt, format_transcript
+from common.metrics import mount_metrics
+from common.schemas import (
+    AnalysisEvent,
+    AnalysisEventType,
+    AnalyzeRequest,
+    AnalyzeResponse,
+    RiskItem,
+)
+from slm_service.analysis import STREAMED_ITEMS, analyze_segments, analyze_segments_stream
+from slm_service.cache import cache_key, get_cache
+from slm_service.ollama_client import close_pool, get_pool
 
 logger = logging.getLogger(__name__)
 
 settings = SLMSettings()
 app = FastAPI(title="SLM Service")
+mount_metrics(app)
+cache = get_cache(settings)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await close_pool()
+    cache.close()
 
 
 @app.get("/health")
 async def health():
-    return {"status": "ok"}
+    return {
+        "status": "ok",
+        "ollama_backends": get_pool(settings).stats(),
+        "cache": cache.stats(),
+    }
 
 
 @app.post("/analyze-transcript", response_model=AnalyzeResponse)
 async def analyze_transcript(req: AnalyzeRequest):
-    formatted = format_transcript([s.model_dump() for s in req.segments])
-    user_prompt = build_user_prompt(
-        formatted,
-        meeting_type=req.context.meeting_type,
-        department=req.context.department,
-    )
+    segments = [s.model_dump() for s in req.segments]
 
-    messages = [
-        {"role": "system", "content": SYSTEM_PROMPT},
-        {"role": "user", "content": user_prompt},
-    ]
+    async def compute() -> dict:
+        # Validated before it reaches the cache, so a malformed result is never stored
+        return _analysis(await analyze_segments(segments, req.context, settings))
 
     try:
-        raw = await chat_completion(messages, settings)
-        result = json.loads(raw)
+        if settings.cache_max_entries > 0:
+            result = await cache.get_or_compute(cache_key(segments, req.context, settings), compute)
+        else:
+            result = await compute()
     except json.JSONDecodeError:
-        logger.error("SLM returned invalid JSON: %s", raw)
         raise HTTPException(status_code=502, detail="SLM returned invalid JSON")
+    except ValueError as exc:
+        logger.warning("SLM returned an invalid analysis: %s", exc)
+        raise HTTPException(status_code=502, detail="SLM returned an invalid analysis")
     except Exception:
         logger.exception("SLM call failed")
         raise HTTPException(status_code=502, detail="SLM service unavailable")
 
+    return _response(req.stream_id, result)
+
+
+@app.post("/analyze-transcript/stream")
+async def analyze_transcript_stream(req: AnalyzeRequest):
+    """NDJSON AnalysisEvents: each field or list item as soon as it is generated, then "complete"."""
+    return StreamingResponse(_analysis_events(req), media_type="application/x-ndjson")
+
+
+def _response(stream_id: str, result: dict) -> AnalyzeResponse:
     return AnalyzeResponse(
-        stream_id=req.stream_id,
+        stream_id=stream_id,
         summary=result.get("summary", ""),
         key_points=result.get("key_points", []),
         action_items=result.get("action_items", []),
-        risks=[RiskItem(**r) for r in result.get("risks", [])],
+        risks=[RiskItem.model_validate(r) for r in result.get("risks", [])],
     )
 
 
+def _valid_risk(risk: Any) -> bool:
+    try:
+        RiskItem.model_validate(risk)
+    except ValidationError:
+        return False
+    return True
+
+
+def _analysis(result: Any) -> dict:
+    """``result`` checked against ``AnalyzeResponse``, as a plain dict for the cache.
+
+    Raises ValueError (including pydantic's ValidationError) if it does not fit.
+    """
+    if not isinstance(result, dict) or not result:
+        raise ValueError("empty or non-object analysis")
+    return _response("", result).model_dump(exclude={"stream_id"})
+
+
+async def _replay(result: dict) -> AsyncIterator[tuple[str, Any]]:
+    """A cached analysis as the same events a fresh one would stream."""
+    yield "summary", result.get("summary", "")
+    for field, event in STREAMED_ITEMS.items():
+        for item in result.get(field, []):
+            yield event, item
+    yield "result", result
+
+
+async def _analysis_events(req: AnalyzeRequest) -> AsyncIterator[str]:
+    def line(event: AnalysisEventType, **fields) -> str:
+        message = AnalysisEvent(type=event, stream_id=req.stream_id, **fields)
+        return message.model_dump_json(exclude_none=True) + "\n"
+
+    segments = [s.model_dump() for s in req.segments]
+    key = cache_key(segments, req.context, settings)
+    caching = settings.cache_max_entries > 0
+    try:
+        cached = await cache.lookup(key) if caching else None
+        if cached is not None:
+            events = _replay(cached)
+        else:
+            events = analyze_segments_stream(segments, req.context, settings)
+        result: Any = {}
+        async with aclosing(events):
+            async for event, value in events:
+                if event == "result":
+                    result = value
+                elif event == "risk":
+                    try:
+                        yield line(AnalysisEventType.risk, risk=RiskItem.model_validate(value))
+                    except ValidationError:
+                        logger.warning("Skipping malformed risk from SLM: %s", value)
+                elif isinstance(value, str):
+                    yield line(AnalysisEventType(event), text=value)
+        if isinstance(result, dict) and isinstance(result.get("risks"), list):
+            # The same malformed risks that were skipped above
+            result = {**result, "risks": [r for r in result["risks"] if _valid_risk(r)]}
+        analysis = _analysis(result)
+        if caching and cached is None:
+            await cache.store(key, analysis)
+        yield line(AnalysisEventType.complete, result=_response(req.stream_id, analysis))
+    except json.JSONDecodeError:
+        yield line(AnalysisEventType.error, detail="SLM returned invalid JSON")
+    except ValueError as exc:
+        logger.warning("SLM returned an invalid analysis: %s", exc)
+        yield line(AnalysisEventType.error, detail="SLM returned an invalid analysis")
+    except Exception:
+        logger.exception("SLM call failed")
+        yield line(AnalysisEventType.error, detail="SLM service unavailable")
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host=settings.host, port=settings.port)
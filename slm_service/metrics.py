@@ -0,0 +1,31 @@
+"""Prometheus metrics for the SLM service."""
+
+from __future__ import annotations
+
+from prometheus_client import Counter, Histogram
+
+from common.metrics import LATENCY_BUCKETS, TOKENS_PER_SECOND_BUCKETS
+
+GENERATION_SECONDS = Histogram(
+    "slm_generation_seconds",
+    "Wall time of one Ollama chat completion, including queueing for a backend",
+    ["mode"],
+    buckets=LATENCY_BUCKETS,
+)
+TOKENS_PER_SECOND = Histogram(
+    "slm_tokens_per_second",
+    "Generation speed Ollama reports for one completion (eval_count / eval_duration)",
+    buckets=TOKENS_PER_SECOND_BUCKETS,
+)
+GENERATED_TOKENS = Counter("slm_generated_tokens", "Tokens generated by Ollama")
+
+
+def observe_generation(mode: str, elapsed_s: float, data: dict) -> None:
+    """Record one completion; ``data`` is Ollama's final response object."""
+    GENERATION_SECONDS.labels(mode).observe(elapsed_s)
+    tokens = data.get("eval_count")
+    duration_ns = data.get("eval_duration")
+    if tokens:
+        GENERATED_TOKENS.inc(tokens)
+        if duration_ns:
+            TOKENS_PER_SECOND.observe(tokens / (duration_ns / 1e9))
@@ -1,27 +1,187 @@
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
+import time
+from contextlib import aclosing, asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator
 
 import httpx
 
 from common.config import SLMSettings
+from slm_service.metrics import observe_generation
 
 logger = logging.getLogger(__name__)
 
+_pool: OllamaPool | None = None
 
-async def chat_completion(
-    messages: list[dict[str, str]],
-    settings: SLMSettings | None = None,
-) -> str:
-    """Call Ollama /api/chat and return the assistant message content."""
-    settings = settings or SLMSettings()
-    url = f"{settings.ollama_url}/api/chat"
 
-    payload = {
+@dataclass
+class OllamaBackend:
+    url: str
+    outstanding: int = 0  # requests this process has in flight here
+    requests: int = 0
+    failures: int = 0
+    down_until: float = 0.0  # skipped for routing until then, after a connection failure
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self.down_until
+
+
+class OllamaPool:
+    """Routes chat requests over one or more Ollama servers on a shared client.
+
+    One ``httpx.AsyncClient`` lives for the whole process, so requests reuse
+    keep-alive HTTP/1.1 connections instead of reconnecting per call. Each
+    request goes to the backend with the fewest requests outstanding, up to
+    ``max_concurrency`` per backend; beyond that, callers wait for a slot.
+    A backend that refuses connections is skipped for ``retry_after_s`` and
+    the request retried elsewhere.
+    """
+
+    def __init__(
+        self,
+        urls: list[str],
+        max_concurrency: int = 4,
+        max_connections: int = 32,
+        max_keepalive: int = 16,
+        keepalive_expiry_s: float = 60.0,
+        connect_timeout_s: float = 5.0,
+        timeout_s: float = 120.0,
+        retry_after_s: float = 10.0,
+    ):
+        if not urls:
+            raise ValueError("At least one Ollama URL is required")
+        self.backends = [OllamaBackend(url=url.rstrip("/")) for url in urls]
+        self.max_concurrency = max_concurrency
+        self.retry_after_s = retry_after_s
+        self._client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive,
+                keepalive_expiry=keepalive_expiry_s,
+            ),
+            timeout=httpx.Timeout(timeout_s, connect=connect_timeout_s),
+        )
+        self._slot_freed = asyncio.Condition()
+
+    @classmethod
+    def from_settings(cls, settings: SLMSettings) -> OllamaPool:
+        return cls(
+            settings.ollama_urls or [settings.ollama_url],
+            max_concurrency=settings.ollama_max_concurrency,
+            max_connections=settings.ollama_max_connections,
+            max_keepalive=settings.ollama_max_keepalive,
+            keepalive_expiry_s=settings.ollama_keepalive_expiry_s,
+            connect_timeout_s=settings.ollama_connect_timeout_s,
+            timeout_s=settings.ollama_timeout_s,
+        )
+
+    def _pick(self, exclude: set[str]) -> OllamaBackend | None:
+        candidates = [
+            b for b in self.backends
+            if b.url not in exclude and b.outstanding < self.max_concurrency
+        ]
+        if not candidates:
+            return None
+        # Backends marked down are the last resort, not excluded outright
+        return min(candidates, key=lambda b: (not b.available, b.outstanding))
+
+    @asynccontextmanager
+    async def _acquire(self, exclude: set[str]) -> AsyncIterator[OllamaBackend]:
+        async with self._slot_freed:
+            backend = self._pick(exclude)
+            while backend is None:
+                await self._slot_freed.wait()
+                backend = self._pick(exclude)
+            backend.outstanding += 1
+            backend.requests += 1
+        try:
+            yield backend
+        finally:
+            async with self._slot_freed:
+                backend.outstanding -= 1
+                self._slot_freed.notify()
+
+    async def post(self, path: str, payload: dict) -> httpx.Response:
+        """POST ``payload`` to ``path`` on the least-busy backend; raises on HTTP errors."""
+        tried: set[str] = set()
+        while True:
+            async with self._acquire(tried) as backend:
+                try:
+                    resp = await self._client.post(f"{backend.url}{path}", json=payload)
+                except (httpx.ConnectError, httpx.ConnectTimeout):
+                    backend.failures += 1
+                    backend.down_until = time.monotonic() + self.retry_after_s
+                    tried.add(backend.url)
+                    if len(tried) == len(self.backends):
+                        raise
+                    logger.warning("Ollama backend %s unreachable, retrying elsewhere", backend.url)
+                    continue
+            resp.raise_for_status()
+            return resp
+
+    async def stream_lines(self, path: str, payload: dict) -> AsyncIterator[str]:
+        """Like ``post``, but yield the response body line by line as it arrives.
+
+        The backend slot is held until the body is fully read or the caller
+        stops iterating.
+        """
+        tried: set[str] = set()
+        while True:
+            async with self._acquire(tried) as backend:
+                try:
+                    async with self._client.stream("POST", f"{backend.url}{path}", json=payload) as resp:
+                        resp.raise_for_status()
+                        async for line in resp.aiter_lines():
+                            yield line
+                    return
+                except (httpx.ConnectError, httpx.ConnectTimeout):
+                    backend.failures += 1
+                    backend.down_until = time.monotonic() + self.retry_after_s
+                    tried.add(backend.url)
+                    if len(tried) == len(self.backends):
+                        raise
+                    logger.warning("Ollama backend %s unreachable, retrying elsewhere", backend.url)
+
+    def stats(self) -> list[dict]:
+        return [
+            {
+                "url": b.url,
+                "available": b.available,
+                "outstanding": b.outstanding,
+                "requests": b.requests,
+                "failures": b.failures,
+            }
+            for b in self.backends
+        ]
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+def get_pool(settings: SLMSettings | None = None) -> OllamaPool:
+    global _pool
+    if _pool is None:
+        _pool = OllamaPool.from_settings(settings or SLMSettings())
+    return _pool
+
+
+async def close_pool() -> None:
+    global _pool
+    if _pool is not None:
+        await _pool.aclose()
+        _pool = None
+
+
+def _chat_payload(messages: list[dict[str, str]], settings: SLMSettings, stream: bool) -> dict:
+    return {
         "model": settings.model_name,
         "messages": messages,
-        "stream": False,
+        "stream": stream,
         "options": {
             "temperature": settings.temperature,
             "num_predict": settings.max_tokens,
@@ -29,8 +189,39 @@ async def chat_completion(
         "format": "json",
     }
 
-    async with httpx.AsyncClient(timeout=120.0) as client:
-        resp = await client.post(url, json=payload)
-        resp.raise_for_status()
-        data = resp.json()
-        return data["message"]["content"]
+
+async def chat_completion(
+    messages: list[dict[str, str]],
+    settings: SLMSettings | None = None,
+) -> str:
+    """Call Ollama /api/chat and return the assistant message content."""
+    settings = settings or SLMSettings()
+    started = time.perf_counter()
+    resp = await get_pool(settings).post("/api/chat", _chat_payload(messages, settings, stream=False))
+    data = resp.json()
+    observe_generation("complete", time.perf_counter() - started, data)
+    return data["message"]["content"]
+
+
+async def chat_completion_stream(
+    messages: list[dict[str, str]],
+    settings: SLMSettings | None = None,
+) -> AsyncIterator[str]:
+    """Call Ollama /api/chat with streaming on and yield content pieces as they are generated."""
+    settings = settings or SLMSettings()
+    payload = _chat_payload(messages, settings, stream=True)
+    started = time.perf_counter()
+    # aclosing releases the backend slot as soon as iteration stops
+    async with aclosing(get_pool(settings).stream_lines("/api/chat", payload)) as lines:
+        async for line in lines:
+            if not line:
+                continue
+            data = json.loads(line)
+            if "error" in data:
+                raise RuntimeError(f"Ollama error: {data['error']}")
+            content = data.get("message", {}).get("content")
+            if content:
+                yield content
+            if data.get("done"):
+                observe_generation("stream", time.perf_counter() - started, data)
+                break
@@ -2,6 +2,9 @@ from __future__ import annotations
 
 from typing import Optional
 
+# Bump when prompt wording or templating changes, so cached analyses are not reused
+PROMPT_VERSION = 1
+
 SYSTEM_PROMPT = """\
 You are an expert meeting analyst specializing in workplace compliance and HR policy.
 Analyze the provided transcript and produce a structured JSON response.
@@ -31,14 +34,29 @@ If no risks are found, return an empty risks array.
 """
 
 
+REDUCE_SYSTEM_PROMPT = """\
+You are an expert meeting analyst. You are given summaries of consecutive
+parts of one meeting, in order. Combine them into a single concise summary of
+the whole meeting.
+
+You MUST respond with valid JSON matching this schema:
+{
+  "summary": "string — concise summary of the whole meeting"
+}
+"""
+
+
 def build_user_prompt(
     formatted_transcript: str,
     meeting_type: str = "general",
     department: Optional[str] = None,
+    part: Optional[tuple[int, int]] = None,
 ) -> str:
     context_parts = [f"Meeting type: {meeting_type}"]
     if department:
         context_parts.append(f"Department: {department}")
+    if part is not None:
+        context_parts.append(f"Transcript part {part[0]} of {part[1]}; analyze only this part.")
 
     return f"""\
 {chr(10).join(context_parts)}
@@ -57,3 +75,11 @@ def format_transcript(segments: list[dict]) -> str:
         start = seg.get("start_time", 0.0)
         lines.append(f"[{start:.1f}s] {speaker}: {text}")
     return "\n".join(lines)
+
+
+def build_reduce_prompt(summaries: list[str]) -> str:
+    parts = "\n\n".join(f"Part {i}:\n{summary}" for i, summary in enumerate(summaries, 1))
+    return f"""\
+{parts}
+
+Combine these into one summary and respond with the JSON structure specified."""
@@ -1,15 +1,33 @@
+import asyncio
+import threading
+import time
+from pathlib import Path
+
 import numpy as np
 import pytest
 
-from asr_service.models import ChunkResult, DiarizedSegment
+from asr_service import transcriber
+from asr_service import diarizer as diarizer_module
+from asr_service import warmup as warmup_module
+from asr_service import batch as batch_module
+from asr_service.audio_buffer import AudioBuffer
+from asr_service.diarizer import SlidingWindowDiarizer, TurnIndex
+from asr_service.executor import InferenceExecutor
+from asr_service import model_registry
+from asr_service.model_registry import ModelKey, ModelRegistry
+from asr_service.models import ChunkResult, DiarizedSegment, Word
 from asr_service.session import StreamSession
+from asr_service.speaker_store import SessionSpeakers, SpeakerStore
+from asr_service.streaming import HypothesisBuffer
 from common.config import ASRSettings
+from common import wire
+from common.schemas import BatchFile, BatchRequest, StartMessage, TranscriptCompleteMessage
 
 
 class TestStreamSession:
     @pytest.fixture
     def session(self):
-        settings = ASRSettings(chunk_duration_s=0.5, hf_token="")
+        settings = ASRSettings(chunk_duration_s=0.5, vad_chunking=False, hf_token="")
         return StreamSession(stream_id="test", settings=settings)
 
     def test_add_audio_and_has_chunk(self, session):
@@ -35,12 +53,405 @@ class TestStreamSession:
         chunk, offset = result
         assert len(chunk) == 4000
 
+    def test_chunker_and_diarizer_share_buffer(self, session):
+        session.add_audio(np.full(8000, 16384, dtype=np.int16).tobytes())
+        chunk, _ = session.pop_chunk()
+        assert np.shares_memory(chunk, session.diarizer._buffer.view(0))
+        assert chunk[0] == pytest.approx(0.5)
+        # Diarizer still needs the audio, so nothing is trimmed
+        assert session.audio.start_sample == 0
+
+    def test_buffer_trimmed_without_diarization(self):
+        settings = ASRSettings(chunk_duration_s=0.5, vad_chunking=False, hf_token="")
+        session = StreamSession(stream_id="test", settings=settings, diarize=False)
+        session.add_audio(np.zeros(12000, dtype=np.int16).tobytes())
+        _, offset = session.pop_chunk()
+        assert session.audio.start_sample == 8000
+        assert len(session.audio) == 4000
+        chunk, offset = session.flush()
+        assert offset == 0.5
+        assert len(chunk) == 4000
+
+    def test_chunks_readable_after_spill(self, tmp_path):
+        settings = ASRSettings(
+            chunk_duration_s=0.5,
+            vad_chunking=False,
+            session_memory_budget_mb=0.05,
+            spill_dir=str(tmp_path),
+        )
+        session = StreamSession(stream_id="test", settings=settings)
+        pcm = (np.arange(48000) % 1000).astype(np.int16)
+        session.add_audio(pcm.tobytes())
+        assert session.audio.spilled_samples > 0
+        chunk, offset = session.pop_chunk()
+        np.testing.assert_allclose(chunk * 32768.0, pcm[:8000])
+        session.close()
+
     def test_segment_id_increments(self, session):
         assert session.next_segment_id() == 0
         assert session.next_segment_id() == 1
         assert session.next_segment_id() == 2
 
 
+class TestVadChunking:
+    @staticmethod
+    def tone(seconds, amplitude=0.3):
+        t = np.arange(int(seconds * 16000)) / 16000
+        return (amplitude * 32767 * np.sin(2 * np.pi * 220 * t)).astype(np.int16).tobytes()
+
+    @staticmethod
+    def silence(seconds):
+        return np.zeros(int(seconds * 16000), dtype=np.int16).tobytes()
+
+    @pytest.fixture
+    def session(self):
+        settings = ASRSettings(vad_min_chunk_s=1.0, vad_max_chunk_s=4.0, vad_min_silence_ms=300)
+        return StreamSession(stream_id="test", settings=settings, diarize=False)
+
+    def feed(self, session, pcm, frame_bytes=640):
+        chunks = []
+        for i in range(0, len(pcm), frame_bytes):
+            session.add_audio(pcm[i:i + frame_bytes])
+            while session.has_chunk():
+                chunks.append(session.pop_chunk())
+        return chunks
+
+    def test_silence_never_becomes_a_chunk(self, session):
+        assert self.feed(session, self.silence(5.0)) == []
+        assert session.flush() is None
+        assert session.skipped_samples > 4.5 * 16000
+        assert len(session.audio) < 16000
+
+    def test_cuts_at_pause_and_skips_leading_silence(self, session):
+        pcm = self.silence(2.0) + self.tone(1.5) + self.silence(1.0) + self.tone(1.2)
+        chunks = self.feed(session, pcm)
+        assert len(chunks) == 1
+        chunk, offset = chunks[0]
+        # Starts just before the speech and ends inside the pause
+        assert 1.8 <= offset < 2.0
+        assert 3.5 < offset + len(chunk) / 16000 < 4.0
+
+        chunk, offset = session.flush()
+        assert offset < 4.5
+        assert offset + len(chunk) / 16000 == pytest.approx(5.7)
+
+    def test_long_speech_cut_at_max_duration(self, session):
+        chunks = self.feed(session, self.tone(9.0))
+        assert len(chunks) == 2
+        assert all(1.0 <= len(c) / 16000 <= 4.0 for c, _ in chunks)
+        assert chunks[1][1] == pytest.approx(chunks[0][1] + len(chunks[0][0]) / 16000)
+
+    def test_skipped_silence_counts_as_decoded(self, session):
+        [(chunk, offset)] = self.feed(session, self.tone(1.5) + self.silence(10.0))
+        assert session.audio_in_flight_s > 10.0
+        # As set by the worker once the chunk is back
+        session.decoded_time = offset + len(chunk) / 16000
+        self.feed(session, self.silence(0.1))
+        assert session.audio_in_flight_s < 0.5
+
+
+class TestLocalAgreement:
+    @staticmethod
+    def words(text, start=0.0, step=0.5):
+        return [
+            Word(text=" " + w, start_time=start + i * step, end_time=start + (i + 1) * step, probability=0.9)
+            for i, w in enumerate(text.split())
+        ]
+
+    def test_commits_prefix_two_decodes_agree_on(self):
+        hyp = HypothesisBuffer()
+        assert hyp.insert(self.words("hello world how")) == []
+        committed = hyp.insert(self.words("Hello, world how are"))
+        assert [w.text for w in committed] == [" Hello,", " world", " how"]
+        assert [w.text for w in hyp.tentative] == [" are"]
+        assert hyp.committed_until == 1.5
+
+    def test_overlap_with_committed_text_is_not_repeated(self):
+        hyp = HypothesisBuffer()
+        hyp.insert(self.words("one two three"))
+        hyp.insert(self.words("one two three"))
+        # Re-decode starts slightly before the committed point and repeats "three"
+        redecoded = self.words("three four five", start=1.45)
+        assert hyp.insert(redecoded) == []
+        assert [w.text for w in hyp.tentative] == [" four", " five"]
+        assert hyp.prompt(8) == "wo three"
+
+    def test_final_commits_everything(self):
+        hyp = HypothesisBuffer()
+        hyp.insert(self.words("a b"))
+        assert len(hyp.insert(self.words("a c d"), final=True)) == 3
+        assert hyp.tentative == []
+
+    def test_window_cut_at_committed_point(self):
+        settings = ASRSettings(stream_mode="local_agreement", stream_window_s=2.0, vad_chunking=False)
+        session = StreamSession(stream_id="test", settings=settings, diarize=False)
+        streamer = session.streamer
+        session.add_audio(np.zeros(16000, dtype=np.int16).tobytes())
+        assert session.has_stream_window()
+        audio, offset = streamer.next_window()
+        assert (len(audio), offset) == (16000, 0.0)
+        assert not session.has_stream_window()
+
+        session.add_audio(np.zeros(40000, dtype=np.int16).tobytes())
+        streamer.merge_window(self.words("a b c d"), 3.5)
+        audio, offset = streamer.next_window()
+        committed, tentative = streamer.merge_window(self.words("a b c d e"), 3.5)
+        assert len(committed) == 4 and len(tentative) == 1
+        # Window was longer than 2 s, so it now starts after the committed words
+        assert streamer.retain_from == 32000
+        session.trim()
+        assert session.audio.start_sample == 32000
+        assert session.flush() is None
+
+
+class TestSpeakerStore:
+    A = np.array([1.0, 0.0, 0.0], dtype=np.float32)
+    B = np.array([0.0, 1.0, 0.0], dtype=np.float32)
+    C = np.array([0.0, 0.0, 1.0], dtype=np.float32)
+
+    @pytest.mark.asyncio
+    async def test_enroll_and_identify_across_reload(self, tmp_path):
+        path = str(tmp_path / "voices.npz")
+        store = SpeakerStore(path)
+        mapping = await SessionSpeakers(store).finish(
+            {"SPEAKER_00": self.A, "SPEAKER_01": self.B}, {"SPEAKER_00": 3, "SPEAKER_01": 2}, "standup"
+        )
+        assert mapping == {"SPEAKER_00": "VOICE_0000", "SPEAKER_01": "VOICE_0001"}
+
+        reloaded = SpeakerStore(path)
+        assert len(reloaded) == 2
+        # Labels are per session; profiles follow the voice
+        found = reloaded.identify({"SPEAKER_00": self.B + 0.1, "SPEAKER_01": self.C})
+        assert found == {"SPEAKER_00": "VOICE_0001"}
+        best, distance = reloaded.nearest(np.stack([self.A, self.C]))
+        assert best[0] == 0 and distance[0] == pytest.approx(0.0, abs=1e-6)
+        assert reloaded.speaker_hints("standup") == (2, 3)
+        assert reloaded.speaker_hints("other") == (None, None)
+
+    def test_identify_is_one_to_one(self, tmp_path):
+        store = SpeakerStore(str(tmp_path / "voices.npz"))
+        store.enroll({"x": self.A}, {"x": 1}, {})
+        found = store.identify({"SPEAKER_00": self.A, "SPEAKER_01": self.A + 0.05})
+        assert found == {"SPEAKER_00": "VOICE_0000"}
+
+    def test_least_recently_enrolled_profiles_are_evicted(self, tmp_path, monkeypatch):
+        now = [100.0]
+        monkeypatch.setattr("asr_service.speaker_store.time.time", lambda: now[0])
+        store = SpeakerStore(str(tmp_path / "voices.npz"), max_profiles=2)
+        store.enroll({"x": self.A, "y": self.B}, {}, {})
+        now[0] += 1
+        store.enroll({"x": self.A}, {}, {"x": "VOICE_0000"})  # A is now the most recent
+        now[0] += 1
+        assert store.enroll({"z": self.C}, {}, {}) == {"z": "VOICE_0002"}
+        assert store.ids == ["VOICE_0000", "VOICE_0002"]
+        store.save()
+        assert SpeakerStore(store.path).ids == ["VOICE_0000", "VOICE_0002"]
+
+    @pytest.mark.asyncio
+    async def test_unknown_voices_not_enrolled_when_disabled(self, tmp_path):
+        store = SpeakerStore(str(tmp_path / "voices.npz"))
+        store.enroll({"x": self.A}, {}, {})
+        mapping = await SessionSpeakers(store).finish({"S0": self.A, "S1": self.C}, {}, enroll_new=False)
+        assert mapping == {"S0": "VOICE_0000"}
+        assert len(SpeakerStore(store.path)) == 1
+
+    def test_session_lookups_are_cached(self, tmp_path, monkeypatch):
+        store = SpeakerStore(str(tmp_path / "voices.npz"))
+        store.enroll({"x": self.A}, {"x": 1}, {})
+        calls = []
+        identify = store.identify
+        monkeypatch.setattr(store, "identify", lambda c: calls.append(sorted(c)) or identify(c))
+
+        speakers = SessionSpeakers(store)
+        speakers.update({"SPEAKER_00": self.A}, {"SPEAKER_00": 1})
+        speakers.update({"SPEAKER_00": self.A}, {"SPEAKER_00": 1})
+        speakers.update({"SPEAKER_00": self.A, "SPEAKER_01": self.C}, {"SPEAKER_00": 1, "SPEAKER_01": 1})
+        speakers.update({"SPEAKER_00": self.A}, {"SPEAKER_00": 2})
+        assert calls == [["SPEAKER_00"], ["SPEAKER_01"], ["SPEAKER_00"]]
+        assert speakers.speaker_map({"SPEAKER_00": self.A}, {"SPEAKER_00": 2}) == {
+            "SPEAKER_00": "VOICE_0000"
+        }
+
+
+class TestAudioBuffer:
+    def test_append_grows_and_keeps_absolute_indices(self):
+        buf = AudioBuffer(initial_capacity=4)
+        for i in range(10):
+            buf.append(np.full(3, i, dtype=np.float32))
+        assert len(buf) == 30
+        assert buf.end_sample == 30
+        np.testing.assert_array_equal(buf.view(27, 30), [9, 9, 9])
+
+    def test_views_survive_growth_and_discard(self):
+        buf = AudioBuffer(initial_capacity=4)
+        buf.append(np.arange(4, dtype=np.float32))
+        view = buf.view(0, 4)
+        buf.discard_before(4)
+        buf.append(np.arange(100, dtype=np.float32))
+        np.testing.assert_array_equal(view, [0, 1, 2, 3])
+        assert buf.start_sample == 4
+
+    def test_view_outside_retained_range_raises(self):
+        buf = AudioBuffer()
+        buf.append(np.zeros(10, dtype=np.float32))
+        buf.discard_before(5)
+        with pytest.raises(IndexError):
+            buf.view(0, 10)
+        with pytest.raises(IndexError):
+            buf.view(5, 11)
+
+    def test_spills_over_budget_and_reads_back(self, tmp_path):
+        buf = AudioBuffer(initial_capacity=16, max_memory_samples=100, spill_dir=str(tmp_path))
+        for i in range(10):
+            buf.append(np.arange(i * 50, (i + 1) * 50, dtype=np.float32))
+        assert buf.end_sample - buf.memory_start <= 100
+        assert buf.spilled_samples > 0
+        assert len(list(tmp_path.iterdir())) == 1
+        np.testing.assert_array_equal(buf.read(0, 500), np.arange(500))
+        assert isinstance(buf.read(0, 50), np.memmap)
+
+    def test_spill_file_dropped_once_released(self, tmp_path):
+        buf = AudioBuffer(initial_capacity=16, max_memory_samples=100, spill_dir=str(tmp_path))
+        buf.append(np.arange(400, dtype=np.float32))
+        held = buf.read(0, 10)
+        buf.discard_before(buf.memory_start)
+        assert list(tmp_path.iterdir()) == []
+        # Memmaps taken earlier stay readable after the file is unlinked
+        np.testing.assert_array_equal(held, np.arange(10))
+
+    def test_append_pcm16(self):
+        buf = AudioBuffer()
+        buf.append_pcm16(np.array([0, 16384, -32768], dtype=np.int16).tobytes())
+        np.testing.assert_allclose(buf.view(0), [0.0, 0.5, -1.0])
+
+
+class TestSlidingWindowDiarizer:
+    E1 = np.array([1.0, 0.0, 0.0], dtype=np.float32)
+    E2 = np.array([0.0, 1.0, 0.0], dtype=np.float32)
+
+    @pytest.fixture
+    def diarizer(self):
+        d = SlidingWindowDiarizer(window_seconds=3.0, step_seconds=2.0, sample_rate=100)
+        d.add_audio(np.zeros(1000, dtype=np.float32))
+        return d
+
+    def test_windows_advance_by_step(self, diarizer):
+        assert diarizer.has_window()
+        audio, offset = diarizer.next_window()
+        assert (len(audio), offset) == (300, 0.0)
+        diarizer.merge_window([], {}, offset)
+        audio, offset = diarizer.next_window()
+        assert offset == 2.0
+        assert diarizer.retain_from == 200
+
+    def test_speakers_matched_across_windows_by_embedding(self, diarizer):
+        diarizer.merge_window(
+            [(0.0, 1.5, "A"), (1.5, 3.0, "B")], {"A": self.E1, "B": self.E2}, 0.0
+        )
+        # Same voices, local labels swapped in the next window
+        diarizer.merge_window(
+            [(2.0, 3.5, "A"), (3.5, 5.0, "B")], {"A": self.E2 * 2, "B": self.E1 + 0.05}, 2.0
+        )
+        result = diarizer.reconcile().to_dict()
+        assert result == {
+            (0.0, 1.5): "SPEAKER_00",
+            (1.5, 3.5): "SPEAKER_01",
+            (3.5, 4.5): "SPEAKER_00",
+        }
+
+    def test_turns_committed_up_to_overlap_midpoint(self, diarizer):
+        diarizer.merge_window([(0.0, 3.0, "A")], {"A": self.E1}, 0.0)
+        assert diarizer.reconcile().to_dict() == {(0.0, 2.5): "SPEAKER_00"}
+
+    def test_new_speaker_when_embedding_far(self, diarizer):
+        diarizer.merge_window([(0.0, 1.0, "A")], {"A": self.E1}, 0.0)
+        diarizer.merge_window([(2.5, 3.5, "A")], {"A": self.E2}, 2.0)
+        assert set(diarizer.reconcile().labels) == {"SPEAKER_00", "SPEAKER_01"}
+
+    def test_diarize_runs_windows_and_final_tail(self, diarizer, monkeypatch):
+        calls = []
+
+        def fake_window(audio, offset, **kwargs):
+            calls.append((offset, len(audio)))
+            return [(offset, offset + len(audio) / 100, "A")], {"A": self.E1}
+
+        monkeypatch.setattr(diarizer_module, "diarize_window", fake_window)
+        result = diarizer.diarize()
+        assert calls == [(0.0, 300), (2.0, 300), (4.0, 300), (6.0, 300), (8.0, 200)]
+        assert result.to_dict() == {(0.0, 10.0): "SPEAKER_00"}
+
+    def test_session_trims_after_diarizer_advances(self):
+        settings = ASRSettings(
+            chunk_duration_s=0.5, vad_chunking=False, diarize_window_s=1.0, diarize_step_s=0.5
+        )
+        session = StreamSession(stream_id="test", settings=settings)
+        session.add_audio(np.zeros(16000, dtype=np.int16).tobytes())
+        session.pop_chunk()
+        session.pop_chunk()
+        assert session.audio.start_sample == 0
+        _, offset = session.diarizer.next_window()
+        session.diarizer.merge_window([], {}, offset)
+        session.trim()
+        assert session.audio.start_sample == 8000
+
+
+class TestSpeakerAssignment:
+    @staticmethod
+    def linear_assign(start, end, diarization, min_overlap):
+        best_speaker, best_overlap = None, 0.0
+        for (d_start, d_end), speaker in diarization.items():
+            overlap = max(0.0, min(end, d_end) - max(start, d_start))
+            if overlap > best_overlap:
+                best_overlap, best_speaker = overlap, speaker
+        if best_overlap < min_overlap and end - start > min_overlap:
+            return None
+        return best_speaker
+
+    def test_matches_linear_scan(self):
+        rng = np.random.default_rng(0)
+        starts = np.sort(rng.uniform(0, 600, 400)).round(3)
+        turns = {
+            (float(s), float(round(s + rng.uniform(0.1, 8.0), 3))): f"SPEAKER_{rng.integers(4):02d}"
+            for s in starts
+        }
+        seg_starts = rng.uniform(0, 600, 500).round(3)
+        seg_ends = (seg_starts + rng.uniform(0.05, 6.0, 500)).round(3)
+
+        d = SlidingWindowDiarizer()
+        got = d.assign_speakers(seg_starts, seg_ends, TurnIndex.from_dict(turns))
+        expected = [
+            self.linear_assign(s, e, turns, d.MIN_OVERLAP_SECONDS) for s, e in zip(seg_starts, seg_ends)
+        ]
+        assert got == expected
+
+    def test_long_turn_does_not_widen_every_search(self):
+        rng = np.random.default_rng(1)
+        starts = np.arange(0.0, 3600.0, 2.0)
+        turns = [(0.0, 3600.0, "LONG")] + [(float(s), float(s) + 1.5, f"S{i % 3}") for i, s in enumerate(starts)]
+        index = TurnIndex(turns)
+        seg_starts = rng.uniform(0, 3590, 300).round(3)
+        seg_ends = seg_starts + 1.0
+        pairs = sum(len(index._candidates(b, seg_starts, seg_ends)[0]) for b in index._buckets)
+        assert pairs < 10 * len(seg_starts)  # not segments x turns
+        expected = [
+            self.linear_assign(s, e, {(t[0], t[1]): t[2] for t in turns}, 0.0) for s, e in zip(seg_starts, seg_ends)
+        ]
+        assert index.assign(seg_starts, seg_ends) == expected
+
+    def test_min_overlap_rule(self):
+        d = SlidingWindowDiarizer()
+        index = TurnIndex([(0.0, 1.0, "SPEAKER_00")])
+        # 0.2s overlap on a 2s segment is rejected, a 0.2s segment is kept
+        assert d.assign_speakers([0.8, 0.8], [2.8, 1.0], index) == [None, "SPEAKER_00"]
+
+    def test_nested_turns_and_ties(self):
+        index = TurnIndex([(0.0, 10.0, "A"), (2.0, 3.0, "B"), (4.0, 6.0, "C")])
+        best_turn, best = index.best_overlap([2.0, 4.5, 11.0], [3.0, 5.5, 12.0])
+        assert list(index.labels[best_turn[:2]]) == ["A", "A"]
+        assert best_turn[2] == -1
+        assert SlidingWindowDiarizer().assign_speaker(4.5, 5.5, {(0.0, 10.0): "A"}) == "A"
+
+
 class TestModels:
     def test_chunk_result(self):
         r = ChunkResult(text="hello", start_time=0.0, end_time=1.0)
@@ -49,3 +460,530 @@ class TestModels:
     def test_diarized_segment(self):
         d = DiarizedSegment(text="hi", start_time=0.0, end_time=1.0, speaker="SPEAKER_00")
         assert d.speaker == "SPEAKER_00"
+
+
+class TestInferenceExecutor:
+    @pytest.mark.asyncio
+    async def test_run_returns_result(self):
+        executor = InferenceExecutor(workers=1)
+        assert await executor.run(sum, [1, 2, 3]) == 6
+        assert executor.stats()["completed"] == 1
+        executor.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_queue_depth_and_wait_time(self):
+        executor = InferenceExecutor(workers=1, max_queue=4)
+        tasks = [asyncio.create_task(executor.run(time.sleep, 0.05)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        assert executor.queue_depth == 2
+        await asyncio.gather(*tasks)
+        stats = executor.stats()
+        assert stats["queue_depth"] == 0
+        assert stats["max_wait_s"] >= 0.05
+        executor.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_bounded_queue_blocks_callers(self):
+        executor = InferenceExecutor(workers=1, max_queue=1)
+        tasks = [asyncio.create_task(executor.run(time.sleep, 0.05)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        # One running, one queued, the third is held back before the queue
+        assert executor.queue_depth == 1
+        assert executor.saturated
+        await asyncio.gather(*tasks)
+        executor.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_run_on_each_worker_visits_every_thread(self):
+        executor = InferenceExecutor(workers=3)
+        names = await executor.run_on_each_worker(lambda: threading.current_thread().name)
+        assert len(set(names)) == 3
+        executor.shutdown()
+
+
+class TestBatchScheduler:
+    @pytest.fixture
+    def fake_decode(self, monkeypatch):
+        batches = []
+
+        def fake_batch(chunks, language=None, tier=None):
+            batches.append(len(chunks))
+            return [[ChunkResult(text=language or "", start_time=offset, end_time=offset + 1.0)]
+                    for _, offset in chunks]
+
+        def fake_chunk(audio, offset, language=None, tier=None):
+            batches.append(1)
+            return [ChunkResult(text=language or "", start_time=offset, end_time=offset + 1.0)]
+
+        monkeypatch.setattr(transcriber, "transcribe_batch", fake_batch)
+        monkeypatch.setattr(transcriber, "transcribe_chunk", fake_chunk)
+        return batches
+
+    @pytest.mark.asyncio
+    async def test_gathers_chunks_into_one_batch(self, fake_decode):
+        executor = InferenceExecutor(workers=1)
+        scheduler = transcriber.BatchScheduler(executor, max_batch_size=4, max_wait_ms=50)
+        audio = np.zeros(1600, dtype=np.float32)
+        results = await asyncio.gather(*(scheduler.submit(audio, float(i), "en") for i in range(3)))
+        assert fake_decode == [3]
+        assert [r[0].start_time for r in results] == [0.0, 1.0, 2.0]
+        executor.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_chunks_without_language_are_not_batched(self, fake_decode):
+        executor = InferenceExecutor(workers=1)
+        scheduler = transcriber.BatchScheduler(executor, max_batch_size=4, max_wait_ms=50)
+        audio = np.zeros(1600, dtype=np.float32)
+        await asyncio.gather(*(scheduler.submit(audio, float(i)) for i in range(3)))
+        assert fake_decode == [1, 1, 1]
+        executor.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_full_batch_dispatches_without_waiting(self, fake_decode):
+        executor = InferenceExecutor(workers=1)
+        scheduler = transcriber.BatchScheduler(executor, max_batch_size=2, max_wait_ms=10_000)
+        audio = np.zeros(1600, dtype=np.float32)
+        await asyncio.wait_for(
+            asyncio.gather(scheduler.submit(audio, 0.0, "en"), scheduler.submit(audio, 1.0, "en")), timeout=1.0
+        )
+        assert fake_decode == [2]
+        executor.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_groups_by_language(self, fake_decode):
+        executor = InferenceExecutor(workers=1)
+        scheduler = transcriber.BatchScheduler(executor, max_batch_size=8, max_wait_ms=10)
+        audio = np.zeros(1600, dtype=np.float32)
+        results = await asyncio.gather(
+            scheduler.submit(audio, 0.0, "en"),
+            scheduler.submit(audio, 1.0, "de"),
+            scheduler.submit(audio, 2.0, "en"),
+        )
+        assert sorted(fake_decode) == [1, 2]
+        assert [r[0].text for r in results] == ["en", "de", "en"]
+        executor.shutdown()
+
+
+class TestWarmup:
+    class FakeModel:
+        def __init__(self):
+            self.calls = []
+
+        def transcribe(self, audio, **kwargs):
+            self.calls.append((len(audio), kwargs["vad_filter"]))
+            return iter([]), None
+
+    @pytest.mark.asyncio
+    async def test_ready_after_synthetic_passes(self, monkeypatch):
+        model = self.FakeModel()
+        batches = []
+        monkeypatch.setattr(warmup_module, "get_model", lambda settings=None: model)
+        monkeypatch.setattr(warmup_module, "transcribe_batch", lambda chunks, language: batches.append(len(chunks)))
+        monkeypatch.setattr(warmup_module, "get_pipeline", lambda *args: None)
+
+        settings = ASRSettings(vad_max_chunk_s=4.0, batch_max_size=8)
+        executor = InferenceExecutor(workers=2)
+        state = warmup_module.WarmupState()
+        await warmup_module.run_warmup(state, executor, settings)
+        executor.shutdown()
+
+        assert state.ready and state.error is None
+        assert model.calls == [(64000, False), (64000, False)]
+        assert batches == [4]
+        assert set(state.timings) == {"model_load_s", "decode_s", "batch_decode_s"}
+        assert state.to_dict()["warmup_s"] is not None
+
+    @pytest.mark.asyncio
+    async def test_failed_model_load_stays_not_ready(self, monkeypatch):
+        def broken(settings=None):
+            raise RuntimeError("no weights")
+
+        monkeypatch.setattr(warmup_module, "get_model", broken)
+        executor = InferenceExecutor(workers=1)
+        state = warmup_module.WarmupState()
+        await warmup_module.run_warmup(state, executor, ASRSettings())
+        executor.shutdown()
+        assert not state.ready
+        assert state.error == "RuntimeError: no weights"
+
+
+class TestModelRegistry:
+    TIERS = {
+        "large": ModelKey.parse("large-v3:float16"),
+        "medium": ModelKey.parse("medium:int8"),
+        "small": ModelKey.parse("small:int8:cpu"),
+    }
+
+    @pytest.fixture(autouse=True)
+    def fake_whisper(self, monkeypatch):
+        loads = []
+
+        class FakeWhisper:
+            def __init__(self, size, device, compute_type):
+                loads.append((size, compute_type, device))
+
+        monkeypatch.setattr(model_registry, "WhisperModel", FakeWhisper)
+        return loads
+
+    def test_model_key_parse_and_estimate(self):
+        key = ModelKey.parse("small:int8:cpu")
+        assert key == ModelKey("small", "int8", "cpu")
+        assert key.estimated_mb() == 244
+        assert ModelKey.parse("large-v3-turbo", device="cuda").estimated_mb() == 809 * 2
+        assert ModelKey.parse("distil-large-v3:float32").estimated_mb() == 756 * 4
+
+    def test_lru_eviction_under_budget(self, fake_whisper):
+        registry = ModelRegistry(self.TIERS, memory_budget_mb=1200)
+        small = registry.get("small")
+        registry.get("medium")
+        assert registry.get("small") is small  # cached, and now most recently used
+        registry.get("large")  # 3100 MB estimate: evicts both
+        assert registry.loaded_mb == 3100
+        registry.get("small")
+        assert [load[0] for load in fake_whisper] == ["small", "medium", "large-v3", "small"]
+        assert registry.stats()["tiers"]["small"]["loaded"]
+        assert not registry.stats()["tiers"]["medium"]["loaded"]
+
+    def test_loads_outside_the_lock_once_per_model(self, monkeypatch):
+        release = threading.Event()
+        loads = []
+
+        class SlowWhisper:
+            def __init__(self, size, device, compute_type):
+                loads.append(size)
+                if size == "large-v3":
+                    assert release.wait(5)
+
+        monkeypatch.setattr(model_registry, "WhisperModel", SlowWhisper)
+        registry = ModelRegistry(self.TIERS)
+        small = registry.get("small")
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(registry.get("large"))) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        while "large-v3" not in loads:
+            time.sleep(0.01)
+        assert registry.get("small") is small  # not blocked behind the slow load
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        assert loads == ["small", "large-v3"]
+        assert len(results) == 3 and all(model is results[0] for model in results)
+
+    def test_default_tier_and_degradation_order(self):
+        registry = ModelRegistry(self.TIERS, default_tier="medium")
+        assert registry.resolve(None) == "medium"
+        assert registry.smaller("large") == "medium"
+        assert registry.smaller("small") == "small"
+        with pytest.raises(ValueError, match="Unknown model tier"):
+            registry.resolve("huge")
+
+    def test_realtime_factor_reported_per_tier(self):
+        registry = ModelRegistry(self.TIERS)
+        registry.record("small", audio_s=10.0, compute_s=1.0)
+        registry.record("small", audio_s=10.0, compute_s=3.0)
+        tiers = registry.stats()["tiers"]
+        assert tiers["small"]["rtf"] == 0.2
+        assert tiers["small"]["decodes"] == 2
+        assert tiers["large"]["rtf"] is None
+
+    @pytest.mark.asyncio
+    async def test_scheduler_degrades_when_queue_is_deep(self, monkeypatch):
+        class FakeExecutor:
+            queue_depth = 0
+
+            async def run(self, fn, *args):
+                return fn(*args)
+
+        tiers = []
+        monkeypatch.setattr(
+            transcriber, "transcribe_chunk", lambda audio, offset, language, tier: tiers.append(tier) or []
+        )
+        executor = FakeExecutor()
+        scheduler = transcriber.BatchScheduler(
+            executor, max_batch_size=1, registry=ModelRegistry(self.TIERS), degrade_queue_depth=4
+        )
+        audio = np.zeros(1600, dtype=np.float32)
+        await scheduler.submit(audio, 0.0)
+        executor.queue_depth = 4
+        await scheduler.submit(audio, 1.0, tier="large")
+        await scheduler.submit(audio, 2.0, tier="small")
+        assert tiers == ["large", "medium", "small"]
+        assert scheduler.stats()["degraded_chunks"] == 1
+
+
+class TestBatchTranscription:
+    @staticmethod
+    def speech_with_pauses():
+        tone = TestVadChunking.tone
+        silence = TestVadChunking.silence
+        pcm = silence(1.0) + tone(2.0) + silence(1.0) + tone(1.5) + silence(3.0)
+        return np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+
+    def test_split_at_pauses_skips_silence(self):
+        spans = batch_module.split_at_pauses(self.speech_with_pauses(), ASRSettings())
+        assert len(spans) == 2
+        (s1, e1), (s2, e2) = spans
+        assert 0.8 * 16000 <= s1 < 16000 and 3 * 16000 < e1 < 4 * 16000
+        assert 3.8 * 16000 <= s2 < 4 * 16000 and e2 < 6 * 16000
+
+    def test_collect_files_from_directory_and_manifest(self, tmp_path):
+        (tmp_path / "a.wav").write_bytes(b"")
+        (tmp_path / "notes.txt").write_bytes(b"")
+        manifest = tmp_path / "list.txt"
+        manifest.write_text('a.wav\n# comment\n{"path": "b.mp3", "stream_id": "bee", "language": "de"}\n')
+        files = batch_module.collect_files(
+            BatchRequest(directory=str(tmp_path), manifest=str(manifest)), root=str(tmp_path)
+        )
+        assert [Path(f.path).name for f in files] == ["a.wav", "a.wav", "b.mp3"]
+        assert (files[2].stream_id, files[2].language) == ("bee", "de")
+
+        with pytest.raises(ValueError, match="outside the batch root"):
+            batch_module.collect_files(
+                BatchRequest(files=[BatchFile(path="/etc/passwd")]), root=str(tmp_path)
+            )
+        with pytest.raises(ValueError, match="No audio files"):
+            batch_module.collect_files(BatchRequest())
+
+    def test_stream_id_cannot_escape_output_dir(self, tmp_path):
+        (tmp_path / "a.wav").write_bytes(b"")
+        for stream_id in ("../../etc/cron.d/x", "sub/x", "..", "a\\b"):
+            request = BatchRequest(files=[BatchFile(path=str(tmp_path / "a.wav"), stream_id=stream_id)])
+            with pytest.raises(ValueError, match="Invalid stream_id"):
+                batch_module.collect_files(request, root=str(tmp_path))
+
+    def test_batch_endpoint_disabled_without_root(self, monkeypatch):
+        from fastapi.testclient import TestClient
+        from asr_service import main as asr_main
+
+        monkeypatch.setattr(asr_main.settings, "batch_root", "")
+        resp = TestClient(asr_main.app).post("/batch", json={"files": [{"path": "/etc/passwd"}]})
+        assert resp.status_code == 403
+
+    def test_oversized_upload_rejected(self, monkeypatch):
+        from fastapi.testclient import TestClient
+        from asr_service import main as asr_main
+
+        monkeypatch.setattr(asr_main.settings, "batch_max_upload_mb", 1 / 1024)  # 1 KiB
+        client = TestClient(asr_main.app)
+        assert client.post("/batch/file", content=b"\0" * 2048).status_code == 413
+        chunked = client.post("/batch/file", content=(b"\0" * 512 for _ in range(4)))
+        assert chunked.status_code == 413
+
+    @pytest.mark.asyncio
+    async def test_fans_out_chunks_and_diarizes_once(self, monkeypatch):
+        decoded = []
+
+        def fake_chunk(audio, offset, language=None, tier=None):
+            decoded.append(round(offset, 2))
+            return [ChunkResult(text="x", start_time=offset, end_time=offset + len(audio) / 16000)]
+
+        diarized = []
+
+        def fake_diarize(audio, offset, **kwargs):
+            diarized.append(len(audio))
+            return [(0.0, 3.5, "SPEAKER_00"), (3.5, 9.0, "SPEAKER_01")], {}
+
+        monkeypatch.setattr(transcriber, "transcribe_chunk", fake_chunk)
+        monkeypatch.setattr(batch_module, "diarize_window", fake_diarize)
+        split_threads = []
+        split = batch_module.split_at_pauses
+        monkeypatch.setattr(
+            batch_module,
+            "split_at_pauses",
+            lambda *args: split_threads.append(threading.current_thread()) or split(*args),
+        )
+        executor = InferenceExecutor(workers=2)
+        scheduler = transcriber.BatchScheduler(executor, max_batch_size=1)
+        batch = batch_module.BatchTranscriber(executor, scheduler, ASRSettings())
+
+        audio = self.speech_with_pauses()
+        message = await batch.transcribe(audio, "file-1")
+        executor.shutdown()
+
+        assert split_threads and split_threads[0] is not threading.main_thread()
+
+        assert sorted(decoded) == [0.84, 3.84]
+        assert diarized == [len(audio)]
+        assert [s.speaker for s in message.segments] == ["SPEAKER_00", "SPEAKER_01"]
+        assert [s.segment_id for s in message.segments] == [0, 1]
+        assert all(s.status == "final" for s in message.segments)
+
+    @pytest.mark.asyncio
+    async def test_files_decoded_a_few_at_a_time(self, monkeypatch, tmp_path):
+        active = peak = 0
+
+        def fake_decode(path, sampling_rate):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            return np.zeros(16000, dtype=np.float32)
+
+        async def fake_transcribe(audio, stream_id, **kwargs):
+            nonlocal active
+            await asyncio.sleep(0.01)
+            active -= 1
+            return TranscriptCompleteMessage(stream_id=stream_id, segments=[])
+
+        monkeypatch.setattr(batch_module, "decode_audio", fake_decode)
+        executor = InferenceExecutor(workers=1)
+        batch = batch_module.BatchTranscriber(
+            executor, transcriber.BatchScheduler(executor), ASRSettings(batch_max_files=2)
+        )
+        monkeypatch.setattr(batch, "transcribe", fake_transcribe)
+        files = [BatchFile(path=str(tmp_path / f"{i}.wav")) for i in range(6)]
+        lines = [line async for line in batch.run(files, BatchRequest(files=files, diarize=False))]
+        executor.shutdown()
+        assert len(lines) == 7
+        assert peak == 2
+
+    @pytest.mark.asyncio
+    async def test_closing_the_stream_cancels_unfinished_files(self, monkeypatch, tmp_path):
+        cancelled = []
+
+        async def slow_item(item, request):
+            try:
+                await asyncio.sleep(0 if item.path.endswith("0.wav") else 10)
+            except asyncio.CancelledError:
+                cancelled.append(item.path)
+                raise
+            return "{}", 1.0
+
+        executor = InferenceExecutor(workers=1)
+        batch = batch_module.BatchTranscriber(executor, transcriber.BatchScheduler(executor), ASRSettings())
+        monkeypatch.setattr(batch, "_transcribe_item", slow_item)
+        files = [BatchFile(path=str(tmp_path / f"{i}.wav")) for i in range(3)]
+        lines = batch.run(files, BatchRequest(files=files, diarize=False))
+        assert await lines.__anext__() == "{}\n"
+        await lines.aclose()  # the client went away
+        executor.shutdown()
+        assert len(cancelled) == 2
+
+
+class TestMuxEndpoint:
+    @pytest.fixture
+    def asr_app(self, monkeypatch):
+        from asr_service import main as asr_main
+
+        def fake_chunk(audio, offset, language=None, tier=None):
+            return [ChunkResult(text=f"chunk@{offset}", start_time=offset, end_time=offset + len(audio) / 16000)]
+
+        def fake_batch(chunks, language=None, tier=None):
+            return [fake_chunk(audio, offset) for audio, offset in chunks]
+
+        monkeypatch.setattr(transcriber, "transcribe_chunk", fake_chunk)
+        monkeypatch.setattr(transcriber, "transcribe_batch", fake_batch)
+        monkeypatch.setattr(asr_main.settings, "vad_chunking", False)
+        monkeypatch.setattr(asr_main.settings, "chunk_duration_s", 0.5)
+        monkeypatch.setattr(asr_main.settings, "mux_window_s", 1.0)
+        return asr_main
+
+    @staticmethod
+    def start_frame(channel: int, stream_id: str) -> bytes:
+        start = StartMessage(stream_id=stream_id, diarize=False, wire="binary")
+        return wire.encode_frame(wire.FrameKind.start, channel, start.model_dump_json().encode())
+
+    def test_streams_share_one_socket_with_credit(self, asr_app):
+        from fastapi.testclient import TestClient
+
+        pcm = (3000 * np.sin(np.arange(1600) * 0.05)).astype(np.int16).tobytes()  # 0.1 s
+        with TestClient(asr_app.app).websocket_connect("/mux") as ws:
+            ws.send_bytes(self.start_frame(1, "a"))
+            ws.send_bytes(self.start_frame(2, "b"))
+            for channel in (1, 2):
+                for _ in range(10):  # exactly the 1 s initial window
+                    ws.send_bytes(wire.encode_frame(wire.FrameKind.audio, channel, pcm))
+                ws.send_bytes(wire.encode_frame(wire.FrameKind.end, channel))
+
+            credit = {1: 0, 2: 0}
+            complete = {}
+            closed = set()
+            while closed != {1, 2}:
+                frame = wire.decode_frame(ws.receive_bytes())
+                if frame.kind == wire.FrameKind.credit:
+                    credit[frame.channel] += wire.decode_credit(frame.payload)
+                elif frame.kind == wire.FrameKind.json:
+                    complete[frame.channel] = TranscriptCompleteMessage.model_validate_json(bytes(frame.payload))
+                elif frame.kind == wire.FrameKind.close:
+                    closed.add(frame.channel)
+
+        assert credit[1] > 32000 and credit[2] > 32000  # initial window plus returned credit
+        assert [complete[1].stream_id, complete[2].stream_id] == ["a", "b"]
+        assert [s.text for s in complete[1].segments] == ["chunk@0.0", "chunk@0.5"]
+        assert not asr_app.sessions
+
+    def test_metrics_report_stream_latencies(self, asr_app):
+        from fastapi.testclient import TestClient
+        from prometheus_client import REGISTRY
+
+        def count(name, **labels):
+            return REGISTRY.get_sample_value(f"{name}_count", labels) or 0.0
+
+        before = count("asr_segment_latency_seconds", status="partial"), count("asr_chunk_queue_wait_seconds")
+        pcm = np.zeros(8000, dtype=np.int16).tobytes()  # one 0.5 s chunk
+        client = TestClient(asr_app.app)
+        with client.websocket_connect("/mux") as ws:
+            ws.send_bytes(self.start_frame(1, "m"))
+            ws.send_bytes(wire.encode_frame(wire.FrameKind.audio, 1, pcm))
+            ws.send_bytes(wire.encode_frame(wire.FrameKind.end, 1))
+            while wire.decode_frame(ws.receive_bytes()).kind != wire.FrameKind.close:
+                pass
+
+        after = count("asr_segment_latency_seconds", status="partial"), count("asr_chunk_queue_wait_seconds")
+        assert after == (before[0] + 1, before[1] + 1)
+        body = client.get("/metrics").text
+        assert "asr_segment_latency_seconds_bucket" in body
+        assert "asr_realtime_factor_bucket" in body
+
+    def test_close_frame_drops_session(self, asr_app):
+        from fastapi.testclient import TestClient
+
+        with TestClient(asr_app.app).websocket_connect("/mux") as ws:
+            ws.send_bytes(self.start_frame(7, "gone"))
+            assert wire.decode_frame(ws.receive_bytes()).kind == wire.FrameKind.credit
+            assert "gone" in asr_app.sessions
+            ws.send_bytes(wire.encode_frame(wire.FrameKind.close, 7))
+            assert wire.decode_frame(ws.receive_bytes()).kind == wire.FrameKind.close
+        assert "gone" not in asr_app.sessions
+
+    def test_audio_beyond_credit_ends_the_channel(self, asr_app):
+        from fastapi.testclient import TestClient
+
+        with TestClient(asr_app.app).websocket_connect("/mux") as ws:
+            ws.send_bytes(self.start_frame(1, "greedy"))
+            frame = wire.decode_frame(ws.receive_bytes())
+            assert wire.decode_credit(frame.payload) == 32000
+            ws.send_bytes(wire.encode_frame(wire.FrameKind.audio, 1, bytes(32002)))
+
+            while (frame := wire.decode_frame(ws.receive_bytes())).kind != wire.FrameKind.json:
+                pass
+            assert "exceeds credit of 32000" in bytes(frame.payload).decode()
+            while wire.decode_frame(ws.receive_bytes()).kind != wire.FrameKind.close:
+                pass
+        assert not asr_app.sessions
+
+    def test_bad_frames_end_only_their_channel(self, asr_app):
+        from fastapi.testclient import TestClient
+
+        def frames(ws, count):
+            return [wire.decode_frame(ws.receive_bytes()) for _ in range(count)]
+
+        with TestClient(asr_app.app).websocket_connect("/mux") as ws:
+            ws.send_bytes(self.start_frame(1, "ok"))
+            assert frames(ws, 1)[0].kind == wire.FrameKind.credit
+
+            ws.send_bytes(wire.encode_frame(wire.FrameKind.start, 2, b"{not json"))
+            error, close = frames(ws, 2)
+            assert (error.channel, error.kind, close.channel, close.kind) == (2, wire.FrameKind.json, 2, wire.FrameKind.close)
+            assert "Invalid start" in bytes(error.payload).decode()
+
+            ws.send_bytes(wire.HEADER.pack(wire.WIRE_VERSION, 99, 3))
+            assert [(f.channel, f.kind) for f in frames(ws, 2)] == [(3, wire.FrameKind.json), (3, wire.FrameKind.close)]
+            ws.send_bytes(b"\x01")  # no header: nothing to answer on
+            assert "ok" in asr_app.sessions
+
+            ws.send_bytes(self.start_frame(1, "again"))
+            error, close = frames(ws, 2)
+            assert "already open" in bytes(error.payload).decode()
+            assert close.kind == wire.FrameKind.close and close.channel == 1
+        assert not asr_app.sessions
@@ -1,6 +1,25 @@
+import asyncio
+import json
+import shutil
+import time
+
+import httpx
+import numpy as np
 import pytest
-from gateway.audio_utils import normalize_audio, _ffmpeg_format
+from gateway.audio_utils import (
+    FfmpegTranscoder,
+    PcmTranscoder,
+    PolyphaseResampler,
+    create_transcoder,
+    normalize_audio,
+    _ffmpeg_format,
+)
+from common import wire
+from common.schemas import ErrorMessage, SegmentMessage, SegmentStatus, StartMessage, TranscriptSegment
+from gateway import upstream
+from gateway.channels import AudioClock, MuxConnection, MuxStream
 from gateway.session import SessionManager
+from gateway.upstream import AsrPool, health_url_for
 
 
 class TestAudioUtils:
@@ -15,6 +34,83 @@ class TestAudioUtils:
         assert _ffmpeg_format("unknown") == "s16le"
 
 
+class TestPolyphaseResampler:
+    @pytest.mark.parametrize("rate", [48000, 44100, 8000])
+    def test_sine_survives_resampling(self, rate):
+        t = np.arange(rate) / rate
+        resampler = PolyphaseResampler(rate)
+        out = resampler.process(np.sin(2 * np.pi * 440 * t).astype(np.float32))
+        assert len(out) == 16000
+        expected = np.sin(2 * np.pi * 440 * (np.arange(16000) / 16000 - resampler.delay_seconds))
+        error = out[1000:-1000] - expected[1000:-1000]
+        assert np.sqrt(np.mean(error ** 2)) < 0.01
+
+    def test_frame_boundaries_are_seamless(self):
+        rng = np.random.default_rng(0)
+        audio = rng.standard_normal(44100).astype(np.float32)
+        whole = PolyphaseResampler(44100).process(audio)
+        resampler = PolyphaseResampler(44100)
+        framed = np.concatenate([resampler.process(audio[i:i + 882]) for i in range(0, 44100, 882)])
+        np.testing.assert_allclose(framed, whole, atol=1e-5)
+
+    def test_aliasing_suppressed(self):
+        t = np.arange(48000) / 48000
+        # 12 kHz is above the 8 kHz output Nyquist and must not fold back
+        out = PolyphaseResampler(48000).process(np.sin(2 * np.pi * 12000 * t).astype(np.float32))
+        assert np.sqrt(np.mean(out[1000:-1000] ** 2)) < 0.01
+
+
+class TestPcmTranscoder:
+    def test_stereo_downmix(self):
+        stereo = np.array([[1000, 3000], [-2000, -4000]], dtype=np.int16).tobytes()
+        out = PcmTranscoder(16000, 2, "pcm_s16le").convert(stereo)
+        np.testing.assert_array_equal(np.frombuffer(out, dtype=np.int16), [2000, -3000])
+
+    def test_f32_to_s16(self):
+        f32 = np.array([0.0, 0.5, -1.0, 2.0], dtype=np.float32).tobytes()
+        out = PcmTranscoder(16000, 1, "pcm_f32le").convert(f32)
+        np.testing.assert_array_equal(np.frombuffer(out, dtype=np.int16), [0, 16384, -32768, 32767])
+
+    def test_partial_frames_carried_over(self):
+        transcoder = PcmTranscoder(16000, 2, "pcm_s16le")
+        data = np.arange(8, dtype=np.int16).tobytes()
+        out = transcoder.convert(data[:5]) + transcoder.convert(data[5:])
+        np.testing.assert_array_equal(np.frombuffer(out, dtype=np.int16), [0, 2, 4, 6])
+
+    def test_resampled_frames_keep_length(self):
+        transcoder = PcmTranscoder(48000, 1, "pcm_s16le")
+        frame = np.zeros(960, dtype=np.int16).tobytes()  # 20 ms
+        total = sum(len(transcoder.convert(frame)) for _ in range(50))
+        assert abs(total // 2 - 16000) <= 1
+
+    @pytest.mark.asyncio
+    async def test_pcm_encodings_stay_in_process(self):
+        async def sink(data):
+            pass
+
+        assert isinstance(await create_transcoder(48000, 2, "pcm_f32le", sink), PcmTranscoder)
+        passthrough = await create_transcoder(16000, 1, "pcm_s16le", sink, pcm_backend="ffmpeg")
+        assert isinstance(passthrough, PcmTranscoder)
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+class TestFfmpegTranscoder:
+    @pytest.mark.asyncio
+    async def test_streams_through_one_process(self):
+        received = []
+
+        async def sink(data):
+            received.append(data)
+
+        transcoder = FfmpegTranscoder(8000, 1, "pcm_f32le", sink)
+        await transcoder.start()
+        frame = np.zeros(160, dtype=np.float32).tobytes()
+        for _ in range(50):
+            await transcoder.feed(frame)
+        await transcoder.close()
+        assert abs(sum(len(c) for c in received) // 2 - 16000) <= 32
+
+
 class TestSessionManager:
     @pytest.fixture
     def manager(self):
@@ -41,3 +137,555 @@ class TestSessionManager:
         await manager.create("s1", client_ws=None)
         with pytest.raises(RuntimeError, match="already exists"):
             await manager.create("s1", client_ws=None)
+
+
+class TestAdmissionQueue:
+    @pytest.mark.asyncio
+    async def test_waits_for_free_slot(self):
+        manager = SessionManager(max_sessions=1, max_queue=2, poll_interval_s=0.01)
+        await manager.create("s1", client_ws=None)
+        positions = []
+
+        async def on_queued(position):
+            positions.append(position)
+
+        waiting = asyncio.create_task(manager.create("s2", client_ws=None, on_queued=on_queued))
+        await asyncio.sleep(0.02)
+        assert manager.queued_count == 1
+        assert positions == [1]
+        await manager.remove("s1")
+        session = await asyncio.wait_for(waiting, timeout=1.0)
+        assert session.stream_id == "s2"
+        assert manager.active_count == 1
+
+    @pytest.mark.asyncio
+    async def test_queue_full_rejected(self):
+        manager = SessionManager(max_sessions=1, max_queue=1, poll_interval_s=0.01)
+        await manager.create("s1", client_ws=None)
+        waiting = asyncio.create_task(manager.create("s2", client_ws=None))
+        await asyncio.sleep(0.01)
+        with pytest.raises(RuntimeError, match="queue full"):
+            await manager.create("s3", client_ws=None)
+        waiting.cancel()
+
+    @pytest.mark.asyncio
+    async def test_wait_times_out(self):
+        manager = SessionManager(max_sessions=1, max_queue=1, queue_timeout_s=0.05, poll_interval_s=0.01)
+        await manager.create("s1", client_ws=None)
+        with pytest.raises(RuntimeError, match="Timed out"):
+            await manager.create("s2", client_ws=None)
+        assert manager.queued_count == 0
+
+    @pytest.mark.asyncio
+    async def test_fair_share_between_tenants(self):
+        manager = SessionManager(max_sessions=2, max_queue=4, poll_interval_s=0.01)
+        await manager.create("a1", client_ws=None, tenant="a")
+        await manager.create("a2", client_ws=None, tenant="a")
+        a3 = asyncio.create_task(manager.create("a3", client_ws=None, tenant="a"))
+        await asyncio.sleep(0.01)
+        b1 = asyncio.create_task(manager.create("b1", client_ws=None, tenant="b"))
+        await asyncio.sleep(0.01)
+        # Tenant b has nothing running, so it goes first despite arriving later
+        await manager.remove("a1")
+        await asyncio.wait_for(b1, timeout=1.0)
+        assert not a3.done()
+        await manager.remove("a2")
+        await asyncio.wait_for(a3, timeout=1.0)
+
+    @pytest.mark.asyncio
+    async def test_capacity_signal_gates_admission(self):
+        capacity = {"ok": False}
+        manager = SessionManager(
+            max_sessions=10, max_queue=2, poll_interval_s=0.01, has_capacity=lambda: capacity["ok"]
+        )
+        waiting = asyncio.create_task(manager.create("s1", client_ws=None))
+        await asyncio.sleep(0.03)
+        assert not waiting.done()
+        capacity["ok"] = True
+        await asyncio.wait_for(waiting, timeout=1.0)
+
+
+    @pytest.mark.asyncio
+    async def test_disconnected_waiters_are_dropped(self):
+        from fastapi.websockets import WebSocketState
+
+        class FakeClient:
+            client_state = application_state = WebSocketState.CONNECTED
+
+        manager = SessionManager(max_sessions=1, max_queue=1, poll_interval_s=0.01)
+        await manager.create("s1", client_ws=None)
+        client = FakeClient()
+        waiting = asyncio.create_task(manager.create("s2", client_ws=client))
+        await asyncio.sleep(0.02)
+        client.client_state = WebSocketState.DISCONNECTED
+        with pytest.raises(RuntimeError, match="disconnected"):
+            await asyncio.wait_for(waiting, timeout=1.0)
+        assert manager.queued_count == 0
+        await manager.remove("s1")
+        assert manager.active_count == 0
+
+    @pytest.mark.asyncio
+    async def test_client_disconnect_while_queued_frees_the_place(self, monkeypatch):
+        from collections import deque
+
+        from fastapi import WebSocketDisconnect
+        import gateway.main as gateway_main
+
+        class FakeClient:
+            def __init__(self, messages):
+                self.messages = asyncio.Queue()
+                for message in messages:
+                    self.messages.put_nowait(message)
+
+            async def receive(self):
+                return await self.messages.get()
+
+        manager = SessionManager(max_sessions=1, max_queue=2, poll_interval_s=0.01)
+        monkeypatch.setattr(gateway_main, "manager", manager)
+        await manager.create("s1", client_ws=None)
+
+        held = deque()
+        gone = FakeClient([{"type": "websocket.receive", "bytes": b"\0" * 320}])
+        admit = asyncio.create_task(gateway_main._admit(gone, held, stream_id="s2", client_ws=None))
+        await asyncio.sleep(0.02)
+        assert manager.queued_count == 1
+        gone.messages.put_nowait({"type": "websocket.disconnect"})
+        with pytest.raises(WebSocketDisconnect):
+            await asyncio.wait_for(admit, timeout=1.0)
+        assert manager.queued_count == 0
+
+        # Audio sent while queued is held for the main loop
+        held = deque()
+        live = FakeClient([{"type": "websocket.receive", "bytes": b"\1" * 320}])
+        admit = asyncio.create_task(gateway_main._admit(live, held, stream_id="s3", client_ws=None))
+        await asyncio.sleep(0.02)
+        await manager.remove("s1")
+        assert (await asyncio.wait_for(admit, timeout=1.0)).stream_id == "s3"
+        assert [m["bytes"] for m in held] == [b"\1" * 320]
+
+
+class TestAudioEndpoint:
+    @pytest.mark.parametrize("fail", ["start", "transcoder"])
+    def test_upstream_closed_when_setup_fails(self, monkeypatch, fail):
+        from fastapi.testclient import TestClient
+        import gateway.main as gateway_main
+
+        class Upstream:
+            closed = False
+
+            async def start(self, start):
+                if fail == "start":
+                    raise ConnectionError("start not sent")
+
+            async def send_audio(self, pcm):
+                pass
+
+            async def close(self):
+                self.closed = True
+
+        upstream_handle = Upstream()
+
+        async def open_stream(stream_id, binary=True):
+            return None, upstream_handle
+
+        async def no_ffmpeg(*args, **kwargs):
+            raise FileNotFoundError("ffmpeg")
+
+        manager = SessionManager(max_sessions=1)
+        monkeypatch.setattr(gateway_main, "manager", manager)
+        monkeypatch.setattr(gateway_main.pool, "open_stream", open_stream)
+        if fail == "transcoder":
+            monkeypatch.setattr(gateway_main, "create_transcoder", no_ffmpeg)
+        with TestClient(gateway_main.app).websocket_connect("/audio") as ws:
+            ws.send_text(StartMessage(stream_id="s1").model_dump_json())
+            for _ in range(100):
+                if upstream_handle.closed:
+                    break
+                time.sleep(0.01)
+        assert upstream_handle.closed
+        assert manager.active_count == 0
+
+    def test_mux_channel_released_when_setup_fails(self, monkeypatch):
+        from fastapi.testclient import TestClient
+        import gateway.main as gateway_main
+
+        opened = {}
+
+        async def open_stream(stream_id, binary=True):
+            conn = opened["conn"] = MuxConnection(FakeMuxSocket())
+            return None, conn.open_stream(stream_id)
+
+        async def no_ffmpeg(*args, **kwargs):
+            raise FileNotFoundError("ffmpeg")
+
+        monkeypatch.setattr(gateway_main, "manager", SessionManager(max_sessions=1))
+        monkeypatch.setattr(gateway_main.pool, "open_stream", open_stream)
+        monkeypatch.setattr(gateway_main, "create_transcoder", no_ffmpeg)
+        with TestClient(gateway_main.app).websocket_connect("/audio") as ws:
+            ws.send_text(StartMessage(stream_id="s1").model_dump_json())
+            for _ in range(100):
+                if "conn" in opened and not opened["conn"].streams:
+                    break
+                time.sleep(0.01)
+        conn = opened["conn"]
+        assert not conn.streams
+        kinds = [wire.decode_frame(frame).kind for frame in conn.ws.sent]
+        assert kinds == [wire.FrameKind.start, wire.FrameKind.close]
+
+
+class FakeUpstream:
+    def __init__(self, url):
+        self.url = url
+        self.open = True
+
+    async def close(self):
+        self.open = False
+
+
+class TestAsrPool:
+    URLS = ["ws://a:8001/stream", "ws://b:8001/stream"]
+
+    @pytest.fixture
+    def connects(self, monkeypatch):
+        opened = []
+
+        async def fake_connect(url, **kwargs):
+            if "down" in url:
+                raise OSError("refused")
+            opened.append(url)
+            return FakeUpstream(url)
+
+        monkeypatch.setattr(upstream.websockets, "connect", fake_connect)
+        return opened
+
+    @pytest.mark.asyncio
+    async def test_stop_cancels_pending_refills(self, monkeypatch):
+        sockets = []
+        release = asyncio.Event()
+
+        async def connect(url, **kwargs):
+            if sockets:
+                await release.wait()  # the refill hangs in its handshake
+            sockets.append(FakeUpstream(url))
+            return sockets[-1]
+
+        monkeypatch.setattr(upstream.websockets, "connect", connect)
+        pool = AsrPool(self.URLS[:1], warm_connections=1)
+        await pool._fill_warm(pool.backends[0])
+        await pool.acquire()
+        await asyncio.sleep(0)
+        assert len(pool._refills) == 1
+        await pool.stop()
+        assert not pool._refills
+        release.set()
+        await asyncio.sleep(0.01)
+        assert len(sockets) == 1 and not pool.backends[0].warm
+
+    def test_health_url(self):
+        assert health_url_for("ws://asr:8001/stream") == "http://asr:8001/health"
+        assert health_url_for("wss://asr.example.com/stream") == "https://asr.example.com/health"
+
+    @pytest.mark.asyncio
+    async def test_health_check_reads_queue_depth(self, connects):
+        def handler(request):
+            if request.url.host == "a":
+                return httpx.Response(200, json={"status": "ok", "inference": {"queue_depth": 7}})
+            return httpx.Response(503)
+
+        pool = AsrPool(self.URLS, warm_connections=1)
+        pool._http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        await pool.check_health()
+        a, b = pool.backends
+        assert (a.healthy, a.queue_depth, len(a.warm)) == (True, 7, 1)
+        assert (b.healthy, len(b.warm)) == (False, 0)
+        await pool.stop()
+
+    @pytest.mark.asyncio
+    async def test_no_warm_connections_to_mux_backends(self, connects):
+        def handler(request):
+            formats = ["json", "binary", "mux"] if request.url.host == "a" else ["json"]
+            return httpx.Response(200, json={"status": "ok", "wire_formats": formats})
+
+        pool = AsrPool(self.URLS, warm_connections=1, mux_connections=1)
+        stale = FakeUpstream(self.URLS[0])
+        pool.backends[0].warm.append(stale)
+        pool._http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        await pool.check_health()
+        a, b = pool.backends
+        assert (len(a.warm), stale.open) == (0, False)
+        assert len(b.warm) == 1 and connects == [self.URLS[1]]
+        await pool.stop()
+
+    @pytest.mark.asyncio
+    async def test_backend_not_ready_is_unhealthy(self, connects):
+        def handler(request):
+            return httpx.Response(200, json={"status": "ok", "ready": request.url.host == "b"})
+
+        pool = AsrPool(self.URLS, warm_connections=0)
+        pool._http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        await pool.check_health()
+        assert [b.healthy for b in pool.backends] == [False, True]
+
+    @pytest.mark.asyncio
+    async def test_acquire_uses_least_loaded_and_warm_connection(self, connects):
+        pool = AsrPool(self.URLS, warm_connections=1)
+        pool.backends[0].queue_depth = 3
+        warm = FakeUpstream(self.URLS[1])
+        pool.backends[1].warm.append(warm)
+
+        backend, ws = await pool.acquire()
+        assert backend.ws_url == self.URLS[1]
+        assert ws is warm
+        assert backend.active_sessions == 1
+        pool.release(backend)
+        assert backend.active_sessions == 0
+
+    def test_has_capacity_uses_reported_load(self):
+        pool = AsrPool(self.URLS, max_queue_depth=4, max_audio_in_flight_s=30.0)
+        a, b = pool.backends
+        a.queue_depth, b.healthy = 4, False
+        assert not pool.has_capacity()
+        a.queue_depth, a.audio_in_flight_s = 0, 45.0
+        assert not pool.has_capacity()
+        a.audio_in_flight_s = 5.0
+        assert pool.has_capacity()
+
+    @pytest.mark.asyncio
+    async def test_acquire_skips_unreachable_backend(self, connects):
+        pool = AsrPool(["ws://down:8001/stream", "ws://b:8001/stream"], warm_connections=0)
+        backend, ws = await pool.acquire()
+        assert backend.ws_url == "ws://b:8001/stream"
+        assert not pool.backends[0].healthy
+
+    @pytest.mark.asyncio
+    async def test_acquire_fails_when_all_unreachable(self, connects):
+        pool = AsrPool(["ws://down:8001/stream"], warm_connections=0)
+        with pytest.raises(RuntimeError, match="No ASR backend"):
+            await pool.acquire()
+
+
+class TestWireProtocol:
+    def test_segment_roundtrip(self):
+        segment = TranscriptSegment(
+            status=SegmentStatus.partial, segment_id=7, start_time=1.25, end_time=3.5,
+            text="héllo wörld", speaker="SPEAKER_01", confidence=-0.2,
+        )
+        frame = wire.decode_frame(wire.encode_segment(42, segment))
+        assert (frame.kind, frame.channel) == (wire.FrameKind.segment, 42)
+        assert wire.decode_segment(frame.payload) == segment
+
+    def test_segment_without_speaker_or_confidence(self):
+        segment = TranscriptSegment(
+            status=SegmentStatus.final, segment_id=0, start_time=0.0, end_time=1.0, text="hi",
+        )
+        frame = wire.decode_frame(wire.encode_segment(0, segment))
+        assert wire.decode_segment(frame.payload) == segment
+
+    def test_frame_to_json_matches_schema_messages(self):
+        segment = TranscriptSegment(
+            status=SegmentStatus.final, segment_id=3, start_time=0.5, end_time=1.0, text="ok",
+        )
+        frame = wire.decode_frame(wire.encode_segment(0, segment))
+        expected = SegmentMessage(stream_id="s1", segment=segment)
+        assert SegmentMessage.model_validate_json(wire.frame_to_json(frame, "s1")) == expected
+
+        error = ErrorMessage(stream_id="s1", detail="boom")
+        frame = wire.decode_frame(wire.encode_frame(wire.FrameKind.json, 0, error.model_dump_json().encode()))
+        assert wire.frame_to_json(frame, "s1") == error.model_dump_json()
+
+    def test_audio_payload_is_zero_copy(self):
+        pcm = np.arange(160, dtype=np.int16).tobytes()
+        frame = wire.decode_frame(wire.encode_frame(wire.FrameKind.audio, 1, pcm))
+        assert isinstance(frame.payload, memoryview)
+        assert frame.payload.tobytes() == pcm
+
+    def test_rejects_bad_frames(self):
+        with pytest.raises(wire.WireError):
+            wire.decode_frame(b"\x01")
+        with pytest.raises(wire.WireError):
+            wire.decode_frame(bytes([99, 1, 0, 0, 0, 0]))
+
+    @pytest.mark.asyncio
+    async def test_health_check_reads_wire_formats(self, monkeypatch):
+        def handler(request):
+            formats = wire.WIRE_FORMATS if request.url.host == "a" else None
+            body = {"status": "ok"} if formats is None else {"status": "ok", "wire_formats": formats}
+            return httpx.Response(200, json=body)
+
+        pool = AsrPool(["ws://a:8001/stream", "ws://b:8001/stream"], warm_connections=0)
+        pool._http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        await pool.check_health()
+        assert [b["wire"] for b in pool.stats()] == ["binary", "json"]
+
+
+class FakeMuxSocket:
+    """Stands in for a websockets connection: records sends, yields queued frames."""
+
+    def __init__(self):
+        self.sent = []
+        self.incoming: asyncio.Queue = asyncio.Queue()
+
+    async def send(self, data):
+        self.sent.append(data)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        message = await self.incoming.get()
+        if message is None:
+            raise StopAsyncIteration
+        return message
+
+    async def close(self):
+        self.incoming.put_nowait(None)
+
+
+class TestMux:
+    def test_mux_url(self):
+        assert upstream.mux_url_for("ws://asr:8001/stream") == "ws://asr:8001/mux"
+
+    @pytest.mark.asyncio
+    async def test_audio_waits_for_credit(self):
+        sock = FakeMuxSocket()
+        conn = MuxConnection(sock)
+        stream = conn.open_stream("s1")
+        await stream.start(StartMessage(stream_id="s1"))
+
+        send = asyncio.create_task(stream.send_audio(b"\0" * 3200))
+        await asyncio.sleep(0.01)
+        assert not send.done()  # no credit granted yet
+        sock.incoming.put_nowait(wire.encode_credit(stream.channel, 3200))
+        await asyncio.wait_for(send, timeout=1.0)
+
+        kinds = [wire.decode_frame(frame).kind for frame in sock.sent]
+        assert kinds == [wire.FrameKind.start, wire.FrameKind.audio]
+        assert stream.credit == 0
+        await conn.close()
+
+    @pytest.mark.asyncio
+    async def test_audio_is_split_to_fit_credit(self):
+        sock = FakeMuxSocket()
+        conn = MuxConnection(sock)
+        stream = conn.open_stream("s1")
+        stream.credit = 1000
+
+        send = asyncio.create_task(stream.send_audio(b"\0" * 3200))
+        await asyncio.sleep(0.01)
+        assert not send.done()
+        sock.incoming.put_nowait(wire.encode_credit(stream.channel, 3200))
+        await asyncio.wait_for(send, timeout=1.0)
+
+        assert [len(wire.decode_frame(frame).payload) for frame in sock.sent] == [1000, 2200]
+        assert stream.credit == 1000
+        await conn.close()
+
+    @pytest.mark.asyncio
+    async def test_frames_are_routed_to_their_stream(self):
+        sock = FakeMuxSocket()
+        conn = MuxConnection(sock)
+        a, b = conn.open_stream("a"), conn.open_stream("b")
+        segment = TranscriptSegment(status=SegmentStatus.partial, segment_id=0, start_time=0.0, end_time=1.0, text="hi")
+        sock.incoming.put_nowait(wire.encode_segment(b.channel, segment))
+        sock.incoming.put_nowait(wire.encode_frame(wire.FrameKind.close, b.channel))
+
+        received = [json.loads(text) async for text in b]
+        assert received == [json.loads(SegmentMessage(stream_id="b", segment=segment).model_dump_json())]
+        assert not a.finished
+
+        await b.close()
+        assert b.channel not in conn.streams
+        await conn.close()
+
+    @pytest.mark.asyncio
+    async def test_segment_latency_and_relay_lag_recorded(self):
+        from prometheus_client import REGISTRY
+
+        def count(name, **labels):
+            return REGISTRY.get_sample_value(f"{name}_count", labels) or 0.0
+
+        before = count("gateway_segment_latency_seconds", status="final"), count("gateway_relay_lag_seconds")
+        sock = FakeMuxSocket()
+        conn = MuxConnection(sock)
+        stream = conn.open_stream("s")
+        stream.credit = 32000
+        await stream.send_audio(b"\0" * 32000)  # 1 s
+        segment = TranscriptSegment(status=SegmentStatus.final, segment_id=0, start_time=0.0, end_time=1.0, text="hi")
+        sock.incoming.put_nowait(wire.encode_segment(stream.channel, segment))
+        sock.incoming.put_nowait(wire.encode_frame(wire.FrameKind.close, stream.channel))
+        assert len([text async for text in stream]) == 1
+
+        after = count("gateway_segment_latency_seconds", status="final"), count("gateway_relay_lag_seconds")
+        assert after == (before[0] + 1, before[1] + 1)
+        await conn.close()
+
+    def test_audio_clock_matches_segment_end_to_send_time(self, monkeypatch):
+        now = [0.0]
+        monkeypatch.setattr("gateway.channels.time.monotonic", lambda: now[0])
+        clock = AudioClock(horizon_s=2.0)
+        for _ in range(50):  # 5 s in 0.1 s sends, one per 0.1 s
+            now[0] += 0.1
+            clock.sent(3200)
+        assert clock.latency(4.5) == pytest.approx(0.5)
+        assert clock.latency(0.5) is None  # trimmed past the horizon
+        assert clock.latency(9.0) == pytest.approx(0.0)  # ahead of the audio: timed from the last send
+
+    @pytest.mark.asyncio
+    async def test_bad_frames_are_skipped(self):
+        sock = FakeMuxSocket()
+        conn = MuxConnection(sock)
+        stream = conn.open_stream("a")
+        segment = TranscriptSegment(status=SegmentStatus.partial, segment_id=0, start_time=0.0, end_time=1.0, text="hi")
+        sock.incoming.put_nowait(b"\x01")
+        sock.incoming.put_nowait(wire.encode_frame(wire.FrameKind.segment, stream.channel, b"short"))
+        sock.incoming.put_nowait(wire.encode_segment(stream.channel, segment))
+        sock.incoming.put_nowait(wire.encode_frame(wire.FrameKind.close, stream.channel))
+        assert len([text async for text in stream]) == 1
+        assert conn.open
+        await conn.close()
+
+    @pytest.mark.asyncio
+    async def test_lost_connection_ends_streams(self):
+        sock = FakeMuxSocket()
+        conn = MuxConnection(sock)
+        stream = conn.open_stream("a")
+        sock.incoming.put_nowait(None)
+        assert [text async for text in stream] == []
+        with pytest.raises(RuntimeError, match="closed"):
+            await stream.send_audio(b"\0" * 320)
+        assert not conn.open
+
+    @pytest.mark.asyncio
+    async def test_pool_multiplexes_streams_over_shared_sockets(self, monkeypatch):
+        opened = []
+
+        async def fake_connect(url, **kwargs):
+            opened.append(url)
+            return FakeMuxSocket()
+
+        monkeypatch.setattr(upstream.websockets, "connect", fake_connect)
+        pool = AsrPool(["ws://a:8001/stream"], warm_connections=0, mux_connections=2)
+        pool.backends[0].mux = True
+        streams = [(await pool.open_stream(f"s{i}"))[1] for i in range(5)]
+        assert opened == ["ws://a:8001/mux"] * 2
+        assert all(isinstance(s, MuxStream) for s in streams)
+        assert pool.backends[0].active_sessions == 5
+        assert sorted(len(c.streams) for c in pool.backends[0].mux_connections) == [2, 3]
+        await pool.stop()
+
+    @pytest.mark.asyncio
+    async def test_concurrent_streams_open_at_most_the_mux_limit(self, monkeypatch):
+        opened = []
+
+        async def slow_connect(url, **kwargs):
+            opened.append(url)
+            await asyncio.sleep(0.01)
+            return FakeMuxSocket()
+
+        monkeypatch.setattr(upstream.websockets, "connect", slow_connect)
+        pool = AsrPool(["ws://a:8001/stream"], warm_connections=0, mux_connections=2)
+        pool.backends[0].mux = True
+        await asyncio.gather(*(pool.open_stream(f"s{i}") for i in range(6)))
+        assert len(opened) == 2
+        assert sorted(len(c.streams) for c in pool.backends[0].mux_connections) == [3, 3]
+        await pool.stop()
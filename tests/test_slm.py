@@ -1,7 +1,25 @@
+import asyncio
 import json
+import time
+
+import httpx
 import pytest
 
-from slm_service.prompts import SYSTEM_PROMPT, build_user_prompt, format_transcript
+import slm_service.analysis as analysis_module
+import slm_service.cache as cache_module
+from common.config import SLMSettings
+from slm_service.analysis import (
+    analyze_segments,
+    analyze_segments_stream,
+    group_summaries,
+    merge_results,
+    split_windows,
+)
+from slm_service.cache import ResultCache, cache_key
+from slm_service.json_stream import JsonStreamParser
+import slm_service.ollama_client as ollama_client
+from slm_service.ollama_client import OllamaPool
+from slm_service.prompts import REDUCE_SYSTEM_PROMPT, SYSTEM_PROMPT, build_user_prompt, format_transcript
 from common.schemas import (
     AnalyzeRequest,
     AnalyzeResponse,
@@ -67,3 +85,424 @@ class TestSchemas:
         )
         data = json.loads(resp.model_dump_json())
         assert data["risks"][0]["severity"] == "medium"
+
+
+def _mock_pool(handler, urls=("http://a", "http://b"), **kwargs) -> OllamaPool:
+    pool = OllamaPool(list(urls), **kwargs)
+    pool._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return pool
+
+
+class TestOllamaPool:
+    @pytest.mark.asyncio
+    async def test_routes_to_least_outstanding_backend(self):
+        release = asyncio.Event()
+        hosts = []
+
+        async def handler(request):
+            hosts.append(request.url.host)
+            await release.wait()
+            return httpx.Response(200, json={"message": {"content": "{}"}})
+
+        pool = _mock_pool(handler)
+        tasks = [asyncio.create_task(pool.post("/api/chat", {})) for _ in range(4)]
+        await asyncio.sleep(0.01)
+        assert sorted(hosts) == ["a", "a", "b", "b"]
+        release.set()
+        await asyncio.gather(*tasks)
+        assert [b["outstanding"] for b in pool.stats()] == [0, 0]
+        await pool.aclose()
+
+    @pytest.mark.asyncio
+    async def test_concurrency_limit_queues_requests(self):
+        in_flight = peak = 0
+
+        async def handler(request):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return httpx.Response(200, json={})
+
+        pool = _mock_pool(handler, urls=("http://a",), max_concurrency=2)
+        await asyncio.gather(*(pool.post("/api/chat", {}) for _ in range(6)))
+        assert peak == 2
+        assert pool.stats()[0]["requests"] == 6
+        await pool.aclose()
+
+    @pytest.mark.asyncio
+    async def test_unreachable_backend_fails_over(self):
+        def handler(request):
+            if request.url.host == "a":
+                raise httpx.ConnectError("refused", request=request)
+            return httpx.Response(200, json={})
+
+        pool = _mock_pool(handler)
+        for _ in range(3):
+            await pool.post("/api/chat", {})
+        a, b = pool.stats()
+        assert a["failures"] == 1 and not a["available"]
+        assert b["requests"] == 3
+        await pool.aclose()
+
+    @pytest.mark.asyncio
+    async def test_chat_stream_yields_content_and_frees_slot(self, monkeypatch):
+        lines = [{"message": {"content": piece}, "done": False} for piece in ('{"summary"', ': "hi"}')]
+        lines.append({"message": {"content": ""}, "done": True})
+
+        def handler(request):
+            assert json.loads(request.content)["stream"] is True
+            return httpx.Response(200, text="\n".join(json.dumps(line) for line in lines))
+
+        pool = _mock_pool(handler, urls=("http://a",))
+        monkeypatch.setattr(ollama_client, "_pool", pool)
+        pieces = [p async for p in ollama_client.chat_completion_stream([], SLMSettings())]
+        assert "".join(pieces) == '{"summary": "hi"}'
+        assert pool.stats()[0]["outstanding"] == 0
+        await pool.aclose()
+
+    @pytest.mark.asyncio
+    async def test_generation_metrics_use_ollama_eval_counts(self, monkeypatch):
+        from prometheus_client import REGISTRY
+
+        def handler(request):
+            return httpx.Response(
+                200, json={"message": {"content": "{}"}, "eval_count": 50, "eval_duration": 2_000_000_000}
+            )
+
+        def sample(name, **labels):
+            return REGISTRY.get_sample_value(name, labels) or 0.0
+
+        pool = _mock_pool(handler, urls=("http://a",))
+        monkeypatch.setattr(ollama_client, "_pool", pool)
+        before = sample("slm_generation_seconds_count", mode="complete"), sample("slm_tokens_per_second_sum")
+        await ollama_client.chat_completion([], SLMSettings())
+        after = sample("slm_generation_seconds_count", mode="complete"), sample("slm_tokens_per_second_sum")
+        assert after == (before[0] + 1, before[1] + 25.0)
+        await pool.aclose()
+
+    @pytest.mark.asyncio
+    async def test_all_backends_unreachable_raises(self):
+        def handler(request):
+            raise httpx.ConnectError("refused", request=request)
+
+        pool = _mock_pool(handler)
+        with pytest.raises(httpx.ConnectError):
+            await pool.post("/api/chat", {})
+        await pool.aclose()
+
+
+def _seg(speaker: str, text: str, start: float = 0.0) -> dict:
+    return {"start_time": start, "speaker": speaker, "text": text}
+
+
+class TestMapReduce:
+    def test_windows_break_at_speaker_turns(self):
+        segments = [_seg("A", "x" * 40), _seg("A", "y" * 40), _seg("B", "z" * 40), _seg("B", "w" * 40)]
+        windows = split_windows(segments, max_tokens=50)
+        assert [[s["speaker"] for s in w] for w in windows] == [["A", "A"], ["B", "B"]]
+
+    def test_long_turn_splits_between_segments(self):
+        segments = [_seg("A", "x" * 100) for _ in range(4)]
+        windows = split_windows(segments, max_tokens=60)
+        assert [len(w) for w in windows] == [2, 2]
+
+    def test_merge_dedupes_and_keeps_highest_severity(self):
+        merged = merge_results([
+            {
+                "key_points": ["Budget approved."],
+                "action_items": ["Alice to send notes"],
+                "risks": [{"category": "HR Policy", "description": "Overtime", "severity": "low"}],
+            },
+            {
+                "key_points": ["budget approved", "Launch moved"],
+                "action_items": ["Alice to send notes."],
+                "risks": [{"category": "hr policy", "description": "overtime", "severity": "high"}],
+            },
+        ])
+        assert merged["key_points"] == ["Budget approved.", "Launch moved"]
+        assert merged["action_items"] == ["Alice to send notes"]
+        assert merged["risks"] == [{"category": "hr policy", "description": "overtime", "severity": "high"}]
+
+    def test_merge_tolerates_null_and_non_string_risk_fields(self):
+        merged = merge_results([
+            {"risks": [{"category": None, "description": 42, "severity": "low"}, "not a risk"]},
+            {"risks": [{"description": "42", "severity": "medium"}]},
+        ])
+        assert merged["risks"] == [{"description": "42", "severity": "medium"}]
+
+    def test_summaries_grouped_to_budget(self):
+        summaries = ["x" * 60] * 5  # 16 tokens each, plus the part header
+        assert [len(g) for g in group_summaries(summaries, 40)] == [2, 2, 1]
+        assert [len(g) for g in group_summaries(["x" * 400] * 3, 40)] == [2, 1]  # always pairs up
+        assert group_summaries(summaries, 0) == [summaries]
+
+    @pytest.mark.asyncio
+    async def test_many_summaries_are_reduced_hierarchically(self, monkeypatch):
+        reduce_parts = []
+
+        async def fake_chat(messages, settings=None):
+            if messages[0]["content"] == REDUCE_SYSTEM_PROMPT:
+                reduce_parts.append(messages[1]["content"].count("Part "))
+            return json.dumps({"summary": "s" * 60, "key_points": [], "action_items": [], "risks": []})
+
+        monkeypatch.setattr(analysis_module, "chat_completion", fake_chat)
+        segments = [_seg(f"S{i % 2}", "word " * 20, start=i) for i in range(6)]
+        await analyze_segments(segments, MeetingContext(), SLMSettings(analysis_window_tokens=40))
+        # 6 summaries -> 3 -> 2 (one passed through) -> final
+        assert reduce_parts == [2, 2, 2, 2, 2]
+
+    @pytest.mark.asyncio
+    async def test_long_transcript_is_map_reduced(self, monkeypatch):
+        calls = []
+        in_flight = peak = 0
+
+        async def fake_chat(messages, settings=None):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            calls.append(messages)
+            if messages[0]["content"] == REDUCE_SYSTEM_PROMPT:
+                return json.dumps({"summary": "whole meeting"})
+            return json.dumps({"summary": "part", "key_points": ["same point"], "action_items": [], "risks": []})
+
+        monkeypatch.setattr(analysis_module, "chat_completion", fake_chat)
+        settings = SLMSettings(analysis_window_tokens=30, analysis_concurrency=2)
+        segments = [_seg(f"S{i % 2}", "word " * 20, start=i) for i in range(6)]
+        result = await analyze_segments(segments, MeetingContext(), settings)
+
+        assert len(calls) == 7  # six windows + one reduce
+        assert peak == 2
+        assert result["summary"] == "whole meeting"
+        assert result["key_points"] == ["same point"]
+        assert "part 1 of 6" in calls[0][1]["content"]
+
+    @pytest.mark.asyncio
+    async def test_short_transcript_uses_single_prompt(self, monkeypatch):
+        calls = []
+
+        async def fake_chat(messages, settings=None):
+            calls.append(messages)
+            return json.dumps({"summary": "short", "key_points": [], "action_items": [], "risks": []})
+
+        monkeypatch.setattr(analysis_module, "chat_completion", fake_chat)
+        result = await analyze_segments([_seg("A", "hello")], MeetingContext(), SLMSettings())
+        assert len(calls) == 1
+        assert result["summary"] == "short"
+
+
+class TestResultCache:
+    def _segments(self, **overrides) -> list[dict]:
+        seg = {"status": "final", "segment_id": 3, "start_time": 1.23, "speaker": "A", "text": "Hello  there"}
+        seg.update(overrides)
+        return [seg]
+
+    def test_key_ignores_ids_and_whitespace(self):
+        settings = SLMSettings()
+        key = cache_key(self._segments(), MeetingContext(), settings)
+        assert key == cache_key(self._segments(segment_id=9, text="Hello there"), MeetingContext(), settings)
+        assert key != cache_key(self._segments(text="Goodbye"), MeetingContext(), settings)
+        assert key != cache_key(self._segments(), MeetingContext(meeting_type="standup"), settings)
+        assert key != cache_key(self._segments(), MeetingContext(), SLMSettings(model_name="other"))
+
+    @pytest.mark.asyncio
+    async def test_concurrent_identical_requests_share_one_generation(self):
+        cache = ResultCache()
+        calls = 0
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return {"summary": "s"}
+
+        results = await asyncio.gather(*(cache.get_or_compute("k", compute) for _ in range(5)))
+        assert calls == 1
+        assert all(r == {"summary": "s"} for r in results)
+        assert await cache.get_or_compute("k", compute) == {"summary": "s"}
+        stats = cache.stats()
+        assert (stats["misses"], stats["coalesced"], stats["memory_hits"]) == (1, 4, 1)
+
+    @pytest.mark.asyncio
+    async def test_failures_are_not_cached(self):
+        cache = ResultCache()
+
+        async def fail():
+            raise RuntimeError("ollama down")
+
+        async def succeed():
+            return {"summary": "ok"}
+
+        with pytest.raises(RuntimeError):
+            await cache.get_or_compute("k", fail)
+        assert await cache.get_or_compute("k", succeed) == {"summary": "ok"}
+
+    @pytest.mark.asyncio
+    async def test_disk_tier_survives_restart_and_expires(self, tmp_path, monkeypatch):
+        path = str(tmp_path / "cache.sqlite")
+        first = ResultCache(path=path)
+        await first.get_or_compute("k", lambda: asyncio.sleep(0, {"summary": "s"}))
+        first.close()
+
+        second = ResultCache(path=path)
+
+        async def unexpected():
+            raise AssertionError("should have been cached")
+
+        assert await second.get_or_compute("k", unexpected) == {"summary": "s"}
+        assert second.stats()["disk_hits"] == 1
+        second.close()
+
+        later = time.time() + 2 * 86400
+        monkeypatch.setattr(cache_module.time, "time", lambda: later)
+        third = ResultCache(path=path)
+        assert await third.get_or_compute("k", lambda: asyncio.sleep(0, {"summary": "new"})) == {"summary": "new"}
+        third.close()
+
+    def test_invalid_analysis_is_not_cached(self, monkeypatch):
+        from fastapi.testclient import TestClient
+        import slm_service.main as slm_main
+
+        calls = 0
+
+        async def fake_analyze(segments, context, settings):
+            nonlocal calls
+            calls += 1
+            return {"summary": "s", "key_points": [], "action_items": [], "risks": [{"category": "x", "description": "y"}]}
+
+        monkeypatch.setattr(slm_main, "analyze_segments", fake_analyze)
+        body = AnalyzeRequest(
+            stream_id="s1",
+            segments=[TranscriptSegment(
+                status=SegmentStatus.final, segment_id=0, start_time=0.0, end_time=1.0,
+                text="invalid analysis test", speaker="A",
+            )],
+        ).model_dump(mode="json")
+        with TestClient(slm_main.app) as client:
+            statuses = [client.post("/analyze-transcript", json=body).status_code for _ in range(2)]
+        assert statuses == [502, 502]  # a risk without severity
+        assert calls == 2
+
+ANALYSIS_JSON = json.dumps({
+    "summary": "Budget review.",
+    "key_points": ["Budget approved", "Launch moved"],
+    "action_items": ["Alice to send notes"],
+    "risks": [{"category": "HR Policy", "description": "Overtime", "severity": "low"}],
+})
+
+
+def _fake_stream(text: str, piece: int = 7, progress: list | None = None):
+    async def stream(messages, settings=None):
+        for i in range(0, len(text), piece):
+            if progress is not None:
+                progress.append(i)
+            yield text[i:i + piece]
+    return stream
+
+
+class TestStreamingAnalysis:
+    def test_parser_reports_values_as_they_complete(self):
+        parser = JsonStreamParser()
+        assert parser.feed('{"summary": "a \\"quoted\\" }", "key_points": ["one", ') == [
+            (("summary",), 'a "quoted" }'),
+            (("key_points", 0), "one"),
+        ]
+        events = parser.feed('"two"], "n": 3}')
+        assert events[0] == (("key_points", 1), "two")
+        assert (("n",), 3) in events
+        assert parser.done and events[-1][0] == ()
+
+    @pytest.mark.asyncio
+    async def test_items_stream_before_generation_finishes(self, monkeypatch):
+        progress = []
+        monkeypatch.setattr(analysis_module, "chat_completion_stream", _fake_stream(ANALYSIS_JSON, progress=progress))
+        seen = []
+        async for event, value in analyze_segments_stream([_seg("A", "hi")], MeetingContext(), SLMSettings()):
+            seen.append((event, progress[-1]))
+            if event == "result":
+                assert value == json.loads(ANALYSIS_JSON)
+        assert [e for e, _ in seen] == ["summary", "key_point", "key_point", "action_item", "risk", "result"]
+        assert seen[0][1] < len(ANALYSIS_JSON) // 2  # summary arrived early in the generation
+
+    @pytest.mark.asyncio
+    async def test_truncated_stream_raises(self, monkeypatch):
+        monkeypatch.setattr(analysis_module, "chat_completion_stream", _fake_stream(ANALYSIS_JSON[:40]))
+        with pytest.raises(json.JSONDecodeError):
+            async for _ in analyze_segments_stream([_seg("A", "hi")], MeetingContext(), SLMSettings()):
+                pass
+
+    @pytest.mark.asyncio
+    async def test_map_reduce_stream_skips_duplicate_items(self, monkeypatch):
+        async def stream(messages, settings=None):
+            if messages[0]["content"] == REDUCE_SYSTEM_PROMPT:
+                yield json.dumps({"summary": "whole"})
+            else:
+                yield ANALYSIS_JSON
+
+        monkeypatch.setattr(analysis_module, "chat_completion_stream", stream)
+        segments = [_seg(f"S{i % 2}", "word " * 20, start=i) for i in range(3)]
+        events = [
+            item async for item in analyze_segments_stream(
+                segments, MeetingContext(), SLMSettings(analysis_window_tokens=30)
+            )
+        ]
+        kinds = [e for e, _ in events]
+        assert kinds.count("key_point") == 2 and kinds.count("risk") == 1
+        assert events[-2] == ("summary", "whole")
+        assert events[-1][1]["summary"] == "whole"
+
+    def test_endpoint_streams_ndjson_and_replays_from_cache(self, monkeypatch):
+        from fastapi.testclient import TestClient
+        import slm_service.main as slm_main
+
+        monkeypatch.setattr(analysis_module, "chat_completion_stream", _fake_stream(ANALYSIS_JSON))
+        body = AnalyzeRequest(
+            stream_id="s1",
+            segments=[TranscriptSegment(
+                status=SegmentStatus.final, segment_id=0, start_time=0.0, end_time=1.0,
+                text="streaming endpoint test", speaker="A",
+            )],
+        ).model_dump(mode="json")
+        with TestClient(slm_main.app) as client:
+            runs = []
+            for _ in range(2):
+                resp = client.post("/analyze-transcript/stream", json=body)
+                runs.append([json.loads(line) for line in resp.text.splitlines()])
+        fresh, cached = runs
+        assert [e["type"] for e in fresh] == [
+            "summary", "key_point", "key_point", "action_item", "risk", "complete",
+        ]
+        assert fresh[-1]["result"]["risks"][0]["severity"] == "low"
+        assert cached == fresh
+
+    def test_endpoint_stores_only_valid_results(self, monkeypatch):
+        from fastapi.testclient import TestClient
+        import slm_service.main as slm_main
+
+        def body(text: str) -> dict:
+            return AnalyzeRequest(
+                stream_id="s1",
+                segments=[TranscriptSegment(
+                    status=SegmentStatus.final, segment_id=0, start_time=0.0, end_time=1.0, text=text, speaker="A",
+                )],
+            ).model_dump(mode="json")
+
+        bad_risk = json.dumps({
+            "summary": "s", "key_points": [], "action_items": [],
+            "risks": [{"category": "c", "description": "d"}, {"category": "c", "description": "e", "severity": "high"}],
+        })
+        monkeypatch.setattr(analysis_module, "chat_completion_stream", _fake_stream(bad_risk))
+        with TestClient(slm_main.app) as client:
+            events = [json.loads(line) for line in client.post("/analyze-transcript/stream", json=body("bad risk")).text.splitlines()]
+            assert [r["description"] for r in events[-1]["result"]["risks"]] == ["e"]
+            resp = client.post("/analyze-transcript", json=body("bad risk"))
+            assert resp.status_code == 200 and len(resp.json()["risks"]) == 1
+
+            monkeypatch.setattr(analysis_module, "chat_completion_stream", _fake_stream("[1, 2]"))
+            events = [json.loads(line) for line in client.post("/analyze-transcript/stream", json=body("array")).text.splitlines()]
+        assert events[-1]["type"] == "error"
+        key = slm_main.cache_key([TranscriptSegment.model_validate(body("array")["segments"][0]).model_dump()], MeetingContext(), slm_main.settings)
+        assert asyncio.run(slm_main.cache.lookup(key)) is None